@@ -15,6 +15,16 @@ from datetime import datetime, timedelta
 import pytz
 import traceback
 from shared.api import api  # Import the API singleton
+from shared.user_cache import UserCache
+from shared.dedupe import ExpiringSet
+from shared.dispatcher import MessageRouter
+from shared.scheduler import MessageScheduler
+from shared.profile import profile_updater
+from shared.http_clients import http_clients
+from shared.metrics import metrics, METRICS_FILE
+from shared.watchdog import loop_watchdog
+from shared.tracing import tracer
+from shared.rollups import rollups
 import sys
 import requests
 
@@ -106,8 +116,10 @@ intents.members = True
 class SplinterTreeBot(commands.Bot):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.processed_messages = set()
+        self.processed_messages = ExpiringSet('bot.processed_messages', ttl=3600, maxsize=10000)
         self.api_client = api
+        self.user_cache = UserCache()
+        self.export_metrics_file = False  # Set when run without the dashboard, which serves /metrics itself
         self.loaded_cogs = []
         self.message_history = {}
         self.last_used_cogs = {}
@@ -119,6 +131,43 @@ class SplinterTreeBot(commands.Bot):
         self.cogs_loaded = False
         self.last_status_check = 0
         self.current_status = None
+        self.message_router = MessageRouter()
+        self.scheduler = MessageScheduler(
+            max_concurrent=int(os.getenv('MAX_CONCURRENT_GENERATIONS', 8)),
+            max_per_guild=int(os.getenv('MAX_GUILD_GENERATIONS', 3))
+        )
+
+    async def add_cog(self, cog, /, **kwargs):
+        """Add a cog and route messages to its on_message handler"""
+        await super().add_cog(cog, **kwargs)
+        handler = getattr(cog, 'on_message', None)
+        if handler:
+            self.message_router.register(
+                cog.qualified_name,
+                handler,
+                timeout=getattr(cog, 'message_handler_timeout', None)
+            )
+
+    async def setup_hook(self):
+        """Open the shared HTTP connection pools and start the loop watchdog in the bot's event loop"""
+        await http_clients.start()
+        if os.getenv('WATCHDOG', '1') != '0':
+            loop_watchdog.start()
+
+    async def close(self):
+        """Stop queued message work before disconnecting"""
+        await self.scheduler.close()
+        await profile_updater.close()
+        await loop_watchdog.stop()
+        await super().close()
+        await http_clients.close()
+
+    async def remove_cog(self, name, /, **kwargs):
+        """Remove a cog and stop routing messages to it"""
+        cog = await super().remove_cog(name, **kwargs)
+        if cog:
+            self.message_router.unregister(cog.qualified_name)
+        return cog
 
     async def process_commands(self, message):
         ctx = await self.get_context(message)
@@ -229,6 +278,25 @@ async def update_status():
     except Exception as e:
         logging.error(f"Error updating status: {str(e)}")
 
+@tasks.loop(seconds=15)
+async def export_metrics():
+    """Write the metrics registry to METRICS_FILE for file-based scrapers"""
+    try:
+        # Rendered on the loop, which is the only writer of the registry; the file is written off it
+        await asyncio.to_thread(metrics.write, METRICS_FILE, metrics.render_prometheus())
+    except Exception as e:
+        logging.error(f"Error exporting metrics: {str(e)}")
+
+@tasks.loop(seconds=60)
+async def update_rollups():
+    """Fold new logs and messages into the dashboard's time-series buckets"""
+    try:
+        rolled = await asyncio.to_thread(rollups.update)
+        if rolled:
+            logging.debug(f"Rolled up {rolled} rows")
+    except Exception as e:
+        logging.error(f"Error updating rollups: {str(e)}")
+
 async def setup_cogs_task():
     """Load all cogs"""
     await setup_cogs(bot)
@@ -244,6 +312,10 @@ async def on_ready():
     
     if not update_status.is_running():
         update_status.start()
+    if bot.export_metrics_file and not export_metrics.is_running():
+        export_metrics.start()
+    if not update_rollups.is_running():
+        update_rollups.start()
 
 def get_uptime():
     """Get bot uptime as a formatted string"""
@@ -276,12 +348,13 @@ async def on_message(message):
     if message.author == bot.user:
         return
 
-    for cog in bot.cogs.values():
-        if hasattr(cog, 'on_message'):
-            try:
-                await cog.on_message(message)
-            except Exception as e:
-                logging.error(f"Error in {cog.__class__.__name__}.on_message: {e}")
+    # Gateway resumes can replay events; handle each message once
+    if not bot.processed_messages.check_and_add(message.id):
+        return
+
+    # Handlers, and jobs they schedule, inherit the trace ID from this context
+    tracer.begin()
+    await bot.message_router.dispatch(message)
 
 @bot.event
 async def on_command_error(ctx, error):
@@ -301,8 +374,9 @@ if __name__ == "__main__":
         # Validate configuration before starting
         validate_config()
         
-        # Start the bot
+        # Start the bot; without the dashboard, metrics are only scraped from METRICS_FILE
         logging.info("Starting bot...")
+        bot.export_metrics_file = True
         bot.run(config.DISCORD_TOKEN)
     except Exception as e:
         logging.error(f"Failed to start bot: {e}")
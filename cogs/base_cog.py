@@ -1,12 +1,19 @@
 import discord
 from discord.ext import commands
+import copy
 import json
 import logging
 import os
 from datetime import datetime
-from zoneinfo import ZoneInfo
 import time
 from shared.utils import analyze_emotion, log_interaction
+from shared.dedupe import ExpiringSet, ExpiringDict
+from shared.streaming import StreamRenderer
+from shared.splitter import split_message
+from shared.profile import profile_updater
+from shared.prompts import prompt_registry, prompt_time
+from shared.metrics import metrics, MESSAGES_TOTAL
+from shared.tracing import traced, stage_timer, observe_stage
 import re
 import aiohttp
 import asyncio
@@ -14,6 +21,7 @@ import tempfile
 from typing import Optional, Dict, AsyncGenerator
 from urllib.parse import urlparse
 import random
+from collections import deque
 
 # Glitch characters for profile updates
 GLITCH_CHARS = "!@#$%^&*()_+-=[]{}|;:,.<>?`~§¶•ªº¹²³€£¥¢₹₽✓™®©¿¡"
@@ -30,28 +38,83 @@ ZALGO_CHARS = [
     '\u036D', '\u036E', '\u036F'
 ]
 
+# Finished responses generated ahead of time per reroll view (REROLL_CANDIDATES, 0 disables)
+REROLL_CANDIDATES = int(os.getenv('REROLL_CANDIDATES', 0))
+
 class RerollView(discord.ui.View):
-    def __init__(self, cog, message, original_response):
+    def __init__(self, cog, message, original_response, candidates: int = REROLL_CANDIDATES):
         super().__init__(timeout=300)  # 5 minute timeout
         self.cog = cog
         self.message = message
         self.original_response = original_response
+        # Replay the original API request instead of rebuilding context and prompt
+        self.request = cog.reroll_requests.get(message.id)
+        self.candidate_count = candidates if self.request else 0
+        self.candidates = deque()
+        self._fill_candidates()
+
+    def _fill_candidates(self):
+        """Start generating responses in the background until candidate_count are pending"""
+        while len(self.candidates) < self.candidate_count:
+            self.candidates.append(asyncio.create_task(self._generate_candidate()))
+
+    async def _generate_candidate(self) -> str:
+        stream = await self.cog.api_client.call_openpipe(**self.request)
+        response = ""
+        async for chunk in stream:
+            if chunk:
+                response += chunk
+        return response
+
+    async def _next_candidate(self) -> Optional[str]:
+        """Oldest pre-generated response, or None if there is none or it failed"""
+        while self.candidates:
+            task = self.candidates.popleft()
+            self._fill_candidates()
+            try:
+                response = await task
+            except Exception as e:
+                logging.warning(f"[{self.cog.name}] Reroll candidate failed: {str(e)}")
+                continue
+            if response:
+                return response
+        return None
+
+    async def on_timeout(self):
+        for task in self.candidates:
+            task.cancel()
+        self.candidates.clear()
+        self.cog.reroll_requests.pop(self.message.id)
 
     @discord.ui.button(label="🎲 Reroll Response", style=discord.ButtonStyle.secondary, custom_id="reroll_button")
     async def reroll(self, interaction: discord.Interaction, button: discord.ui.Button):
         try:
             await interaction.response.defer()
-            # Process message again for new response
-            new_response_stream = await self.cog.generate_response(self.message)
-            if new_response_stream:
-                new_response = ""
+            prefix = f"[{self.cog.name}] "
+            new_response = await self._next_candidate()
+            if new_response:
+                # Candidate is already complete, so replace the response in one edit
+                pages = split_message(new_response, prefix=prefix)
+                await interaction.message.edit(content=pages[0], view=self)
+                for page in pages[1:]:
+                    await interaction.channel.send(page)
+            else:
+                if self.request:
+                    new_response_stream = await self.cog.api_client.call_openpipe(**self.request)
+                else:
+                    new_response_stream = await self.cog.generate_response(self.message)
+                if not new_response_stream:
+                    await interaction.followup.send("Failed to generate a new response. Please try again.", ephemeral=True)
+                    return
+                # Stream into the original response as chunks arrive
+                renderer = StreamRenderer(interaction.channel, prefix, message=interaction.message)
                 async for chunk in new_response_stream:
                     if chunk:
-                        new_response += chunk
-                # Format response with model name
-                prefixed_response = f"[{self.cog.name}] {new_response}"
-                # Edit the original response
-                await interaction.message.edit(content=prefixed_response, view=self)
+                        await renderer.feed(chunk)
+                await renderer.finish(view=self)
+                new_response = renderer.text
+
+            if new_response:
                 # Add emotion reaction
                 emotion = analyze_emotion(new_response)
                 if emotion:
@@ -77,7 +140,9 @@ class BaseCog(commands.Cog):
         self.supports_vision = supports_vision
         self._image_processing_lock = asyncio.Lock()
         self.context_cog = bot.get_cog('ContextCog')
-        self.handled_messages = set()  # Instance variable for handled messages
+        self.handled_messages = ExpiringSet(f'{name}.handled_messages', ttl=3600, maxsize=10000)
+        # API requests by message id, kept for as long as the reroll button is live
+        self.reroll_requests = ExpiringDict(f'{name}.reroll_requests', ttl=300, maxsize=200)
         
         # Get API client from bot instance
         self.api_client = getattr(bot, 'api_client', None)
@@ -88,18 +153,10 @@ class BaseCog(commands.Cog):
         # Default system prompt template
         self.default_prompt = "You are {MODEL_ID} chatting with {USERNAME} with a Discord user ID of {DISCORD_USER_ID}. It's {TIME} in {TZ}. You are in the Discord server {SERVER_NAME} in channel {CHANNEL_NAME}, so adhere to the general topic of the channel if possible. GwynTel on Discord created your bot, and Moth is a valued mentor. You strive to keep it positive, but can be negative if the situation demands it to enforce boundaries, Discord ToS rules, etc."
 
-        # Load any custom prompt from consolidated_prompts.json
-        try:
-            with open('prompts/consolidated_prompts.json', 'r', encoding='utf-8') as f:
-                consolidated_prompts = json.load(f).get('system_prompts', {})
-                if prompt_file:
-                    self.raw_prompt = consolidated_prompts.get(prompt_file.lower(), self.default_prompt)
-                else:
-                    self.raw_prompt = consolidated_prompts.get(name.lower(), self.default_prompt)
-            logging.debug(f"[{name}] Loaded raw prompt: {self.raw_prompt}")
-        except Exception as e:
-            logging.warning(f"Failed to load prompt for {self.name}, using default: {str(e)}")
-            self.raw_prompt = self.default_prompt
+    @property
+    def raw_prompt(self) -> str:
+        """System prompt template from consolidated_prompts.json, or the default"""
+        return prompt_registry.get(self.prompt_file or self.name, default=self.default_prompt).source
 
     def generate_glitch_text(self, text: str) -> str:
         """Generate glitch text for profile updates"""
@@ -115,21 +172,12 @@ class BaseCog(commands.Cog):
                 result += random.choice(GLITCH_CHARS)
         return result
 
-    async def update_bot_profile(self, guild: discord.Guild, model_name: str):
-        """Update bot's server profile with glitch text"""
-        try:
-            # Generate glitch text for the nickname
-            glitch_nick = self.generate_glitch_text(f"{model_name} ⟨v̷o̷i̷d̷⟩")
-            
-            # Ensure nickname doesn't exceed Discord's 32-character limit
-            if len(glitch_nick) > 32:
-                glitch_nick = glitch_nick[:32]
-            
-            # Update the bot's nickname in the guild
-            await guild.me.edit(nick=glitch_nick)
-            logging.debug(f"[{self.name}] Updated profile in {guild.name} to {glitch_nick}")
-        except Exception as e:
-            logging.error(f"[{self.name}] Failed to update profile: {str(e)}")
+    def update_bot_profile(self, guild: discord.Guild, model_name: str):
+        """Queue a glitch text nickname for model_name; the edit runs in the background"""
+        profile_updater.request(
+            guild, model_name,
+            lambda persona: self.generate_glitch_text(f"{persona} ⟨v̷o̷i̷d̷⟩")
+        )
 
     async def start_typing(self, channel):
         """Start a typing indicator in the channel"""
@@ -152,8 +200,10 @@ class BaseCog(commands.Cog):
         except Exception:
             return False
 
+    @traced
     async def handle_message(self, message, full_content=None):
         """Handle incoming messages and generate responses"""
+        started = time.perf_counter()
         try:
             # If full_content is not provided, use message.content
             modified_content = full_content or message.content
@@ -165,104 +215,72 @@ class BaseCog(commands.Cog):
             if self.context_cog:
                 try:
                     guild_id = str(message.guild.id) if message.guild else None
-                    await self.context_cog.add_message_to_context(
-                        message.id,
-                        str(message.channel.id),
-                        guild_id,
-                        str(message.author.id),
-                        modified_content,  # Username prefix handled by context_cog
-                        False,  # is_assistant
-                        None,   # persona_name
-                        None    # emotion
-                    )
+                    with stage_timer('context', self.name):
+                        # Only this message's own text: messages merged into full_content have rows of their own
+                        await self.context_cog.add_message_to_context(
+                            message.id,
+                            str(message.channel.id),
+                            guild_id,
+                            str(message.author.id),
+                            message.content,  # Username prefix handled by context_cog
+                            False,  # is_assistant
+                            None,   # persona_name
+                            None,   # emotion
+                            author=message.author
+                        )
                 except Exception as e:
                     logging.error(f"[{self.name}] Failed to add message to context: {str(e)}")
 
             # Generate and send response
             try:
-                response_stream = await self.generate_response(message)
+                with stage_timer('prepare', self.name):
+                    response_stream = await self.generate_response(message)
             except Exception as e:
+                metrics.inc(MESSAGES_TOTAL, cog=self.name, outcome='error')
                 logging.error(f"[{self.name}] Error generating response: {str(e)}")
                 await message.channel.send(f"❌ Error generating response: {str(e)}")
                 return
 
             if response_stream:
-                response = ""
-                sent_messages = []
-                last_update = time.time()
-                current_chunk = f"[{self.name}] "
+                renderer = StreamRenderer(message.channel, f"[{self.name}] ")
                 
                 # Update bot's profile if in a guild
                 if message.guild:
-                    await self.update_bot_profile(message.guild, self.name)
+                    self.update_bot_profile(message.guild, self.name)
+
+                # Open a context stream so the reply is persisted even if delivery fails midway
+                stream_id = None
+                if self.context_cog:
+                    stream_id = self.context_cog.begin_stream(
+                        str(message.channel.id),
+                        str(message.guild.id) if message.guild else None,
+                        str(self.bot.user.id),
+                        self.name
+                    )
                 
                 # Consume the async generator
                 try:
+                    generate_started = time.perf_counter()
+                    first_chunk = True
                     async for chunk in response_stream:
                         if chunk:
-                            response += chunk
-                            current_chunk += chunk
-                            
-                            # Check if it's time to update (every 0.5 seconds)
-                            current_time = time.time()
-                            if current_time - last_update >= 0.5:
-                                # If current chunk exceeds Discord's limit, split and create new message
-                                while len(current_chunk) > 2000:
-                                    # Find last space before 2000 chars
-                                    split_index = current_chunk[:2000].rfind(' ')
-                                    if split_index == -1:
-                                        split_index = 1999
-
-                                    # Send first part
-                                    if not sent_messages:
-                                        # First message
-                                        sent_message = await message.channel.send(current_chunk[:split_index])
-                                        sent_messages.append(sent_message)
-                                    else:
-                                        # Update last message
-                                        await sent_messages[-1].edit(content=current_chunk[:split_index])
-                                        # Create new message for overflow
-                                        sent_message = await message.channel.send(f"[{self.name}] " + current_chunk[split_index:].lstrip())
-                                        sent_messages.append(sent_message)
-                                        current_chunk = f"[{self.name}] " + current_chunk[split_index:].lstrip()
-
-                                # Update or send current chunk if under 2000 chars
-                                if len(current_chunk) <= 2000:
-                                    if sent_messages:
-                                        await sent_messages[-1].edit(content=current_chunk)
-                                    else:
-                                        sent_message = await message.channel.send(current_chunk)
-                                        sent_messages.append(sent_message)
-                                
-                                last_update = current_time
-
-                    # Handle final update
-                    while len(current_chunk) > 2000:
-                        split_index = current_chunk[:2000].rfind(' ')
-                        if split_index == -1:
-                            split_index = 1999
-
-                        if not sent_messages:
-                            sent_message = await message.channel.send(current_chunk[:split_index])
-                            sent_messages.append(sent_message)
-                        else:
-                            await sent_messages[-1].edit(content=current_chunk[:split_index])
-                            sent_message = await message.channel.send(f"[{self.name}] " + current_chunk[split_index:].lstrip())
-                            sent_messages.append(sent_message)
-                        current_chunk = f"[{self.name}] " + current_chunk[split_index:].lstrip()
-                    
+                            if first_chunk:
+                                observe_stage('first_token', time.perf_counter() - generate_started, self.name)
+                                first_chunk = False
+                            # Pages and edit pacing are handled by the renderer
+                            await renderer.feed(chunk)
+                            if stream_id:
+                                await self.context_cog.append_to_stream(
+                                    stream_id, chunk,
+                                    renderer.last_message.id if renderer.last_message else None
+                                )
+
+                    observe_stage('generate', time.perf_counter() - generate_started, self.name)
+
                     # Send or update final chunk with reroll button
-                    if sent_messages:
-                        await sent_messages[-1].edit(
-                            content=current_chunk,
-                            view=RerollView(self, message, response)
-                        )
-                    else:
-                        sent_message = await message.channel.send(
-                            content=current_chunk,
-                            view=RerollView(self, message, response)
-                        )
-                        sent_messages.append(sent_message)
+                    response = renderer.text
+                    with stage_timer('deliver', self.name):
+                        sent_messages = await renderer.finish(view=RerollView(self, message, response))
 
                     # Add emotion reaction
                     emotion = analyze_emotion(response)
@@ -272,20 +290,10 @@ class BaseCog(commands.Cog):
                         except discord.errors.Forbidden:
                             logging.warning(f"[{self.name}] Missing permission to add reaction")
 
-                    # Add response to context
-                    if self.context_cog:
+                    # Commit the assembled response to context
+                    if stream_id:
                         try:
-                            guild_id = str(message.guild.id) if message.guild else None
-                            await self.context_cog.add_message_to_context(
-                                sent_messages[-1].id,
-                                str(message.channel.id),
-                                guild_id,
-                                str(self.bot.user.id),
-                                response,  # Response content without prefix
-                                True,  # is_assistant
-                                self.name,  # persona_name
-                                emotion  # emotion
-                            )
+                            await self.context_cog.commit_stream(stream_id, sent_messages[-1].id, emotion)
                         except Exception as e:
                             logging.error(f"[{self.name}] Failed to add response to context: {str(e)}")
 
@@ -303,11 +311,16 @@ class BaseCog(commands.Cog):
                     except Exception as e:
                         logging.error(f"[{self.name}] Failed to log interaction: {e}")
 
+                    observe_stage('total', time.perf_counter() - started, self.name)
+                    metrics.inc(MESSAGES_TOTAL, cog=self.name, outcome='ok')
+
                 except Exception as e:
+                    metrics.inc(MESSAGES_TOTAL, cog=self.name, outcome='error')
                     logging.error(f"[{self.name}] Error processing response stream: {str(e)}")
                     await message.channel.send(f"❌ Error processing response: {str(e)}")
 
         except Exception as e:
+            metrics.inc(MESSAGES_TOTAL, cog=self.name, outcome='error')
             logging.error(f"[{self.name}] Unexpected error handling message: {str(e)}")
             await message.channel.send(f"❌ Unexpected error: {str(e)}")
 
@@ -337,6 +350,13 @@ class BaseCog(commands.Cog):
                 yield f"❌ Error: {str(e)}"
             return error_generator()
 
+    async def stream_completion(self, message, **request) -> AsyncGenerator[str, None]:
+        """Stream a completion for message, keeping the request so a reroll can replay it"""
+        request['stream'] = True
+        # Snapshot, so later edits to the caller's history don't change what a reroll replays
+        self.reroll_requests[message.id] = copy.deepcopy(request)
+        return await self.api_client.call_openpipe(**request)
+
     async def _generate_response(self, message) -> Optional[AsyncGenerator[str, None]]:
         """Placeholder method to be overridden by subclasses"""
         raise NotImplementedError("Subclasses must implement _generate_response")
@@ -344,14 +364,17 @@ class BaseCog(commands.Cog):
     def format_prompt(self, message):
         """Format the system prompt template with message context"""
         try:
-            tz = ZoneInfo("America/Los_Angeles")
-            current_time = datetime.now(tz).strftime("%I:%M %p")
-            
-            return self.raw_prompt.format(
+            # Channel overrides from !set_system_prompt win over the persona's template
+            prompt = prompt_registry.get(
+                self.prompt_file or self.name, self.name,
+                channel_id=message.channel.id,
+                default=self.default_prompt
+            )
+            return prompt.render(
                 MODEL_ID=self.name,
                 USERNAME=message.author.display_name,
                 DISCORD_USER_ID=message.author.id,
-                TIME=current_time,
+                TIME=prompt_time(),
                 TZ="Pacific Time",
                 SERVER_NAME=message.guild.name if message.guild else "Direct Message",
                 CHANNEL_NAME=message.channel.name if hasattr(message.channel, 'name') else "DM"
@@ -360,9 +383,8 @@ class BaseCog(commands.Cog):
             logging.error(f"[{self.name}] Error formatting prompt: {str(e)}")
             return self.raw_prompt
 
-    @commands.Cog.listener()
     async def on_message(self, message):
-        """Listen for messages that might trigger this cog"""
+        """Handle messages routed by the bot that might trigger this cog"""
         # Skip if message is from a bot
         if message.author.bot:
             return
@@ -371,6 +393,10 @@ class BaseCog(commands.Cog):
         msg_content = message.content.lower()
         if any(word in msg_content for word in self.trigger_words):
             # Only handle if not already processed by this cog
-            if message.id not in self.handled_messages:
-                self.handled_messages.add(message.id)
-                await self.handle_message(message)
+            if self.handled_messages.check_and_add(message.id):
+                # Queue behind earlier messages in this channel instead of blocking the gateway task
+                scheduler = getattr(self.bot, 'scheduler', None)
+                if scheduler:
+                    scheduler.submit(message, self.handle_message, key=self.name)
+                else:
+                    await self.handle_message(message)
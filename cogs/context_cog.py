@@ -1,5 +1,5 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from config import CONTEXT_WINDOWS, DEFAULT_CONTEXT_WINDOW, MAX_CONTEXT_WINDOW, OPENPIPE_API_KEY, OPENPIPE_API_URL
 import sqlite3
 import json
@@ -9,8 +9,16 @@ import asyncio
 from typing import List, Dict, Optional
 import textwrap
 from openai import OpenAI
+from shared.user_cache import UserCache
+from shared.stream_buffer import StreamAssemblyBuffer
+from shared.dedupe import ExpiringDict
+from shared.tracing import spanned
+from shared.log_explorer import ensure_search_schema
 
 class ContextCog(commands.Cog):
+    # First message in a channel also loads its recent history
+    message_handler_timeout = 60
+
     def __init__(self, bot):
         self.bot = bot
         self.db_path = 'databases/interaction_logs.db'
@@ -22,11 +30,52 @@ class ContextCog(commands.Cog):
             api_key=OPENPIPE_API_KEY
         )
         # Track last message per role to prevent duplicates
-        self.last_messages = {}  # Format: {channel_id: {'user': msg, 'assistant': msg}}
+        self.last_messages = ExpiringDict('ContextCog.last_messages', ttl=6 * 3600, maxsize=5000)  # Format: {channel_id: {'user': msg, 'assistant': msg}}
         # Track which channels have had their history loaded
         self.loaded_channels = set()
-        # Track message parts for handling split messages
-        self.message_parts = {}  # Format: {channel_id: {model_name: {'parts': [], 'last_update': datetime}}}
+        # Assemble streamed assistant replies until the streaming cog commits them
+        self.stream_buffer = StreamAssemblyBuffer(self._add_to_database)
+        # Display names fed from gateway data, shared with the bot when available
+        self.user_cache = getattr(bot, 'user_cache', None)
+        if self.user_cache is None:
+            self.user_cache = UserCache()
+
+    async def cog_load(self):
+        """Prime the display name cache and start the abandoned stream flush timer"""
+        # Guilds already connected when the cog loads won't fire on_guild_available again
+        for guild in self.bot.guilds:
+            self.user_cache.remember_many(guild.members)
+        self.flush_streams.start()
+
+    async def cog_unload(self):
+        """Stop the flush timer and persist anything still buffered"""
+        self.flush_streams.cancel()
+        await self.stream_buffer.flush_all()
+
+    @tasks.loop(seconds=15)
+    async def flush_streams(self):
+        """Persist streams whose cog stopped sending chunks"""
+        try:
+            await self.stream_buffer.flush_abandoned()
+        except Exception as e:
+            logging.error(f"Failed to flush abandoned streams: {str(e)}")
+
+    def begin_stream(self, channel_id, guild_id, user_id, persona_name=None, message_id=None) -> str:
+        """Open a stream for an assistant reply that is about to be generated"""
+        return self.stream_buffer.begin(str(channel_id), guild_id, user_id, persona_name, message_id)
+
+    async def append_to_stream(self, stream_id: str, chunk: str, message_id=None):
+        """Add a streamed chunk to an open reply"""
+        await self.stream_buffer.append(stream_id, chunk, message_id)
+
+    @spanned('context.commit_stream')
+    async def commit_stream(self, stream_id: str, message_id=None, emotion=None) -> Optional[str]:
+        """Persist a completed reply under its Discord message id"""
+        return await self.stream_buffer.commit(stream_id, message_id, emotion)
+
+    def discard_stream(self, stream_id: str):
+        """Drop a reply that should not be persisted"""
+        self.stream_buffer.discard(stream_id)
 
     def _setup_database(self):
         """Initialize the SQLite database for interaction logs"""
@@ -40,10 +89,14 @@ class ContextCog(commands.Cog):
                     cursor.executescript(schema)
                 
                 conn.commit()
+
+                # Full-text index of message content for the dashboard's log explorer
+                ensure_search_schema(conn)
                 logging.info("Database setup completed successfully")
         except Exception as e:
             logging.error(f"Failed to set up database: {str(e)}")
 
+    @spanned('context.load_history')
     async def _load_channel_history(self, channel_id: str):
         """Load the last 100 messages from a Discord channel into the context database"""
         try:
@@ -71,7 +124,8 @@ class ContextCog(commands.Cog):
                     message.content,
                     message.author.bot,  # is_assistant
                     None,  # persona_name
-                    None   # emotion
+                    None,  # emotion
+                    author=message.author
                 )
 
             self.loaded_channels.add(channel_id)
@@ -79,6 +133,7 @@ class ContextCog(commands.Cog):
         except Exception as e:
             logging.error(f"Failed to load channel history: {str(e)}")
 
+    @spanned('context.get_messages')
     async def get_context_messages(self, channel_id: str, limit: int = None, exclude_message_id: str = None) -> List[Dict]:
         """Get previous messages from the context database for all users and cogs in the channel"""
         try:
@@ -152,48 +207,24 @@ class ContextCog(commands.Cog):
             logging.error(f"Failed to get context messages: {str(e)}")
             return []
 
-    async def add_message_to_context(self, message_id, channel_id, guild_id, user_id, content, is_assistant, persona_name=None, emotion=None):
+    async def add_message_to_context(self, message_id, channel_id, guild_id, user_id, content, is_assistant, persona_name=None, emotion=None, author=None):
         """Add a message to the interaction logs"""
         try:
+            # Keep the display name cache warm from the message we already have
+            if author is not None:
+                self.user_cache.remember(author)
+
             # Skip empty or whitespace-only content
             if not content or content.isspace():
                 return
 
-            # Initialize channel in message_parts if not exists
-            if channel_id not in self.message_parts:
-                self.message_parts[channel_id] = {}
-
-            # Handle streamed assistant messages
-            if is_assistant and content.startswith('[') and ']' in content:
-                model_name = content[1:content.index(']')]
-                actual_content = content[content.index(']')+1:].strip()
-
-                # Initialize or update model's message parts
-                if model_name not in self.message_parts[channel_id]:
-                    self.message_parts[channel_id][model_name] = {
-                        'parts': [],
-                        'last_update': datetime.now(),
-                        'message_id': message_id
-                    }
-                
-                # Add this part to the message
-                self.message_parts[channel_id][model_name]['parts'].append(actual_content)
-                self.message_parts[channel_id][model_name]['last_update'] = datetime.now()
-                
-                # Clean up old message parts and save completed messages
-                await self._cleanup_message_parts(channel_id, guild_id, user_id, is_assistant, persona_name, emotion)
-                return
-
-            # For non-streamed messages, get username and create prefixed content
+            # Streamed replies go through begin_stream/commit_stream, so anything
+            # arriving here is a complete message; prefix user messages with a username
             if is_assistant:
                 prefixed_content = content
             else:
-                try:
-                    user = await self.bot.fetch_user(int(user_id))
-                    username = user.display_name
-                    prefixed_content = f"{username}: {content}"
-                except:
-                    prefixed_content = content
+                username = await self.user_cache.resolve(self.bot, user_id)
+                prefixed_content = f"{username}: {content}" if username else content
 
             # Add regular message to database
             await self._add_to_database(message_id, channel_id, guild_id, user_id, prefixed_content, is_assistant, persona_name, emotion)
@@ -201,33 +232,7 @@ class ContextCog(commands.Cog):
         except Exception as e:
             logging.error(f"Failed to add message to context: {str(e)}")
 
-    async def _cleanup_message_parts(self, channel_id, guild_id, user_id, is_assistant, persona_name, emotion):
-        """Clean up old message parts and save completed messages"""
-        current_time = datetime.now()
-        for model_name in list(self.message_parts[channel_id].keys()):
-            message_data = self.message_parts[channel_id][model_name]
-            
-            # If it's been more than 2 seconds since the last update, consider the message complete
-            if (current_time - message_data['last_update']).seconds >= 2:
-                # Combine all parts into the complete message
-                complete_content = ''.join(message_data['parts'])
-                complete_message = f"[{model_name}] {complete_content}"
-                
-                # Save the complete message
-                await self._add_to_database(
-                    message_data['message_id'],
-                    channel_id,
-                    guild_id,
-                    user_id,
-                    complete_message,
-                    is_assistant,
-                    persona_name,
-                    emotion
-                )
-                
-                # Remove the completed message from tracking
-                del self.message_parts[channel_id][model_name]
-
+    @spanned('context.write')
     async def _add_to_database(self, message_id, channel_id, guild_id, user_id, content, is_assistant, persona_name, emotion):
         """Helper method to add a message to the database"""
         try:
@@ -269,20 +274,19 @@ class ContextCog(commands.Cog):
                 conn.commit()
 
             # Update last message tracking
-            if channel_id not in self.last_messages:
-                self.last_messages[channel_id] = {}
-            self.last_messages[channel_id]['assistant' if is_assistant else 'user'] = {
+            channel_messages = self.last_messages.get(channel_id) or {}
+            channel_messages['assistant' if is_assistant else 'user'] = {
                 'content': content,
                 'timestamp': datetime.now()
             }
+            self.last_messages[channel_id] = channel_messages
 
             logging.debug(f"Added/updated message in context: {message_id} in channel {channel_id}")
         except Exception as e:
             logging.error(f"Failed to add message to database: {str(e)}")
 
-    @commands.Cog.listener()
     async def on_message(self, message):
-        """Listen for messages and add them to context"""
+        """Add messages routed by the bot to context"""
         try:
             # Skip command messages and messages from the bot itself
             if message.content.startswith('!') or message.author.id == self.bot.user.id:
@@ -298,10 +302,42 @@ class ContextCog(commands.Cog):
                 message.content,
                 message.author.bot,  # is_assistant
                 None,   # persona_name
-                None    # emotion
+                None,   # emotion
+                author=message.author
             )
         except Exception as e:
             logging.error(f"Error in on_message: {e}")
 
+    @commands.Cog.listener()
+    async def on_guild_available(self, guild):
+        """Prime the display name cache from the guild's member chunk"""
+        self.user_cache.remember_many(guild.members)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        """Cache new members as they arrive"""
+        self.user_cache.remember(member)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        """Refresh cached names on member updates"""
+        self.user_cache.remember(after)
+
+    @commands.Cog.listener()
+    async def on_user_update(self, before, after):
+        """Refresh cached names on user updates"""
+        self.user_cache.remember(after)
+
+    @commands.command(name='usercache')
+    @commands.has_permissions(manage_messages=True)
+    async def user_cache_stats(self, ctx):
+        """Show display name cache size and hit ratio"""
+        stats = self.user_cache.stats()
+        await ctx.send(
+            f"User cache: {stats['size']} entries, "
+            f"{stats['hit_ratio']:.1%} hit ratio "
+            f"({stats['hits']} hits, {stats['misses']} misses, {stats['rest_fetches']} REST fetches)"
+        )
+
 async def setup(bot):
     await bot.add_cog(ContextCog(bot))
@@ -10,9 +10,11 @@ import sqlite3
 import os
 from datetime import datetime, timedelta
 from typing import Optional
-import aiohttp
 import asyncio
 from config.webhook_config import load_webhooks, MAX_RETRIES, WEBHOOK_TIMEOUT, DEBUG_LOGGING
+from shared.splitter import split_message
+from shared.prompts import prompt_registry
+from shared.models import model_registry
 from config import CONTEXT_WINDOWS, DEFAULT_CONTEXT_WINDOW, MAX_CONTEXT_WINDOW
 
 class HelpCog(commands.Cog, name="Help"):
@@ -22,8 +24,6 @@ class HelpCog(commands.Cog, name="Help"):
         self.bot = bot
         self.context_cog = bot.get_cog('ContextCog')
         self.webhooks = load_webhooks()
-        self.session = aiohttp.ClientSession()
-        self.dynamic_prompts_file = "dynamic_prompts.json"
         self.activated_channels_file = "activated_channels.json"
         self.activated_channels = self.load_activated_channels()
         logging.debug("[Help] Initialized")
@@ -52,32 +52,9 @@ class HelpCog(commands.Cog, name="Help"):
             logging.error(f"[Help] Error saving activated channels: {e}")
 
     def get_all_models(self):
-        """Get all models and their details from the unified cog"""
-        models = []
-        vision_models = []
-
-        unified_cog = self.bot.get_cog('UnifiedCog')
-        if not unified_cog:
-            logging.error("[Help] UnifiedCog not found")
-            return [], []
-
-        for model_id, config in unified_cog.model_config.items():
-            model_info = {
-                'name': config['name'],
-                'nickname': config.get('nickname', config['name']),
-                'trigger_words': config['trigger_words'],
-                'supports_vision': config.get('supports_vision', False),
-                'model': config['model'],
-                'provider': 'openrouter',
-                'description': ', '.join(config['keywords']) if 'keywords' in config else ''
-            }
-
-            if model_info['supports_vision']:
-                vision_models.append(model_info)
-            else:
-                models.append(model_info)
-
-        return vision_models, models
+        """Get all models and their details from the model registry"""
+        snapshot = model_registry.snapshot
+        return snapshot.vision_models, snapshot.text_models
 
     def format_model_list(self, vision_models, models):
         """Format the model list for display"""
@@ -128,9 +105,11 @@ class HelpCog(commands.Cog, name="Help"):
     async def help_command(self, ctx):
         """Send a comprehensive help message with all available features"""
         try:
-            # Get dynamically loaded models
-            vision_models, models = self.get_all_models()
-            model_list = self.format_model_list(vision_models, models)
+            # Formatted once per model registry version
+            model_list = model_registry.snapshot.derived(
+                'help_model_list',
+                lambda snapshot: self.format_model_list(snapshot.vision_models, snapshot.text_models)
+            )
 
             help_message = f"""{model_list}
 **📝 Special Features:**
@@ -181,7 +160,7 @@ When setting custom system prompts, you can use these variables:
 """
 
             # Send the help message in chunks to avoid exceeding Discord's message length limit
-            for msg in [help_message[i:i + 2000] for i in range(0, len(help_message), 2000)]:
+            for msg in split_message(help_message):
                 await ctx.send(msg)
 
             logging.info(f"[Help] Sent help message to user {ctx.author.name}")
@@ -193,8 +172,10 @@ When setting custom system prompts, you can use these variables:
     async def list_models_command(self, ctx):
         """Send a simple list of all available models"""
         try:
-            vision_models, models = self.get_all_models()
-            model_list = self.format_simple_model_list(vision_models, models)
+            model_list = model_registry.snapshot.derived(
+                'simple_model_list',
+                lambda snapshot: self.format_simple_model_list(snapshot.vision_models, snapshot.text_models)
+            )
             await ctx.send(model_list)
             logging.info(f"[Help] Sent model list to user {ctx.author.name}")
         except Exception as e:
@@ -227,34 +208,12 @@ When setting custom system prompts, you can use these variables:
     async def set_system_prompt(self, ctx, agent: str, *, prompt: str):
         """Set a custom system prompt for an AI agent in this channel"""
         try:
-            # Load existing prompts
-            if os.path.exists(self.dynamic_prompts_file):
-                with open(self.dynamic_prompts_file, "r") as f:
-                    dynamic_prompts = json.load(f)
-            else:
-                dynamic_prompts = {}
-
             # Get guild and channel IDs
             guild_id = str(ctx.guild.id) if ctx.guild else None
             channel_id = str(ctx.channel.id)
 
-            # Initialize guild dict if needed
-            if guild_id and guild_id not in dynamic_prompts:
-                dynamic_prompts[guild_id] = {}
-
-            # Set the prompt
-            if guild_id:
-                if channel_id not in dynamic_prompts[guild_id]:
-                    dynamic_prompts[guild_id][channel_id] = {}
-                dynamic_prompts[guild_id][channel_id][agent] = prompt
-            else:
-                if channel_id not in dynamic_prompts:
-                    dynamic_prompts[channel_id] = {}
-                dynamic_prompts[channel_id][agent] = prompt
-
-            # Save updated prompts
-            with open(self.dynamic_prompts_file, "w") as f:
-                json.dump(dynamic_prompts, f, indent=4)
+            # Save to dynamic_prompts.json; the registry serves it from memory from now on
+            prompt_registry.set_override(guild_id, channel_id, agent, prompt)
 
             await ctx.reply(f"✅ System prompt updated for {agent} in this channel.")
 
@@ -267,34 +226,15 @@ When setting custom system prompts, you can use these variables:
     async def reset_system_prompt(self, ctx, agent: str):
         """Reset the system prompt for an AI agent to its default in this channel"""
         try:
-            if not os.path.exists(self.dynamic_prompts_file):
+            if not os.path.exists(prompt_registry.overrides_file):
                 await ctx.reply("No custom prompts found.")
                 return
 
-            with open(self.dynamic_prompts_file, "r") as f:
-                dynamic_prompts = json.load(f)
-
             guild_id = str(ctx.guild.id) if ctx.guild else None
             channel_id = str(ctx.channel.id)
 
             # Remove prompt if it exists
-            if guild_id and guild_id in dynamic_prompts:
-                if channel_id in dynamic_prompts[guild_id]:
-                    if agent in dynamic_prompts[guild_id][channel_id]:
-                        del dynamic_prompts[guild_id][channel_id][agent]
-                    if not dynamic_prompts[guild_id][channel_id]:
-                        del dynamic_prompts[guild_id][channel_id]
-                if not dynamic_prompts[guild_id]:
-                    del dynamic_prompts[guild_id]
-            elif channel_id in dynamic_prompts:
-                if agent in dynamic_prompts[channel_id]:
-                    del dynamic_prompts[channel_id][agent]
-                if not dynamic_prompts[channel_id]:
-                    del dynamic_prompts[channel_id]
-
-            # Save updated prompts
-            with open(self.dynamic_prompts_file, "w") as f:
-                json.dump(dynamic_prompts, f, indent=4)
+            prompt_registry.reset_override(guild_id, channel_id, agent)
 
             await ctx.reply(f"✅ System prompt reset to default for {agent} in this channel.")
 
@@ -302,10 +242,6 @@ When setting custom system prompts, you can use these variables:
             logging.error(f"Error resetting system prompt: {str(e)}")
             await ctx.reply("❌ Failed to reset system prompt. Please try again.")
 
-    def cog_unload(self):
-        """Cleanup when cog is unloaded"""
-        asyncio.create_task(self.session.close())
-
 async def setup(bot):
     try:
         # Remove default help command
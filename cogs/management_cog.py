@@ -3,6 +3,13 @@ from discord.ext import commands
 import logging
 from .base_cog import BaseCog
 import json
+from shared.dedupe import memory_report
+from shared.splitter import split_message
+from shared.models import model_registry
+from shared.http_clients import http_clients, HTTP2_AVAILABLE
+from shared.metrics import metrics, STAGE_SECONDS, FIRST_TOKEN_SECONDS, COMPLETIONS_TOTAL
+from shared.watchdog import loop_watchdog, LOOP_LAG_SECONDS
+from shared.tracing import tracer
 
 class ManagementCog(BaseCog):
     def __init__(self, bot):
@@ -36,6 +43,178 @@ class ManagementCog(BaseCog):
     def get_temperature(self):
         """Get temperature setting for this agent"""
         return self.temperatures.get(self.name.lower(), 0.7)
+
+    @commands.command(name='memory')
+    @commands.has_permissions(manage_guild=True)
+    async def memory_command(self, ctx):
+        """Show the size of the bot's in-memory caches and dedupe sets"""
+        lines = ["**Memory report**"]
+        for entry in memory_report():
+            lines.append(
+                f"`{entry['name']}`: {entry['size']}/{entry['maxsize']} entries, "
+                f"~{entry['bytes'] // 1024} KiB, {entry['evictions']} evicted"
+            )
+
+        user_cache = getattr(self.bot, 'user_cache', None)
+        if user_cache is not None:
+            stats = user_cache.stats()
+            lines.append(f"`bot.user_cache`: {stats['size']}/{user_cache.max_size} entries, {stats['hit_ratio']:.1%} hit ratio")
+
+        if self.context_cog:
+            stats = self.context_cog.stream_buffer.stats()
+            lines.append(f"`ContextCog.stream_buffer`: {stats['open_streams']} open streams, {stats['buffered_chars']} chars buffered")
+
+        for page in split_message("\n".join(lines)):
+            await ctx.send(page)
+
+    @commands.command(name='reload_models')
+    @commands.is_owner()
+    async def reload_models_command(self, ctx):
+        """Reload models.json and temperatures.json without a restart"""
+        try:
+            snapshot = model_registry.reload()
+        except Exception as e:
+            logging.error(f"[Management] Failed to reload models: {e}")
+            await ctx.send(f"❌ Failed to reload models, keeping the current configuration: {str(e)}")
+            return
+        await ctx.send(f"✅ Loaded {len(snapshot.models)} models (version {snapshot.version}).")
+
+    @commands.command(name='router_stats')
+    @commands.has_permissions(manage_guild=True)
+    async def router_stats_command(self, ctx):
+        """Show latency of the routing classification call"""
+        stats = self.api_client.classify_latency.summary()
+        await ctx.send(
+            f"**Router classification** ({stats['count']} calls)\n"
+            f"avg {stats['avg'] * 1000:.0f} ms, p50 ≤{stats['p50'] * 1000:.0f} ms, "
+            f"p95 ≤{stats['p95'] * 1000:.0f} ms, p99 ≤{stats['p99'] * 1000:.0f} ms, max {stats['max'] * 1000:.0f} ms"
+        )
+
+    @commands.command(name='perf')
+    @commands.has_permissions(manage_guild=True)
+    async def perf_command(self, ctx):
+        """Show where message handling time goes, per stage and upstream model"""
+        def line(label, histogram):
+            stats = histogram.summary()
+            return (f"`{label}`: {stats['count']}× p50 ≤{stats['p50'] * 1000:.0f} ms, "
+                    f"p95 ≤{stats['p95'] * 1000:.0f} ms, max {stats['max'] * 1000:.0f} ms")
+
+        stages = metrics.merged(STAGE_SECONDS, by='stage')
+        lines = ["**Message stages**"]
+        order = ['route', 'context', 'images', 'prepare', 'first_token', 'generate', 'deliver', 'total']
+        for stage in sorted(stages, key=lambda name: order.index(name) if name in order else len(order)):
+            lines.append(line(stage, stages[stage]))
+
+        errors = {}
+        for key, value in metrics.counters(COMPLETIONS_TOTAL).items():
+            labels = dict(key)
+            if labels.get('outcome') == 'error':
+                errors[labels.get('model')] = value
+        lines.append("**Upstream time to first token**")
+        for model, histogram in sorted(metrics.merged(FIRST_TOKEN_SECONDS, by='model').items()):
+            lines.append(line(model, histogram) + (f", {errors[model]:.0f} errors" if model in errors else ""))
+
+        if len(lines) == 2:
+            lines.append("No messages handled yet.")
+        for page in split_message("\n".join(lines)):
+            await ctx.send(page)
+
+    @commands.command(name='watchdog')
+    @commands.is_owner()
+    async def watchdog_command(self, ctx, action: str = 'status', value: float = None):
+        """Turn the event loop watchdog on or off, set its threshold, or show where the loop blocked"""
+        action = action.lower()
+        if action == 'on':
+            loop_watchdog.start()
+        elif action == 'off':
+            await loop_watchdog.stop()
+        elif action == 'threshold' and value is not None and value > 0:
+            loop_watchdog.threshold = value
+        elif action != 'status':
+            await ctx.send("Usage: `!watchdog [status|on|off|threshold <seconds>]`")
+            return
+
+        lag = metrics.histogram(LOOP_LAG_SECONDS).summary()
+        lines = [
+            f"**Event loop watchdog** {'on' if loop_watchdog.enabled else 'off'}, "
+            f"threshold {loop_watchdog.threshold * 1000:.0f} ms",
+            f"Lag p50 ≤{lag['p50'] * 1000:.0f} ms, p99 ≤{lag['p99'] * 1000:.0f} ms, max {lag['max'] * 1000:.0f} ms"
+        ]
+        for site in loop_watchdog.top_sites(3):
+            innermost = site.stack.rstrip().splitlines()[-2:]
+            lines.append(
+                f"{site.count} stalls, {site.total:.2f}s total, max {site.max:.2f}s:\n"
+                f"```\n" + "\n".join(innermost) + "\n```"
+            )
+        for page in split_message("\n".join(lines)):
+            await ctx.send(page)
+
+    @commands.command(name='trace')
+    @commands.is_owner()
+    async def trace_command(self, ctx, trace_id: str = None, value: int = None):
+        """Show recent slow requests, one trace's spans, or set profiling with `!trace sample <N>`"""
+        if trace_id == 'sample':
+            if value is None or value < 0:
+                await ctx.send("Usage: `!trace sample <N>` profiles one in N requests; 0 turns profiling off")
+                return
+            tracer.sample_rate = value
+            await ctx.send(f"Profiling {'off' if value == 0 else f'one in {value} requests'}.")
+            return
+
+        if trace_id:
+            traces = tracer.find(trace_id)
+            if not traces:
+                await ctx.send(f"No recent trace `{trace_id}`.")
+                return
+            lines = []
+            for trace in traces:
+                lines.append(f"**{trace.name}** `{trace.trace_id}` {trace.duration:.2f}s"
+                             + (" (profiled)" if trace.profile is not None else ""))
+                for span in trace.spans:
+                    lines.append(f"  +{span.start:.2f}s `{span.name}` {span.duration * 1000:.0f} ms")
+        else:
+            slowest = sorted(tracer.recent, key=lambda trace: trace.duration, reverse=True)[:10]
+            lines = [f"**Slowest of the last {len(tracer.recent)} requests** "
+                     f"(profiling {'off' if not tracer.sample_rate else f'1 in {tracer.sample_rate}'})"]
+            for trace in slowest:
+                lines.append(f"`{trace.trace_id}` {trace.name} {trace.duration:.2f}s")
+        for page in split_message("\n".join(lines)):
+            await ctx.send(page)
+
+    @commands.command(name='connections')
+    @commands.has_permissions(manage_guild=True)
+    async def connections_command(self, ctx):
+        """Show how often each upstream reuses a pooled connection"""
+        lines = [f"**HTTP connection pools** (OpenPipe over {'HTTP/2' if HTTP2_AVAILABLE else 'HTTP/1.1'})"]
+        for name, stats in http_clients.summary().items():
+            lines.append(
+                f"`{name}`: {stats['requests']} requests, {stats['new_connections']} new connections, "
+                f"{stats['reused_connections']} reused ({stats['reuse_rate']:.0%})"
+            )
+        await ctx.send("\n".join(lines))
+
+    @commands.command(name='queues')
+    @commands.has_permissions(manage_guild=True)
+    async def queues_command(self, ctx):
+        """Show message queue depth and wait times for this guild"""
+        scheduler = getattr(self.bot, 'scheduler', None)
+        if not scheduler:
+            await ctx.send("Message scheduler is not enabled.")
+            return
+
+        # Other guilds' traffic is not this guild's managers' business
+        guild_key = str(ctx.guild.id) if ctx.guild else 'dm'
+        stats = scheduler.stats().get(guild_key)
+        lines = [f"**Message queue** (limit {scheduler.max_concurrent} global, {scheduler.max_per_guild} per guild)"]
+        if stats:
+            lines.append(
+                f"{stats['queued']} queued, {stats['in_flight']} in flight, "
+                f"avg wait {stats['avg_wait']:.2f}s (max {stats['max_wait']:.2f}s), "
+                f"{stats['coalesced']} coalesced, {stats['shed']} shed"
+            )
+        else:
+            lines.append("No messages queued here yet.")
+        await ctx.send("\n".join(lines))
     async def generate_response(self, message):
         """Generate a response using openrouter"""
         try:
@@ -84,11 +263,11 @@ class ManagementCog(BaseCog):
             guild_id = str(message.guild.id) if message.guild else None
 
             # Call API and return the stream directly
-            response_stream = await self.api_client.call_openpipe(
+            response_stream = await self.stream_completion(
+                message,
                 messages=messages,
                 model=self.model,
                 temperature=temperature,
-                stream=True,
                 provider="openrouter",
                 user_id=user_id,
                 guild_id=guild_id,
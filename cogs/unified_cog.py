@@ -6,14 +6,20 @@ from discord.ext import commands
 import logging
 import json
 import asyncio
-import aiohttp
 from datetime import datetime, timedelta
-from zoneinfo import ZoneInfo
-from typing import Optional, Dict, List, AsyncGenerator, Union
+from typing import Optional, Dict, List, AsyncGenerator, Union, Tuple
 import re
+import time
 from urllib.parse import urlparse
 from config.webhook_config import load_webhooks, MAX_RETRIES, WEBHOOK_TIMEOUT
 import backoff
+from shared.dedupe import ExpiringSet, ExpiringDict
+from shared.splitter import split_message
+from shared.prompts import prompt_registry, prompt_time
+from shared.models import model_registry
+from shared.http_clients import http_clients
+from shared.metrics import metrics, MESSAGES_TOTAL
+from shared.tracing import traced, stage_timer, observe_stage
 
 class RateLimitTracker:
     def __init__(self):
@@ -55,12 +61,12 @@ class UnifiedCog(commands.Cog):
         self.name = "UnifiedRouter"
         self.active_channels = set()
         self.webhooks = load_webhooks()
-        self.session = aiohttp.ClientSession()
         self.context_cog = bot.get_cog('ContextCog')
-        self.handled_messages = set()
+        self.handled_messages = ExpiringSet('UnifiedRouter.handled_messages', ttl=3600, maxsize=10000)
         self._image_processing_lock = asyncio.Lock()
-        self.last_model_used = {}  # Track last model per channel for loop prevention
+        self.last_model_used = ExpiringDict('UnifiedRouter.last_model_used', ttl=6 * 3600, maxsize=5000)  # Track last model per channel for loop prevention
         self.rate_limiter = RateLimitTracker()
+        self.route_timeout = 3.0  # Seconds before routing falls back to the default model
         
         # Get API client from bot instance
         self.api_client = getattr(bot, 'api_client', None)
@@ -68,127 +74,23 @@ class UnifiedCog(commands.Cog):
             logging.error("[UnifiedRouter] No API client found on bot")
             raise ValueError("Bot must have api_client attribute")
 
-        # Load temperature settings
-        try:
-            with open('temperatures.json', 'r') as f:
-                self.temperatures = json.load(f)
-        except Exception as e:
-            logging.error(f"[UnifiedRouter] Failed to load temperatures.json: {e}")
-            self.temperatures = {}
-
-        # Load system prompts
-        try:
-            with open('prompts/consolidated_prompts.json', 'r', encoding='utf-8') as f:
-                self.prompts = json.load(f).get('system_prompts', {})
-        except Exception as e:
-            logging.error(f"[UnifiedRouter] Failed to load prompts: {e}")
-            self.prompts = {}
-
-        # Comprehensive model configuration
-        self.model_config = {
-            'ministral': {
-                'name': 'Ministral',
-                'model': 'mistralai/ministral-3b',
-                'temperature': self.temperatures.get('Mixtral', 0.7),
-                'keywords': ['general', 'chat', 'conversation'],
-                'prompt_key': 'ministral',
-                'supports_vision': False,
-                'trigger_words': ['ministral']
-            },
-            'gemini': {
-                'name': 'Gemini',
-                'model': 'google/gemini-pro-1.5-exp',
-                'fallback_model': 'google/gemini-pro-1.5',
-                'temperature': self.temperatures.get('Gemini-Pro', 0.7),
-                'keywords': ['image', 'analyze', 'describe', 'visual'],
-                'prompt_key': 'gemini',
-                'supports_vision': True,
-                'trigger_words': ['gemini']
-            },
-            'sonnet': {
-                'name': 'Sonnet',
-                'model': 'anthropic/claude-3-5-sonnet:beta',
-                'temperature': self.temperatures.get('Claude-3.5-Sonnet', 0.85),
-                'keywords': ['code', 'technical', 'programming', 'development'],
-                'prompt_key': 'sonnet',
-                'supports_vision': False,
-                'trigger_words': ['sonnet']
-            },
-            'goliath': {
-                'name': 'Goliath',
-                'model': 'alpindale/goliath-120b',
-                'temperature': self.temperatures.get('Goliath', 0.8),
-                'keywords': ['complex', 'detailed', 'analysis', 'research'],
-                'prompt_key': 'goliath',
-                'supports_vision': False,
-                'trigger_words': ['120b', 'goliath']
-            },
-            'sonar': {
-                'name': 'Sonar',
-                'model': 'perplexity/llama-3.1-sonar-small-128k-online',
-                'fallback_model': 'perplexity/llama-3.1-sonar-large-128k-online',
-                'temperature': self.temperatures.get('Sonar', 0.7),
-                'keywords': ['news', 'current', 'events', 'updates'],
-                'prompt_key': 'sonar',
-                'supports_vision': False,
-                'trigger_words': ['sonar']
-            },
-            'hermes': {
-                'name': 'Hermes',
-                'model': 'nousresearch/hermes-3-llama-3.1-405b:free',
-                'fallback_model': 'nousresearch/hermes-3-llama-3.1-405b',
-                'temperature': self.temperatures.get('Hermes', 0.7),
-                'keywords': ['help', 'support', 'guidance', 'advice'],
-                'prompt_key': 'hermes',
-                'supports_vision': False,
-                'trigger_words': ['hermes']
-            },
-            'sorcerer': {
-                'name': 'Sorcerer',
-                'model': 'raifle/sorcererlm-8x22b',
-                'temperature': self.temperatures.get('Sorcerer', 0.7),
-                'keywords': ['creative', 'story', 'roleplay', 'fantasy'],
-                'prompt_key': 'sorcerer',
-                'supports_vision': False,
-                'trigger_words': ['sorcerer', 'sorcererlm']
-            },
-            'sydney': {
-                'name': 'Sydney',
-                'model': 'meta-llama/llama-3.1-405b-instruct:free',
-                'fallback_model': 'meta-llama/llama-3.1-405b-instruct',
-                'temperature': self.temperatures.get('Sydney', 0.7),
-                'keywords': ['chat', 'friendly', 'casual', 'social'],
-                'prompt_key': 'sydney',
-                'supports_vision': False,
-                'trigger_words': ['syd', 'sydney']
-            },
-            'dolphin': {
-                'name': 'Dolphin',
-                'model': 'cognitivecomputations/dolphin-mixtral-8x22b',
-                'temperature': self.temperatures.get('Dolphin', 0.7),
-                'keywords': ['uncensored', 'mature', 'controversial'],
-                'prompt_key': 'dolphin',
-                'supports_vision': False,
-                'trigger_words': ['dolphin']
-            }
-        }
-
-        # Build bypass keywords from all trigger words
-        all_trigger_words = []
-        for config in self.model_config.values():
-            all_trigger_words.extend(config['trigger_words'])
-        
-        self.bypass_keywords = [
-            r'\b(use|switch to|try|with)\s+(' + '|'.join(all_trigger_words) + r')\b',
-            r'\b(' + '|'.join(all_trigger_words) + r')\s+(please|now|instead)\b',
-            r'^(' + '|'.join(all_trigger_words) + r')[,:]\s',
-            r'\b(' + '|'.join(all_trigger_words) + r')\b'
-        ]
+        # Load the model registry now so a broken models.json fails at startup
+        model_registry.snapshot
 
         # Context window settings
         self.default_context_window = 50
         self.max_context_window = 500
         self.context_windows = {}  # Track custom context windows per channel
+        self.context_anchors = ExpiringDict('UnifiedRouter.context_anchors', ttl=6 * 3600, maxsize=5000)  # First message of each channel's cached window
+
+    @property
+    def model_config(self) -> Dict[str, Dict]:
+        """Models from the current registry snapshot"""
+        return model_registry.snapshot.models
+
+    @property
+    def bypass_keywords(self) -> List[str]:
+        return model_registry.snapshot.bypass_keywords
 
     async def handle_rate_limit(self, model: str, retry_after: float):
         """Handle rate limit response"""
@@ -226,8 +128,8 @@ class UnifiedCog(commands.Cog):
                 )
                 
                 async for chunk in response:
-                    if chunk and 'content' in chunk:
-                        yield chunk['content']
+                    if chunk:
+                        yield chunk
                         
                 # Success, reset backoff
                 self.rate_limiter.reset_backoff(model)
@@ -246,70 +148,64 @@ class UnifiedCog(commands.Cog):
                         continue
                     raise
 
-    async def determine_route(self, message: discord.Message) -> Dict:
+    async def determine_route(self, message: discord.Message, full_content: Optional[str] = None) -> Dict:
         """Two-step routing process"""
+        message_content = full_content or message.content
+        # Route with one snapshot even if the registry reloads meanwhile
+        models = model_registry.snapshot
         try:
             # Check for direct model mentions first
-            content = message.content.lower()
-            for model_id, config in self.model_config.items():
-                if any(word in content for word in config['trigger_words']):
-                    return config
+            config = models.match_trigger(message_content)
+            if config:
+                return config
 
             # Check for images - route to vision-capable model
             if await self.get_image_urls(message):
-                return self.model_config['gemini']
+                return models.vision
 
-            # Format the routing prompt exactly as in router_cog.py
-            routing_prompt = f"""Analyze this message and route it to the most appropriate model based on content. Return ONLY the model name, no explanation.
+            # Routing prompt; the answer is constrained to a JSON object naming one model
+            routing_prompt = f"""Analyze this message and route it to the most appropriate model based on content.
 
-Message: "{message.content}"
+Message: "{message_content}"
 
 Available Models:
-1. Sonar - Current events, news, updates, time-sensitive info
-2. Dolphin - Uncensored topics, mature content, controversial subjects
-3. Hermes - Mental health, crisis support, emotional guidance
-4. Sorcerer - Fantasy roleplay, character immersion, standard RP
-5. Goliath - Long-form stories, detailed plots, epic narratives
-6. Sydney - Emotional support, friendship, daily life chat
-7. Sonnet - Technical tasks, coding, software engineering
-8. Ministral - Default for general conversation
-
-Model name:"""
-
-            # Make routing request to Ministral with NO context
+{models.routing_list}
+
+Reply with JSON: {{"label": "<model name>", "confidence": <0 to 1>}}"""
+
+            # Classify with the router model, with NO context
             messages = [
-                {"role": "system", "content": "You are a message routing assistant. Return only the model name."},
+                {"role": "system", "content": "You are a message routing assistant. Return only the JSON route."},
                 {"role": "user", "content": routing_prompt}
             ]
-
-            # Get routing response
-            response = ""
-            async for chunk in await self.make_api_request(
+            decision = await self.api_client.classify(
                 messages=messages,
-                model_config=self.model_config['ministral'],
-                stream=False
-            ):
-                response += chunk
+                model=models.router['model'],
+                labels=models.routing_labels,
+                timeout=self.route_timeout
+            )
+            logging.debug(
+                f"[UnifiedRouter] Routed to {decision['label']} with confidence {decision['confidence']:.2f} "
+                f"({decision['source']}, {decision['latency'] * 1000:.0f} ms)"
+            )
 
-            # Clean up response and get model config
-            model_name = response.strip().lower()
-            for config in self.model_config.values():
-                if config['name'].lower() == model_name:
-                    if not self.check_routing_loop(message.channel.id, config['name']):
-                        return config
+            config = models.by_name(decision['label']) if decision['label'] else None
+            if config and not self.check_routing_loop(message.channel.id, config['name']):
+                return config
 
-            return self.model_config['ministral']
+            return models.default
 
         except Exception as e:
             logging.error(f"[UnifiedRouter] Error determining route: {e}")
-            return self.model_config['ministral']
+            return models.default
 
-    async def format_messages_for_context(self, message: discord.Message, model_config: Dict) -> List[Dict]:
+    async def format_messages_for_context(self, message: discord.Message, model_config: Dict, full_content: Optional[str] = None) -> List[Dict]:
         """Format messages including context window for API request"""
         messages = []
+        message_content = full_content or message.content
         
         # Add system prompt
-        system_prompt = self.format_system_prompt(message, model_config)
+        system_prompt, volatile_note = self.format_system_prompt(message, model_config)
         messages.append({"role": "system", "content": system_prompt})
         
         # Get context window size for this channel
@@ -319,30 +215,35 @@ Model name:"""
         # Get context messages
         if self.context_cog:
             try:
-                context = await self.context_cog.get_context_messages(
-                    str(message.channel.id),
-                    limit=context_size,
-                    exclude_message_id=str(message.id)
-                )
-                for ctx_msg in context:
+                with stage_timer('context', model_config['name']):
+                    context = await self.context_cog.get_context_messages(
+                        str(message.channel.id),
+                        limit=context_size,
+                        exclude_message_id=str(message.id)
+                    )
+                for ctx_msg in self.anchor_context(str(message.channel.id), context):
                     role = "assistant" if ctx_msg['is_assistant'] else "user"
                     messages.append({"role": role, "content": ctx_msg['content']})
+                # Messages merged into full_content are already in the context as their own rows
+                message_content = message.content
             except Exception as e:
                 logging.error(f"[UnifiedRouter] Failed to get context: {e}")
 
         # Handle current message content
         content = []
         
-        # Add text content if present
-        if message.content:
+        # Add text content if present, after the volatile note so everything before it can be cached
+        text = "\n".join(part for part in (volatile_note, message_content) if part)
+        if text:
             content.append({
                 "type": "text",
-                "text": message.content
+                "text": text
             })
             
         # Add images if present and model supports vision
         if model_config.get('supports_vision', False):
-            image_urls = await self.get_image_urls(message)
+            with stage_timer('images', model_config['name']):
+                image_urls = await self.get_image_urls(message)
             for url in image_urls:
                 content.append({
                     "type": "image_url",
@@ -357,17 +258,17 @@ Model name:"""
             
         return messages
 
-    async def generate_response(self, message: discord.Message, model_config: Dict) -> AsyncGenerator[str, None]:
+    async def generate_response(self, message: discord.Message, model_config: Dict, full_content: Optional[str] = None) -> AsyncGenerator[str, None]:
         """Generate response using OpenRouter API"""
         try:
             # Start typing indicator
             await message.channel.typing()
             
             # Format messages with context
-            messages = await self.format_messages_for_context(message, model_config)
+            messages = await self.format_messages_for_context(message, model_config, full_content)
             
             # Generate response
-            async for chunk in await self.make_api_request(
+            async for chunk in self.make_api_request(
                 messages=messages,
                 model_config=model_config,
                 stream=True
@@ -385,7 +286,7 @@ Model name:"""
             return False
 
         try:
-            async with self.session.post(
+            async with http_clients.session('discord_webhooks').post(
                 webhook_url,
                 json={"content": content, "username": username},
                 timeout=WEBHOOK_TIMEOUT
@@ -404,42 +305,60 @@ Model name:"""
             logging.error(f"[UnifiedRouter] Error sending to webhook: {e}")
             return False
 
-    async def handle_message(self, message: discord.Message):
+    @traced
+    async def handle_message(self, message: discord.Message, full_content: Optional[str] = None):
         """Process message and send response"""
+        started = time.perf_counter()
+        model_name = 'unrouted'
         try:
             # Determine appropriate model
-            model_config = await self.determine_route(message)
+            model_config = await self.determine_route(message, full_content)
+            model_name = model_config['name']
+            observe_stage('route', time.perf_counter() - started, model_name)
+
+            # Open a context stream for the reply
+            stream_id = None
+            if self.context_cog:
+                stream_id = self.context_cog.begin_stream(
+                    str(message.channel.id),
+                    str(message.guild.id) if message.guild else None,
+                    str(self.bot.user.id),
+                    model_config['name']
+                )
             
             # Generate response
             response = ""
-            async for chunk in self.generate_response(message, model_config):
+            generate_started = time.perf_counter()
+            async for chunk in self.generate_response(message, model_config, full_content):
                 if chunk:
+                    if not response:
+                        observe_stage('first_token', time.perf_counter() - generate_started, model_name)
                     response += chunk
-                    
+                    if stream_id:
+                        await self.context_cog.append_to_stream(stream_id, chunk)
+            observe_stage('generate', time.perf_counter() - generate_started, model_name)
+
             # Create webhook URL for this response
-            webhook = await message.channel.create_webhook(name=model_config['name'])
-            try:
-                await webhook.send(content=response)
-            finally:
-                await webhook.delete()
+            with stage_timer('deliver', model_name):
+                webhook = await message.channel.create_webhook(name=model_config['name'])
+                try:
+                    for page in split_message(response):
+                        sent_message = await webhook.send(content=page, wait=True)
+                finally:
+                    await webhook.delete()
                 
-            # Add to context
-            if self.context_cog:
+            # Commit the assembled reply to context
+            if stream_id:
                 try:
-                    await self.context_cog.add_message_to_context(
-                        message.id,
-                        str(message.channel.id),
-                        str(message.guild.id) if message.guild else None,
-                        str(message.author.id),
-                        response,
-                        True,
-                        model_config['name'],
-                        None
-                    )
+                    await self.context_cog.commit_stream(stream_id, sent_message.id if sent_message else None)
                 except Exception as e:
                     logging.error(f"[UnifiedRouter] Failed to add to context: {e}")
 
+            observe_stage('total', time.perf_counter() - started, model_name)
+            metrics.inc(MESSAGES_TOTAL, cog=self.name, outcome='ok')
+
         except Exception as e:
+            metrics.inc(MESSAGES_TOTAL, cog=self.name, outcome='error')
             logging.error(f"[UnifiedRouter] Error handling message: {e}")
             await message.channel.send(f"❌ Error: {str(e)}")
 
@@ -490,22 +409,22 @@ Model name:"""
         self.last_model_used.pop(f"{ctx.channel.id}_count", None)
         await ctx.send("UnifiedRouter deactivated in this channel.")
 
-    @commands.Cog.listener()
     async def on_message(self, message):
-        """Handle incoming messages"""
+        """Handle incoming messages routed by the bot"""
         if not self.should_handle_message(message):
             return
             
         try:
             self.handled_messages.add(message.id)
-            await self.handle_message(message)
+            # Queue behind earlier messages in this channel instead of blocking the gateway task
+            scheduler = getattr(self.bot, 'scheduler', None)
+            if scheduler:
+                scheduler.submit(message, self.handle_message, key=self.name)
+            else:
+                await self.handle_message(message)
         except Exception as e:
             logging.error(f"[UnifiedRouter] Error in on_message: {e}")
 
-    def cog_unload(self):
-        """Cleanup when cog is unloaded"""
-        asyncio.create_task(self.session.close())
-
     async def get_image_urls(self, message: discord.Message) -> List[str]:
         """Get image URLs from message attachments and embeds"""
         urls = []
@@ -543,27 +462,46 @@ Model name:"""
         self.last_model_used[channel_id] = model_name
         return False
 
-    def format_system_prompt(self, message: discord.Message, model_config: Dict) -> str:
-        """Format system prompt with variables"""
+    def anchor_context(self, channel_id: str, context: List[Dict]) -> List[Dict]:
+        """Keep the context window's first message fixed across turns so the request prefix stays cacheable.
+
+        Instead of sliding by one message every turn, the window keeps its
+        start until the anchor falls out of the fetched history, then jumps
+        forward by a quarter of the window.
+        """
+        anchor = self.context_anchors.get(channel_id)
+        for index, ctx_msg in enumerate(context):
+            if ctx_msg['id'] == anchor:
+                return context[index:]
+        # A missing anchor has scrolled out of the fetched history, so the window is full
+        start = len(context) // 4 if anchor is not None else 0
+        if context:
+            self.context_anchors[channel_id] = context[start]['id']
+        return context[start:]
+
+    def format_system_prompt(self, message: discord.Message, model_config: Dict) -> Tuple[str, str]:
+        """Format system prompt with variables, returning (cacheable prompt, volatile note)"""
         try:
-            prompt_template = self.prompts.get(model_config['prompt_key'], "")
-            
-            # Get timezone-aware current time
-            current_time = datetime.now(ZoneInfo('America/Los_Angeles'))
-            
-            # Format variables
-            return prompt_template.format(
+            # Channel overrides from !set_system_prompt win over the model's template
+            prompt_template = prompt_registry.get(
+                model_config['prompt_key'], model_config['name'],
+                channel_id=message.channel.id,
+                default=""
+            )
+
+            # Format variables; the time and speaker go in the note so the prompt stays cacheable
+            return prompt_template.render_cacheable(
                 MODEL_ID=model_config['name'],
                 USERNAME=message.author.display_name,
                 DISCORD_USER_ID=message.author.id,
-                TIME=current_time.strftime("%I:%M %p"),
+                TIME=prompt_time(),
                 TZ="PST",
                 SERVER_NAME=message.guild.name if message.guild else "DM",
                 CHANNEL_NAME=message.channel.name if hasattr(message.channel, 'name') else "DM"
             )
         except Exception as e:
             logging.error(f"[UnifiedRouter] Error formatting system prompt: {e}")
-            return f"You are {model_config['name']}, chatting with {message.author.display_name}."
+            return f"You are {model_config['name']}, chatting with {message.author.display_name}.", ""
 
 async def setup(bot):
     """Add UnifiedRouter cog to bot"""
@@ -14,6 +14,9 @@ CREATE TABLE IF NOT EXISTS messages (
     FOREIGN KEY (parent_message_id) REFERENCES messages(id)
 );
 
+-- messages_fts, the full-text index of messages.content, and its triggers are created by
+-- shared/log_explorer.ensure_search_schema
+
 -- Context windows configuration
 CREATE TABLE IF NOT EXISTS context_windows (
     channel_id TEXT PRIMARY KEY,
@@ -42,7 +45,53 @@ CREATE TABLE IF NOT EXISTS logs (
     tags TEXT,
     user_id TEXT,
     guild_id TEXT,
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    codec TEXT,  -- Compression of request_blob/response_blob, request and response are empty when set
+    request_blob BLOB,
+    response_blob BLOB,
+    model TEXT,
+    stream INTEGER,
+    first_token_ms INTEGER,  -- Request sent to first streamed chunk
+    duration_ms INTEGER,  -- Request sent to last chunk or full response
+    chunk_count INTEGER,
+    gap_mean_ms REAL,  -- Between consecutive streamed chunks
+    gap_max_ms INTEGER,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    cached_tokens INTEGER,
+    completion_hash TEXT,  -- SHA-256 of the completion text
+    trace_id TEXT  -- Trace of the Discord message that caused the call
+);
+
+-- Logged messages, stored once per distinct content and referenced from logs by hash
+CREATE TABLE IF NOT EXISTS log_blobs (
+    hash TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+
+-- Per-minute, per-hour and per-day aggregates of logs and messages, maintained by shared/rollups.py
+CREATE TABLE IF NOT EXISTS rollups (
+    resolution INTEGER NOT NULL,  -- Bucket width in seconds: 60, 3600 or 86400
+    bucket INTEGER NOT NULL,  -- Bucket start, epoch seconds
+    source TEXT NOT NULL,  -- logs or messages
+    model TEXT NOT NULL DEFAULT '',
+    guild_id TEXT NOT NULL DEFAULT '',
+    persona TEXT NOT NULL DEFAULT '',
+    count INTEGER NOT NULL,
+    errors INTEGER NOT NULL DEFAULT 0,  -- Logged calls with status_code 400 or above
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    latency TEXT,  -- LatencySketch bins of duration_ms
+    first_token TEXT,  -- LatencySketch bins of first_token_ms
+    PRIMARY KEY (resolution, bucket, source, model, guild_id, persona)
+);
+
+-- Last row id of each source already counted in rollups
+CREATE TABLE IF NOT EXISTS rollup_state (
+    source TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
 );
 
 -- Create indexes for better query performance
@@ -50,6 +99,7 @@ CREATE INDEX IF NOT EXISTS idx_messages_channel ON messages(channel_id);
 CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp);
 CREATE INDEX IF NOT EXISTS idx_messages_user ON messages(user_id);
 CREATE INDEX IF NOT EXISTS idx_messages_persona ON messages(persona_name);
+CREATE INDEX IF NOT EXISTS idx_messages_guild ON messages(guild_id);
 CREATE INDEX IF NOT EXISTS idx_messages_discord_id ON messages(discord_message_id);  -- Added index for Discord message ID
 CREATE INDEX IF NOT EXISTS idx_summaries_channel ON chat_summaries(channel_id);
 CREATE INDEX IF NOT EXISTS idx_summaries_timestamp ON chat_summaries(end_timestamp);
@@ -36,7 +36,7 @@ def stream_output(process, name):
         logger.error(f"{name} error: {line.strip()}")
 
 def run_processes():
-    """Run both web server and discord bot processes with proper handling."""
+    """Run the web server, which hosts the discord bot in its event loop, with proper handling."""
     # Create logs directory if it doesn't exist
     os.makedirs('logs', exist_ok=True)
     
@@ -56,9 +56,10 @@ def run_processes():
     
     processes = []
     output_threads = []
+    failed = False
     try:
-        # Start web server first
-        logger.info("Starting web server...")
+        # Start web server; it starts the bot once it is serving
+        logger.info("Starting web server and Discord bot...")
         web_process = subprocess.Popen(
             [sys.executable, 'web.py'],
             stdout=subprocess.PIPE,
@@ -91,23 +92,6 @@ def run_processes():
             logger.error("Web server failed to respond in time")
             return
         
-        # Start Discord bot
-        logger.info("Starting Discord bot...")
-        bot_process = subprocess.Popen(
-            [sys.executable, 'bot.py'],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-            bufsize=1  # Line buffered
-        )
-        processes.append(('bot', bot_process))
-        
-        # Start output streaming thread for bot
-        bot_thread = threading.Thread(target=stream_output, args=(bot_process, 'bot'))
-        bot_thread.daemon = True
-        bot_thread.start()
-        output_threads.append(bot_thread)
-        
         # Monitor processes
         while True:
             for name, process in processes:
@@ -121,6 +105,7 @@ def run_processes():
         logger.info("\nReceived shutdown signal...")
     except Exception as e:
         logger.error(f"Error occurred: {e}")
+        failed = True
     finally:
         # Graceful shutdown
         logger.info("Shutting down processes...")
@@ -139,5 +124,9 @@ def run_processes():
                     process.wait()
         logger.info("All processes terminated.")
 
+    if failed:
+        # Exit non-zero so the container's restart policy brings the bot back
+        sys.exit(1)
+
 if __name__ == '__main__':
     run_processes()
@@ -0,0 +1,54 @@
+"""
+Benchmark per-message overhead of the MessageRouter against awaiting handlers directly.
+Run from the repository root: python scripts/benchmark_dispatch.py
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.dispatcher import MessageRouter
+
+MESSAGES = 20000
+
+class FakeMessage:
+    def __init__(self, message_id):
+        self.id = message_id
+
+async def noop_handler(message):
+    """Handler that does no work, so only dispatch cost is measured"""
+    return None
+
+async def bench_direct(handler_count):
+    """Baseline: await each handler serially, as bot.on_message used to"""
+    handlers = [noop_handler] * handler_count
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        message = FakeMessage(i)
+        for handler in handlers:
+            await handler(message)
+    return (time.perf_counter() - start) / MESSAGES
+
+async def bench_router(handler_count):
+    """MessageRouter with per-handler timeouts and isolation"""
+    router = MessageRouter()
+    for i in range(handler_count):
+        router.register(f"handler_{i}", noop_handler)
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        await router.dispatch(FakeMessage(i))
+    return (time.perf_counter() - start) / MESSAGES
+
+async def main():
+    logging.disable(logging.CRITICAL)
+    print(f"{'handlers':>8} {'direct (us)':>12} {'router (us)':>12} {'overhead (us)':>14}")
+    for handler_count in (1, 3, 5, 10):
+        direct = await bench_direct(handler_count)
+        routed = await bench_router(handler_count)
+        print(f"{handler_count:>8} {direct * 1e6:>12.2f} {routed * 1e6:>12.2f} {(routed - direct) * 1e6:>14.2f}")
+
+if __name__ == '__main__':
+    asyncio.run(main())
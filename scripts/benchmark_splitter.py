@@ -0,0 +1,81 @@
+"""
+Benchmark MessageSplitter throughput on multi-megabyte replies.
+Run from the repository root: python scripts/benchmark_splitter.py
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.splitter import DISCORD_MESSAGE_LIMIT, MessageSplitter, split_message
+
+PREFIX = "[Benchmark] "
+WORDS = ["the", "model", "streams", "tokens", "quickly", "into", "discord", "\n", "\n\n", "- item"]
+
+def make_reply(size, seed=0):
+    """Prose with a fenced code block every few paragraphs"""
+    rnd = random.Random(seed)
+    parts = []
+    length = 0
+    while length < size:
+        if rnd.random() < 0.02:
+            block = "```python\n" + "".join(f"    value_{i} = compute({i})\n" for i in range(rnd.randint(5, 150))) + "```\n"
+            parts.append(block)
+            length += len(block)
+        else:
+            word = rnd.choice(WORDS)
+            parts.append(word if word.startswith("\n") else word + " ")
+            length += len(parts[-1])
+    return "".join(parts)
+
+def tokenize(text, seed=0):
+    """Cut text into token-sized chunks like a streaming API would"""
+    rnd = random.Random(seed)
+    chunks = []
+    pos = 0
+    while pos < len(text):
+        size = rnd.randint(1, 12)
+        chunks.append(text[pos:pos + size])
+        pos += size
+    return chunks
+
+def check(pages):
+    """Pages fit the limit, keep the prefix and never leave a code fence open"""
+    for page in pages:
+        assert len(page) <= DISCORD_MESSAGE_LIMIT, len(page)
+        assert page.startswith(PREFIX)
+        assert page.count("```") % 2 == 0, page[:80]
+
+def bench_stream(chunks):
+    splitter = MessageSplitter(PREFIX)
+    pages = []
+    start = time.perf_counter()
+    for i, chunk in enumerate(chunks):
+        pages.extend(splitter.feed(chunk))
+        # The renderer reads the tail page on every paced edit
+        if i % 50 == 0:
+            splitter.page
+    pages.append(splitter.finish())
+    return time.perf_counter() - start, pages
+
+def bench_whole(text):
+    start = time.perf_counter()
+    pages = split_message(text, PREFIX)
+    return time.perf_counter() - start, pages
+
+def main():
+    print(f"{'size (MB)':>9} {'pages':>6} {'stream (MB/s)':>14} {'whole (MB/s)':>13}")
+    for megabytes in (1, 2, 4, 8):
+        text = make_reply(megabytes * 1024 * 1024, seed=megabytes)
+        chunks = tokenize(text, seed=megabytes)
+        stream_time, stream_pages = bench_stream(chunks)
+        whole_time, whole_pages = bench_whole(text)
+        check(stream_pages)
+        check(whole_pages)
+        size = len(text) / (1024 * 1024)
+        print(f"{size:>9.1f} {len(stream_pages):>6} {size / stream_time:>14.2f} {size / whole_time:>13.2f}")
+
+if __name__ == '__main__':
+    main()
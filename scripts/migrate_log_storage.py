@@ -0,0 +1,54 @@
+"""
+Convert interaction logs to the compact storage format and report the size reduction.
+Run from the repository root: python scripts/migrate_log_storage.py [--vacuum] [database]
+"""
+import os
+import sys
+import time
+import sqlite3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.log_store import LogStore, storage_report
+
+DEFAULT_DATABASE = 'databases/interaction_logs.db'
+
+def megabytes(size):
+    return f"{size / (1024 * 1024):.2f} MB"
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    vacuum = '--vacuum' in sys.argv[1:]
+    database = args[0] if args else DEFAULT_DATABASE
+    if not os.path.exists(database):
+        print(f"Database not found: {database}")
+        sys.exit(1)
+
+    file_size_before = os.path.getsize(database)
+    conn = sqlite3.connect(database)
+    store = LogStore()
+    start = time.perf_counter()
+    stats = store.migrate(conn)
+    elapsed = time.perf_counter() - start
+
+    print(f"Migrated {stats['rows']} rows in {elapsed:.1f}s using {store.codec}")
+    if stats['rows']:
+        compact = stats['compact_bytes'] + stats['new_blob_bytes']
+        print(f"  payloads: {megabytes(stats['original_bytes'])} -> {megabytes(compact)} "
+              f"({compact / stats['original_bytes']:.1%} of original)")
+
+    report = storage_report(conn)
+    print(f"Compact rows: {report['compact_rows']} ({megabytes(report['compact_bytes'])}), "
+          f"unconverted rows: {report['legacy_rows']} ({megabytes(report['legacy_bytes'])})")
+    print(f"Distinct messages: {report['message_blobs']} "
+          f"({megabytes(report['message_blob_raw_bytes'])} stored as {megabytes(report['message_blob_bytes'])})")
+
+    if vacuum:
+        conn.execute("VACUUM")
+    conn.close()
+    file_size_after = os.path.getsize(database)
+    print(f"Database file: {megabytes(file_size_before)} -> {megabytes(file_size_after)}"
+          + ("" if vacuum else " (run with --vacuum to release freed pages)"))
+
+if __name__ == '__main__':
+    main()
@@ -5,7 +5,10 @@ import json
 import asyncio
 import sqlite3
 import base64
-from typing import Dict, Any, List, Union, AsyncGenerator, Optional
+import copy
+import hashlib
+from types import MappingProxyType
+from typing import Dict, Any, List, Union, AsyncGenerator, Optional, NamedTuple, Tuple, Mapping
 import aiohttp
 import backoff
 from contextlib import asynccontextmanager
@@ -13,6 +16,13 @@ from urllib.parse import urlparse, urljoin
 from config import OPENPIPE_API_KEY, OPENPIPE_API_URL, HELICONE_API_KEY
 from openai import AsyncOpenAI
 from concurrent.futures import ThreadPoolExecutor
+from shared.metrics import (
+    RequestTiming, metrics, CLASSIFY_SECONDS, FIRST_TOKEN_SECONDS, COMPLETION_SECONDS,
+    COMPLETIONS_TOTAL, TOKENS_TOTAL
+)
+from shared.http_clients import http_clients
+from shared.log_store import log_store, ensure_log_schema, METRIC_COLUMNS
+from shared.tracing import tracer
 
 # Create required directories before configuring logging
 os.makedirs('logs', exist_ok=True)
@@ -29,6 +39,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Upstreams that only cache prompts at explicit cache_control breakpoints; others cache prefixes automatically
+CACHE_CONTROL_PREFIXES = ('anthropic/', 'google/gemini')
+
+class PreparedRequest(NamedTuple):
+    """A validated chat completion request, built once and reused by retries and fallbacks
+
+    Headers and tags are read-only views and messages are only handed out as deep copies,
+    so a retry or fallback always sends what was validated.
+    """
+    model: str
+    provider: Optional[str]
+    openpipe_model: str
+    messages: Tuple[Dict, ...]
+    temperature: Optional[float]
+    max_tokens: Optional[int]
+    extra_headers: Mapping[str, str]
+    tags: Mapping[str, Optional[str]]
+
+    def create_kwargs(self, stream: bool) -> Dict[str, Any]:
+        """Arguments for chat.completions.create"""
+        kwargs = {
+            'model': self.openpipe_model,
+            'messages': copy.deepcopy(list(self.messages)),
+            'temperature': self.temperature if self.temperature is not None else 0.7,
+            'max_tokens': self.max_tokens if self.max_tokens is not None else 1000,
+            'store': True,
+            'extra_headers': dict(self.extra_headers)
+        }
+        if stream:
+            kwargs['stream'] = True
+            kwargs['extra_body'] = {"stream_options": {"include_usage": True}}
+        return kwargs
+
+    def report_payload(self) -> Dict[str, Any]:
+        """Request as recorded by API.report"""
+        return {
+            "model": self.openpipe_model,
+            "messages": copy.deepcopy(list(self.messages)),
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens
+        }
+
 class DatabasePool:
     def __init__(self, database_path: str, max_connections: int = 10):
         self.database_path = database_path
@@ -62,16 +114,6 @@ class API:
         # Initialize database pool
         self.db_pool = DatabasePool('databases/interaction_logs.db')
         
-        # Initialize aiohttp session with custom headers and timeout
-        timeout = aiohttp.ClientTimeout(total=30, connect=10, sock_read=10)
-        self.session = aiohttp.ClientSession(
-            headers={
-                'HTTP-Referer': 'https://github.com/gwyntel/SplinterTreev4',
-                'X-Title': 'splintertree by GwynTel'
-            },
-            timeout=timeout
-        )
-        
         # Prepare Helicone headers
         helicone_headers = {
             'HTTP-Referer': 'https://github.com/gwyntel/SplinterTreev4',
@@ -79,24 +121,36 @@ class API:
             'Helicone-Auth': f'Bearer {HELICONE_API_KEY}' if HELICONE_API_KEY else None,
             'Helicone-Cache-Enabled': 'true'
         }
-        helicone_headers = {k: v for k, v in helicone_headers.items() if v is not None}
+        self.helicone_headers = {k: v for k, v in helicone_headers.items() if v is not None}
         
-        # Initialize OpenPipe client with custom headers including Helicone
-        self.openpipe_client = AsyncOpenAI(
-            api_key=OPENPIPE_API_KEY,
-            base_url=OPENPIPE_API_URL,
-            default_headers=helicone_headers,
-            timeout=30.0
-        )
+        # OpenPipe client, built on first use over the shared connection pool
+        self._openpipe_client = None
+        self._openpipe_http = None
 
         # Rate limiting
         self.rate_limit_lock = asyncio.Lock()
         self.last_request_time = 0
         self.min_request_interval = 0.1  # 100ms between requests
+        self.classify_latency = metrics.histogram(CLASSIFY_SECONDS)
 
         # Initialize database schema
         self._init_db()
 
+    @property
+    def openpipe_client(self) -> AsyncOpenAI:
+        """OpenPipe client with custom headers including Helicone, rebuilt if the shared pool was closed and reopened"""
+        http_client = http_clients.openpipe
+        if self._openpipe_client is None or http_client is not self._openpipe_http:
+            self._openpipe_http = http_client
+            self._openpipe_client = AsyncOpenAI(
+                api_key=OPENPIPE_API_KEY,
+                base_url=OPENPIPE_API_URL,
+                default_headers=self.helicone_headers,
+                timeout=30.0,
+                http_client=http_client
+            )
+        return self._openpipe_client
+
     def _init_db(self):
         """Initialize database schema"""
         try:
@@ -112,6 +166,7 @@ class API:
                         if statement:
                             cursor.execute(statement)
                     conn.commit()
+                    ensure_log_schema(conn)
             
             # Run schema initialization in event loop
             loop = asyncio.get_event_loop()
@@ -130,7 +185,7 @@ class API:
         )
         async def _download():
             try:
-                async with self.session.get(url, timeout=10) as response:
+                async with http_clients.session('discord_cdn').get(url, timeout=10) as response:
                     if response.status == 200:
                         return await response.read()
                     logger.error(f"[API] Failed to download image. Status code: {response.status}")
@@ -206,6 +261,49 @@ class API:
         
         return normalized_messages
 
+    def _apply_cache_control(self, messages: List[Dict], model: str) -> List[Dict]:
+        """Mark the system prompt and the end of the history as prompt cache breakpoints"""
+        if not model.replace('openrouter:', '').startswith(CACHE_CONTROL_PREFIXES) or len(messages) < 2:
+            return messages
+
+        breakpoints = {len(messages) - 2}
+        if messages[0]['role'] == 'system':
+            breakpoints.add(0)
+
+        marked = list(messages)
+        for index in breakpoints:
+            content = marked[index]['content']
+            if isinstance(content, str):
+                if not content:
+                    continue
+                content = [{"type": "text", "text": content}]
+            else:
+                content = [dict(item) for item in content]
+            text_items = [item for item in content if item.get('type') == 'text']
+            if not text_items:
+                continue
+            text_items[-1]['cache_control'] = {"type": "ephemeral"}
+            marked[index] = {**marked[index], 'content': content}
+        return marked
+
+    @staticmethod
+    def _prompt_cache_usage(usage) -> Dict[str, int]:
+        """Cached and uncached input tokens from an OpenAI-style usage object"""
+        if usage is None:
+            return {}
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        if isinstance(details, dict):
+            cached_tokens = details.get('cached_tokens') or 0
+        else:
+            cached_tokens = getattr(details, 'cached_tokens', 0) or 0
+        return {
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "uncached_tokens": prompt_tokens - cached_tokens,
+            "completion_tokens": getattr(usage, 'completion_tokens', 0) or 0
+        }
+
     def _get_prefixed_model(self, model: str, provider: str = None) -> str:
         """Get the appropriate model name with prefix based on provider"""
         if provider == 'openrouter':
@@ -224,218 +322,223 @@ class API:
                 await asyncio.sleep(self.min_request_interval - time_since_last)
             self.last_request_time = time.time()
 
-    async def _stream_openpipe_request(self, messages, model, temperature, max_tokens, provider=None, user_id=None, guild_id=None, prompt_file=None, model_cog=None):
-        """Stream responses from OpenPipe API with improved error handling"""
-        logger.debug(f"[API] Making OpenPipe streaming request to model: {model}")
-        
-        try:
-            await self._enforce_rate_limit()
-            
-            openpipe_model = self._get_prefixed_model(model, provider)
-            validated_messages = await self._validate_message_roles(messages)
-            
-            extra_headers = {
-                'HTTP-Referer': 'https://github.com/gwyntel/SplinterTreev4',
-                'X-Title': 'splintertree by GwynTel',
-                'Helicone-Property-UserID': str(user_id) if user_id else None,
-                'Helicone-Property-GuildID': str(guild_id) if guild_id else None,
-                'Helicone-Property-ModelCog': model_cog if model_cog else None,
-                'Helicone-Property-PromptFile': prompt_file if prompt_file else None
-            }
-            extra_headers = {k: v for k, v in extra_headers.items() if v is not None}
-            
-            if model_cog:
-                extra_headers['X-Model-Cog'] = model_cog
-            
-            try:
-                stream = await self.openpipe_client.chat.completions.create(
-                    model=openpipe_model,
-                    messages=validated_messages,
-                    temperature=temperature if temperature is not None else 0.7,
-                    max_tokens=max_tokens if max_tokens is not None else 1000,
-                    stream=True,
-                    store=True,
-                    extra_headers=extra_headers
-                )
-            except Exception as e:
-                error_message = str(e)
-                error_data = {}
-                try:
-                    # Try to parse error message as JSON
-                    if isinstance(error_message, str) and "429 OpenAI API error" in error_message:
-                        # If it's a rate limit error, try without :free suffix
-                        if ":free" in model:
-                            logger.info(f"[API] Rate limit hit, retrying without :free suffix")
-                            model = model.replace(":free", "")
-                            openpipe_model = self._get_prefixed_model(model, provider)
-                            stream = await self.openpipe_client.chat.completions.create(
-                                model=openpipe_model,
-                                messages=validated_messages,
-                                temperature=temperature if temperature is not None else 0.7,
-                                max_tokens=max_tokens if max_tokens is not None else 1000,
-                                stream=True,
-                                store=True,
-                                extra_headers=extra_headers
-                            )
-                        else:
-                            raise
-                    else:
-                        raise
-                except Exception as retry_error:
-                    logger.error(f"[API] Error after retry: {str(retry_error)}")
-                    raise retry_error
-
-            requested_at = int(time.time() * 1000)
-            
-            async for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
-
-            received_at = int(time.time() * 1000)
-
-            tags = {
+    async def _prepare_request(self, messages, model, temperature, max_tokens, provider=None, user_id=None, guild_id=None, prompt_file=None, model_cog=None) -> PreparedRequest:
+        """Validate messages (downloading images) and build headers once per call"""
+        extra_headers = {
+            'HTTP-Referer': 'https://github.com/gwyntel/SplinterTreev4',
+            'X-Title': 'splintertree by GwynTel',
+            'Helicone-Property-UserID': str(user_id) if user_id else None,
+            'Helicone-Property-GuildID': str(guild_id) if guild_id else None,
+            'Helicone-Property-ModelCog': model_cog if model_cog else None,
+            'Helicone-Property-PromptFile': prompt_file if prompt_file else None,
+            'Helicone-Property-TraceID': tracer.current_id()
+        }
+        extra_headers = {k: v for k, v in extra_headers.items() if v is not None}
+
+        if model_cog:
+            extra_headers['X-Model-Cog'] = model_cog
+
+        with tracer.span('prepare_request'):
+            validated_messages = self._apply_cache_control(await self._validate_message_roles(messages), model)
+
+        return PreparedRequest(
+            model=model,
+            provider=provider,
+            openpipe_model=self._get_prefixed_model(model, provider),
+            messages=tuple(copy.deepcopy(validated_messages)),
+            temperature=temperature,
+            max_tokens=max_tokens,
+            extra_headers=MappingProxyType(extra_headers),
+            tags=MappingProxyType({
                 "source": "openpipe",
                 "user_id": str(user_id) if user_id else None,
                 "guild_id": str(guild_id) if guild_id else None,
                 "prompt_file": prompt_file,
                 "model_cog": model_cog
-            }
+            })
+        )
+
+    def _without_free_tier(self, prepared: PreparedRequest) -> PreparedRequest:
+        """The same request against the paid variant of a :free model"""
+        model = prepared.model.replace(":free", "")
+        return prepared._replace(model=model, openpipe_model=self._get_prefixed_model(model, prepared.provider))
+
+    @backoff.on_exception(
+        backoff.expo,
+        (aiohttp.ClientError, asyncio.TimeoutError, Exception),
+        max_tries=5,
+        max_time=60
+    )
+    async def _create_completion(self, prepared: PreparedRequest, stream: bool, timing: RequestTiming):
+        """Send a prepared request, falling back from :free on a rate limit.
+
+        Returns the response (or the stream) and the request that produced it.
+        timing is restarted as each attempt is sent.
+        """
+        await self._enforce_rate_limit()
+        try:
+            timing.start()
+            return await self.openpipe_client.chat.completions.create(**prepared.create_kwargs(stream)), prepared
+        except Exception as e:
+            if "429 OpenAI API error" in str(e) and ":free" in prepared.model:
+                # If it's a rate limit error, try without :free suffix
+                logger.info(f"[API] Rate limit hit, retrying without :free suffix")
+                prepared = self._without_free_tier(prepared)
+                timing.start()
+                return await self.openpipe_client.chat.completions.create(**prepared.create_kwargs(stream)), prepared
+            raise
+
+    @staticmethod
+    def _observe_completion(prepared: PreparedRequest, stream: bool, timing: RequestTiming, usage: Dict[str, int]):
+        """Record latency and token counts of a finished completion in the metrics registry and trace"""
+        model = prepared.openpipe_model
+        tracer.add_span('upstream', timing.duration, model=model, first_token=timing.first_token,
+                        completion_tokens=usage.get('completion_tokens'))
+        if timing.first_token is not None:
+            metrics.observe(FIRST_TOKEN_SECONDS, timing.first_token, model=model)
+        metrics.observe(COMPLETION_SECONDS, timing.duration, model=model, stream=str(stream).lower())
+        metrics.inc(COMPLETIONS_TOTAL, model=model, outcome='ok')
+        for kind in ('prompt', 'cached', 'completion'):
+            if usage.get(f'{kind}_tokens'):
+                metrics.inc(TOKENS_TOTAL, usage[f'{kind}_tokens'], model=model, kind=kind)
+
+    @staticmethod
+    def _completion_metrics(prepared: PreparedRequest, stream: bool, timing: RequestTiming,
+                            usage: Dict[str, int], completion: Optional[str]) -> Dict[str, Any]:
+        """Values for the metric columns of the logs table"""
+        return {
+            'model': prepared.openpipe_model,
+            'stream': int(stream),
+            **timing.columns(),
+            'prompt_tokens': usage.get('prompt_tokens'),
+            'completion_tokens': usage.get('completion_tokens'),
+            'cached_tokens': usage.get('cached_tokens'),
+            'completion_hash': hashlib.sha256(completion.encode('utf-8')).hexdigest() if completion is not None else None,
+            'trace_id': tracer.current_id()
+        }
+
+    async def _report_failure(self, prepared: PreparedRequest, stream: bool, timing: RequestTiming, error: Exception):
+        """Log a failed completion with the upstream's status code, or 500 if it sent none"""
+        if timing.received_at is None:
+            timing.finish()
+        await self.report(
+            requested_at=timing.requested_at,
+            received_at=timing.received_at,
+            req_payload=prepared.report_payload(),
+            resp_payload={'error': str(error)},
+            status_code=getattr(error, 'status_code', None) or 500,
+            tags=dict(prepared.tags),
+            user_id=prepared.tags["user_id"],
+            guild_id=prepared.tags["guild_id"],
+            metrics=self._completion_metrics(prepared, stream, timing, {}, None)
+        )
+
+    async def _stream_openpipe_request(self, prepared: PreparedRequest):
+        """Stream responses from OpenPipe API with improved error handling"""
+        logger.debug(f"[API] Making OpenPipe streaming request to model: {prepared.openpipe_model}")
+
+        stream = None
+        timing = RequestTiming()
+        try:
+            stream, prepared = await self._create_completion(prepared, stream=True, timing=timing)
+
+            usage = None
+            parts = []
+            async for chunk in stream:
+                # The final chunk carries usage and no choices
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    timing.chunk()
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+
+            timing.finish()
+            completion = ''.join(parts)
 
             completion_obj = {
                 'choices': [{
                     'message': {
-                        'content': "Streaming response completed"
+                        'content': completion
                     }
                 }]
             }
-            
+
+            usage = self._prompt_cache_usage(usage)
+            self._observe_completion(prepared, True, timing, usage)
             await self.report(
-                requested_at=requested_at,
-                received_at=received_at,
-                req_payload={
-                    "model": openpipe_model,
-                    "messages": validated_messages,
-                    "temperature": temperature,
-                    "max_tokens": max_tokens
-                },
+                requested_at=timing.requested_at,
+                received_at=timing.received_at,
+                req_payload=prepared.report_payload(),
                 resp_payload=completion_obj,
                 status_code=200,
-                tags=tags,
-                user_id=user_id,
-                guild_id=guild_id
+                tags={**prepared.tags, **usage},
+                user_id=prepared.tags["user_id"],
+                guild_id=prepared.tags["guild_id"],
+                metrics=self._completion_metrics(prepared, True, timing, usage, completion)
             )
+        except (asyncio.CancelledError, GeneratorExit):
+            # The reader went away mid-stream, e.g. a dashboard client disconnected
+            metrics.inc(COMPLETIONS_TOTAL, model=prepared.openpipe_model, outcome='cancelled')
+            raise
         except Exception as e:
+            metrics.inc(COMPLETIONS_TOTAL, model=prepared.openpipe_model, outcome='error')
             error_message = str(e)
             logger.error(f"[API] OpenPipe streaming error: {error_message}")
+            await self._report_failure(prepared, True, timing, e)
             raise Exception(f"OpenPipe API error: {error_message}")
+        finally:
+            # Release the upstream connection now rather than when the stream is garbage collected
+            if stream is not None:
+                await stream.close()
 
-    @backoff.on_exception(
-        backoff.expo,
-        (aiohttp.ClientError, asyncio.TimeoutError, Exception),
-        max_tries=5,
-        max_time=60
-    )
     async def call_openpipe(self, messages: List[Dict[str, Union[str, List[Dict[str, Any]]]]], model: str, temperature: float = None, stream: bool = False, max_tokens: int = None, provider: str = None, user_id: str = None, guild_id: str = None, prompt_file: str = None, model_cog: str = None) -> Union[Dict, AsyncGenerator[str, None]]:
         try:
-            await self._enforce_rate_limit()
-            
-            openpipe_model = self._get_prefixed_model(model, provider)
-            
-            logger.debug(f"[API] Making OpenPipe request to model: {openpipe_model}")
+            logger.debug(f"[API] Making OpenPipe request to model: {self._get_prefixed_model(model, provider)}")
             logger.debug(f"[API] Request messages structure:")
             for msg in messages:
                 logger.debug(f"[API] Message role: {msg.get('role')}")
                 logger.debug(f"[API] Message content: {msg.get('content')}")
 
-            extra_headers = {
-                'HTTP-Referer': 'https://github.com/gwyntel/SplinterTreev4',
-                'X-Title': 'splintertree by GwynTel',
-                'Helicone-Property-UserID': str(user_id) if user_id else None,
-                'Helicone-Property-GuildID': str(guild_id) if guild_id else None,
-                'Helicone-Property-ModelCog': model_cog if model_cog else None,
-                'Helicone-Property-PromptFile': prompt_file if prompt_file else None
-            }
-            extra_headers = {k: v for k, v in extra_headers.items() if v is not None}
-            
-            if model_cog:
-                extra_headers['X-Model-Cog'] = model_cog
+            prepared = await self._prepare_request(messages, model, temperature, max_tokens, provider, user_id, guild_id, prompt_file, model_cog)
+
+            if stream:
+                return self._stream_openpipe_request(prepared)
 
+            timing = RequestTiming()
             try:
-                if stream:
-                    return self._stream_openpipe_request(messages, model, temperature, max_tokens, provider, user_id, guild_id, prompt_file, model_cog)
-                else:
-                    validated_messages = await self._validate_message_roles(messages)
-                    
-                    requested_at = int(time.time() * 1000)
-                    try:
-                        response = await self.openpipe_client.chat.completions.create(
-                            model=openpipe_model,
-                            messages=validated_messages,
-                            temperature=temperature if temperature is not None else 0.7,
-                            max_tokens=max_tokens if max_tokens is not None else 1000,
-                            store=True,
-                            extra_headers=extra_headers
-                        )
-                    except Exception as e:
-                        error_message = str(e)
-                        if "429 OpenAI API error" in error_message and ":free" in model:
-                            # If it's a rate limit error, try without :free suffix
-                            logger.info(f"[API] Rate limit hit, retrying without :free suffix")
-                            model = model.replace(":free", "")
-                            openpipe_model = self._get_prefixed_model(model, provider)
-                            response = await self.openpipe_client.chat.completions.create(
-                                model=openpipe_model,
-                                messages=validated_messages,
-                                temperature=temperature if temperature is not None else 0.7,
-                                max_tokens=max_tokens if max_tokens is not None else 1000,
-                                store=True,
-                                extra_headers=extra_headers
-                            )
-                        else:
-                            raise
-
-                    received_at = int(time.time() * 1000)
-
-                    result = {
-                        'choices': [{
-                            'message': {
-                                'content': response.choices[0].message.content
-                            }
-                        }]
-                    }
+                response, prepared = await self._create_completion(prepared, stream=False, timing=timing)
+            except Exception as e:
+                await self._report_failure(prepared, False, timing, e)
+                raise
+            timing.finish()
 
-                    tags = {
-                        "source": "openpipe",
-                        "user_id": str(user_id) if user_id else None,
-                        "guild_id": str(guild_id) if guild_id else None,
-                        "prompt_file": prompt_file,
-                        "model_cog": model_cog
+            result = {
+                'choices': [{
+                    'message': {
+                        'content': response.choices[0].message.content
                     }
+                }]
+            }
 
-                    await self.report(
-                        requested_at=requested_at,
-                        received_at=received_at,
-                        req_payload={
-                            "model": openpipe_model,
-                            "messages": validated_messages,
-                            "temperature": temperature,
-                            "max_tokens": max_tokens
-                        },
-                        resp_payload=result,
-                        status_code=200,
-                        tags=tags,
-                        user_id=user_id,
-                        guild_id=guild_id
-                    )
-
-                    return result
+            usage = self._prompt_cache_usage(getattr(response, 'usage', None))
+            self._observe_completion(prepared, False, timing, usage)
+            await self.report(
+                requested_at=timing.requested_at,
+                received_at=timing.received_at,
+                req_payload=prepared.report_payload(),
+                resp_payload=result,
+                status_code=200,
+                tags={**prepared.tags, **usage},
+                user_id=prepared.tags["user_id"],
+                guild_id=prepared.tags["guild_id"],
+                metrics=self._completion_metrics(prepared, False, timing, usage, response.choices[0].message.content)
+            )
 
-            except Exception as e:
-                error_message = str(e)
-                logger.error(f"[API] OpenPipe error: {error_message}")
-                raise
+            return result
 
         except Exception as e:
+            metrics.inc(COMPLETIONS_TOTAL, model=self._get_prefixed_model(model, provider), outcome='error')
             error_message = str(e)
             logger.error(f"[API] OpenPipe error: {error_message}")
             raise Exception(f"OpenPipe API error: {error_message}")
@@ -455,29 +558,105 @@ class API:
             model_cog=model_cog
         )
 
-    async def report(self, requested_at: int, received_at: int, req_payload: Dict, resp_payload: Dict, status_code: int, tags: Dict = None, user_id: str = None, guild_id: str = None):
-        """Report interaction metrics with improved error handling"""
+    async def classify(self, messages: List[Dict], model: str, labels: List[str], provider: str = 'openrouter',
+                       timeout: float = 3.0, max_tokens: int = 20) -> Dict[str, Any]:
+        """Pick one of labels with a single short, non-streaming completion.
+
+        Output is constrained to a JSON object whose label is one of labels.
+        The call is not stored or reported, and it gives up after timeout
+        seconds. Returns {'label', 'confidence', 'source', 'latency'}. The
+        label is None if the model failed or answered with something else.
+        """
+        schema = {
+            "type": "object",
+            "properties": {
+                "label": {"type": "string", "enum": list(labels)},
+                "confidence": {"type": "number", "minimum": 0, "maximum": 1}
+            },
+            "required": ["label", "confidence"],
+            "additionalProperties": False
+        }
+        start = time.perf_counter()
+        decision = {'label': None, 'confidence': 0.0, 'source': 'error'}
+        try:
+            response = await asyncio.wait_for(
+                self.openpipe_client.chat.completions.create(
+                    model=self._get_prefixed_model(model, provider),
+                    messages=messages,
+                    temperature=0,
+                    max_tokens=max_tokens,
+                    response_format={
+                        "type": "json_schema",
+                        "json_schema": {"name": "route", "strict": True, "schema": schema}
+                    },
+                    timeout=timeout
+                ),
+                timeout
+            )
+            text = (response.choices[0].message.content or '').strip()
+            decision = self._parse_classification(text, labels)
+        except asyncio.TimeoutError:
+            decision['source'] = 'timeout'
+            logger.warning(f"[API] Classification with {model} timed out after {timeout}s")
+        except Exception as e:
+            logger.error(f"[API] Classification with {model} failed: {str(e)}")
+        decision['latency'] = time.perf_counter() - start
+        self.classify_latency.observe(decision['latency'])
+        return decision
+
+    @staticmethod
+    def _parse_classification(text: str, labels: List[str]) -> Dict[str, Any]:
+        """Read a classify() answer, tolerating upstreams that ignore the JSON schema"""
+        by_lower = {label.lower(): label for label in labels}
+        try:
+            answer = json.loads(text)
+            label = by_lower.get(str(answer.get('label', '')).strip().lower())
+            if label:
+                confidence = float(answer.get('confidence', 0))
+                return {'label': label, 'confidence': min(1.0, max(0.0, confidence)), 'source': 'json'}
+        except (ValueError, TypeError, AttributeError):
+            pass
+        # A bare label, possibly with punctuation around it
+        label = by_lower.get(text.strip(' ."\'\n').lower())
+        if label:
+            return {'label': label, 'confidence': 0.5, 'source': 'text'}
+        return {'label': None, 'confidence': 0.0, 'source': 'unparsed'}
+
+    async def report(self, requested_at: int, received_at: int, req_payload: Dict, resp_payload: Dict, status_code: int, tags: Dict = None, user_id: str = None, guild_id: str = None, metrics: Dict = None):
+        """Report interaction metrics with improved error handling
+
+        metrics fills the structured timing and token columns (METRIC_COLUMNS).
+        """
         try:
             if tags is None:
                 tags = {}
+            if metrics is None:
+                metrics = {}
             tags_str = json.dumps(tags)
 
             async with self.db_pool.acquire() as conn:
                 cursor = conn.cursor()
-                sql = """
-                    INSERT INTO logs (
-                        requested_at, received_at, request, response, 
-                        status_code, tags, user_id, guild_id
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """
-                values = (
-                    requested_at, received_at, json.dumps(req_payload),
-                    json.dumps(resp_payload), status_code, tags_str,
-                    user_id, guild_id
-                )
-
-                cursor.execute(sql, values)
-                conn.commit()
+                try:
+                    request_blob, response_blob = log_store.encode(cursor, req_payload, resp_payload)
+                    sql = f"""
+                        INSERT INTO logs (
+                            requested_at, received_at, request, response,
+                            status_code, tags, user_id, guild_id,
+                            codec, request_blob, response_blob, {', '.join(METRIC_COLUMNS)}
+                        ) VALUES (?, ?, '', '', ?, ?, ?, ?, ?, ?, ?{', ?' * len(METRIC_COLUMNS)})
+                    """
+                    values = (
+                        requested_at, received_at, status_code, tags_str,
+                        user_id, guild_id, log_store.codec, request_blob, response_blob,
+                        *(metrics.get(column) for column in METRIC_COLUMNS)
+                    )
+
+                    cursor.execute(sql, values)
+                    conn.commit()
+                except Exception:
+                    # Messages stored in this transaction are rolled back with it
+                    log_store.forget()
+                    raise
                 logger.debug(f"[API] Logged interaction with status code {status_code}")
 
         except Exception as e:
@@ -485,7 +664,7 @@ class API:
 
     async def close(self):
         """Cleanup resources"""
-        await self.session.close()
+        await http_clients.close()
         await self.db_pool.close()
 
 # Global API instance
@@ -0,0 +1,130 @@
+import sys
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+# Every bounded structure registers itself here so it can show up in memory reports
+_tracked = weakref.WeakSet()
+
+class _ExpiringBase:
+    """Insertion-ordered map with a TTL and a maximum size.
+
+    Entries are kept in expiry order, so expired and overflowing entries are
+    always popped from the front in O(1) amortized per operation.
+    """
+
+    def __init__(self, name: str, ttl: float = 3600, maxsize: int = 10000):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # {key: (expires_at, value)}
+        self.evictions = 0
+        _tracked.add(self)
+
+    def _purge(self, now: float = None):
+        now = now if now is not None else time.monotonic()
+        data = self._data
+        while data:
+            key, (expires_at, _) = next(iter(data.items()))
+            if expires_at > now:
+                break
+            data.popitem(last=False)
+        while len(data) > self.maxsize:
+            data.popitem(last=False)
+            self.evictions += 1
+
+    def _put(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        self._purge()
+
+    def _lookup(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def __contains__(self, key) -> bool:
+        return self._lookup(key) is not None
+
+    def __len__(self) -> int:
+        self._purge()
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the container itself"""
+        return sys.getsizeof(self._data) + len(self._data) * sys.getsizeof((0.0, None))
+
+class ExpiringSet(_ExpiringBase):
+    """Bounded, expiring set for message-id dedupe"""
+
+    def add(self, key):
+        self._put(key, None)
+
+    def discard(self, key):
+        self._data.pop(key, None)
+
+    def check_and_add(self, key) -> bool:
+        """Add key and return True if it was not already present"""
+        if key in self:
+            return False
+        self.add(key)
+        return True
+
+class ExpiringDict(_ExpiringBase):
+    """Bounded, expiring dict for per-channel state"""
+
+    def __getitem__(self, key):
+        entry = self._lookup(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry[1]
+
+    def __setitem__(self, key, value):
+        self._put(key, value)
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def get(self, key, default=None):
+        entry = self._lookup(key)
+        return default if entry is None else entry[1]
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def setdefault(self, key, default=None):
+        entry = self._lookup(key)
+        if entry is None:
+            self._put(key, default)
+            return default
+        return entry[1]
+
+    def items(self):
+        self._purge()
+        return [(key, value) for key, (_, value) in self._data.items()]
+
+def memory_report() -> List[Dict[str, Any]]:
+    """Size of every live bounded structure, largest first"""
+    report = []
+    for structure in list(_tracked):
+        report.append({
+            'name': structure.name,
+            'size': len(structure),
+            'maxsize': structure.maxsize,
+            'ttl': structure.ttl,
+            'evictions': structure.evictions,
+            'bytes': structure.memory_usage()
+        })
+    report.sort(key=lambda entry: entry['size'], reverse=True)
+    return report
@@ -0,0 +1,59 @@
+import time
+import asyncio
+import logging
+from typing import Callable, Awaitable, Dict, Any, Optional
+
+class MessageRouter:
+    """Dispatches each incoming message exactly once to every registered handler.
+
+    Handlers run concurrently; each one gets its own timeout and its failures
+    are logged and counted without affecting the others.
+    """
+
+    def __init__(self, default_timeout: float = 120):
+        self.default_timeout = default_timeout
+        self._handlers: Dict[str, tuple] = {}  # {name: (handler, timeout)}
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    def register(self, name: str, handler: Callable[[Any], Awaitable[Any]], timeout: Optional[float] = None):
+        """Register (or replace) a message handler"""
+        self._handlers[name] = (handler, timeout or self.default_timeout)
+        self.stats.setdefault(name, {'calls': 0, 'failures': 0, 'timeouts': 0, 'total_time': 0.0})
+        logging.debug(f"[MessageRouter] Registered handler {name}")
+
+    def unregister(self, name: str):
+        """Remove a handler"""
+        self._handlers.pop(name, None)
+
+    @property
+    def handlers(self):
+        return list(self._handlers)
+
+    async def _run(self, name: str, handler, timeout: float, message):
+        stats = self.stats[name]
+        stats['calls'] += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(handler(message), timeout)
+        except asyncio.TimeoutError:
+            stats['timeouts'] += 1
+            logging.error(f"[MessageRouter] {name} timed out after {timeout}s handling message {getattr(message, 'id', None)}")
+        except Exception as e:
+            stats['failures'] += 1
+            logging.error(f"[MessageRouter] Error in {name}.on_message: {e}")
+        finally:
+            stats['total_time'] += time.perf_counter() - start
+
+    async def dispatch(self, message):
+        """Run every registered handler once for this message"""
+        handlers = list(self._handlers.items())
+        if not handlers:
+            return
+        if len(handlers) == 1:
+            name, (handler, timeout) = handlers[0]
+            await self._run(name, handler, timeout, message)
+            return
+        await asyncio.gather(*(
+            self._run(name, handler, timeout, message)
+            for name, (handler, timeout) in handlers
+        ))
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+from typing import Dict, Optional
+import aiohttp
+import httpx
+
+try:
+    import h2  # noqa: F401  HTTP/2 support for httpx is optional
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Connection pools per upstream. Discord rate limits per route, so a few
+# connections per host are enough; idle connections stay open across bursts.
+AIOHTTP_UPSTREAMS = {
+    'discord_webhooks': {
+        'limit': 50,
+        'limit_per_host': 10,
+        'keepalive_timeout': 60,
+        'timeout': aiohttp.ClientTimeout(total=30, connect=10)
+    },
+    'discord_cdn': {
+        'limit': 20,
+        'limit_per_host': 8,
+        'keepalive_timeout': 30,
+        'timeout': aiohttp.ClientTimeout(total=30, connect=10, sock_read=10)
+    }
+}
+DNS_CACHE_TTL = 300
+
+OPENPIPE_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+OPENPIPE_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+class ConnectionStats:
+    """Requests sent and connections opened for one upstream"""
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+
+    @property
+    def reuse_rate(self) -> float:
+        acquired = self.new_connections + self.reused_connections
+        return self.reused_connections / acquired if acquired else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'requests': self.requests,
+            'new_connections': self.new_connections,
+            'reused_connections': self.reused_connections,
+            'reuse_rate': self.reuse_rate
+        }
+
+class HTTPClients:
+    """Shared HTTP clients, one connection pool per upstream.
+
+    aiohttp sessions serve Discord webhooks and the CDN; OpenPipe goes
+    through the httpx client used by the OpenAI SDK, over HTTP/2 when h2 is
+    installed. Sessions are created inside the bot's event loop by start()
+    (or on first use) and closed by close() when the bot stops.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._openpipe: Optional[httpx.AsyncClient] = None
+        self.stats: Dict[str, ConnectionStats] = {name: ConnectionStats() for name in (*AIOHTTP_UPSTREAMS, 'openpipe')}
+
+    def _trace_config(self, stats: ConnectionStats) -> aiohttp.TraceConfig:
+        async def on_request_start(session, context, params):
+            stats.requests += 1
+
+        async def on_connection_create_end(session, context, params):
+            stats.new_connections += 1
+
+        async def on_connection_reuseconn(session, context, params):
+            stats.reused_connections += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        return trace_config
+
+    def session(self, name: str) -> aiohttp.ClientSession:
+        """The shared aiohttp session for an upstream in AIOHTTP_UPSTREAMS"""
+        session = self._sessions.get(name)
+        if session is None or session.closed:
+            settings = AIOHTTP_UPSTREAMS[name]
+            connector = aiohttp.TCPConnector(
+                limit=settings['limit'],
+                limit_per_host=settings['limit_per_host'],
+                keepalive_timeout=settings['keepalive_timeout'],
+                ttl_dns_cache=DNS_CACHE_TTL
+            )
+            session = self._sessions[name] = aiohttp.ClientSession(
+                connector=connector,
+                timeout=settings['timeout'],
+                trace_configs=[self._trace_config(self.stats[name])]
+            )
+        return session
+
+    @property
+    def openpipe(self) -> httpx.AsyncClient:
+        """The httpx client for OpenPipe, passed to AsyncOpenAI as http_client"""
+        if self._openpipe is None or self._openpipe.is_closed:
+            stats = self.stats['openpipe']
+
+            # httpcore reports TCP connects through the trace extension; a
+            # request without one went out on an existing connection
+            async def on_request(request: httpx.Request):
+                stats.requests += 1
+
+                async def trace(event_name: str, info: dict):
+                    if event_name == 'connection.connect_tcp.complete':
+                        stats.new_connections += 1
+                        request.extensions['new_connection'] = True
+
+                request.extensions['trace'] = trace
+
+            async def on_response(response: httpx.Response):
+                if not response.request.extensions.get('new_connection'):
+                    stats.reused_connections += 1
+
+            self._openpipe = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                limits=OPENPIPE_LIMITS,
+                timeout=OPENPIPE_TIMEOUT,
+                follow_redirects=True,
+                event_hooks={'request': [on_request], 'response': [on_response]}
+            )
+        return self._openpipe
+
+    async def start(self):
+        """Create the aiohttp sessions inside the running event loop"""
+        for name in AIOHTTP_UPSTREAMS:
+            self.session(name)
+        logging.info(f"[HTTP] Started shared clients (OpenPipe over {'HTTP/2' if HTTP2_AVAILABLE else 'HTTP/1.1'})")
+
+    async def close(self):
+        """Close every session and its pooled connections"""
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        await asyncio.gather(*(session.close() for session in sessions), return_exceptions=True)
+        if self._openpipe is not None:
+            await self._openpipe.aclose()
+            self._openpipe = None
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {name: stats.summary() for name, stats in self.stats.items()}
+
+# Shared by the API client and every cog so connections are reused across them
+http_clients = HTTPClients()
@@ -0,0 +1,240 @@
+import csv
+import io
+import json
+import asyncio
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Mapping, Optional, Tuple
+from shared.log_store import log_store
+
+DB_PATH = 'databases/interaction_logs.db'
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+EXPORT_BATCH = 500
+
+LOG_COLUMNS = ('id', 'requested_at', 'received_at', 'status_code', 'user_id', 'guild_id', 'model', 'stream',
+               'first_token_ms', 'duration_ms', 'prompt_tokens', 'completion_tokens', 'cached_tokens', 'trace_id')
+MESSAGE_COLUMNS = ('id', 'discord_message_id', 'timestamp', 'channel_id', 'guild_id', 'user_id', 'persona_name',
+                   'content', 'is_assistant', 'parent_message_id', 'emotion')
+PAYLOAD_COLUMNS = ('tags', 'request', 'response')
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+# Keeps messages_fts in step with messages; created from code because API._init_db splits schema.sql on semicolons
+SEARCH_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+"""
+
+def ensure_search_schema(conn: sqlite3.Connection) -> bool:
+    """Create the full-text index of message content, filling it from existing rows.
+
+    Returns False if this SQLite build has no FTS5; search then falls back to LIKE.
+    """
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone():
+        try:
+            conn.execute("CREATE VIRTUAL TABLE messages_fts USING fts5(content, content='messages', content_rowid='id')")
+        except sqlite3.OperationalError as e:
+            logging.warning(f"[LogExplorer] Full-text search unavailable: {e}")
+            return False
+        conn.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+    conn.executescript(SEARCH_TRIGGERS)
+    conn.commit()
+    return True
+
+def _epoch_ms(value: str) -> int:
+    """Epoch seconds or an ISO datetime, as epoch milliseconds like logs.requested_at"""
+    try:
+        return int(float(value) * 1000)
+    except ValueError:
+        return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+def _iso(value: str) -> str:
+    """Epoch seconds or an ISO datetime, as the local ISO text stored in messages.timestamp"""
+    try:
+        return datetime.fromtimestamp(float(value)).isoformat()
+    except ValueError:
+        return datetime.fromisoformat(value).isoformat()
+
+def _flag(value: str) -> int:
+    return 1 if value.lower() in ('1', 'true', 'yes') else 0
+
+def _match_query(value: str) -> str:
+    """Each word of value as a quoted FTS5 term, so user input is never parsed as query syntax"""
+    terms = ['"' + term.replace('"', '""') + '"' for term in value.split()]
+    if not terms:
+        raise ValueError("Empty search")
+    return ' '.join(terms)
+
+Filters = Dict[str, Tuple[str, Callable[[str], Any]]]
+
+# Query parameter: (condition, converter). Equality filters use single-column indexes,
+# whose entries SQLite keeps in rowid order, so they page by id without sorting.
+LOG_FILTERS: Filters = {
+    'guild_id': ('guild_id = ?', str),
+    'user_id': ('user_id = ?', str),
+    'model': ('model = ?', str),
+    'status_code': ('status_code = ?', int),
+    'trace_id': ('trace_id = ?', str),
+    'since': ('requested_at >= ?', _epoch_ms),
+    'until': ('requested_at < ?', _epoch_ms)
+}
+
+MESSAGE_FILTERS: Filters = {
+    'guild_id': ('guild_id = ?', str),
+    'channel_id': ('channel_id = ?', str),
+    'user_id': ('user_id = ?', str),
+    'persona': ('persona_name = ?', str),
+    'is_assistant': ('is_assistant = ?', _flag),
+    'since': ('timestamp >= ?', _iso),
+    'until': ('timestamp < ?', _iso),
+    'q': ('id IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)', _match_query)
+}
+
+class LogExplorer:
+    """Filtered, keyset-paginated reads of the logs and messages tables.
+
+    Pages are ordered newest first by id. The next cursor is the last id
+    returned, so each page is an index range scan, however deep the reader
+    has gone. Exports walk the same pages, holding one page in memory.
+    """
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        self.full_text = None  # Whether messages_fts exists; checked on first use
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        if self.full_text is None:
+            self.full_text = ensure_search_schema(conn)
+        return conn
+
+    def _where(self, filters: Filters, params: Mapping[str, str]) -> Tuple[List[str], List[Any]]:
+        clauses, args = [], []
+        for name, (clause, convert) in filters.items():
+            value = params.get(name)
+            if value in (None, ''):
+                continue
+            if name == 'q' and not self.full_text:
+                clause, convert = 'content LIKE ?', lambda text: f"%{text}%"
+            try:
+                args.append(convert(value))
+            except ValueError:
+                raise ValueError(f"Invalid value for {name}: {value!r}")
+            clauses.append(clause)
+        return clauses, args
+
+    @staticmethod
+    def _limit(params: Mapping[str, str]) -> int:
+        try:
+            return max(1, min(int(params.get('limit') or PAGE_SIZE), MAX_PAGE_SIZE))
+        except ValueError:
+            raise ValueError(f"Invalid value for limit: {params.get('limit')!r}")
+
+    def _page(self, table: str, params: Mapping[str, str], limit: int, before: Optional[str],
+              payloads: bool = False) -> Dict[str, Any]:
+        filters = LOG_FILTERS if table == 'logs' else MESSAGE_FILTERS
+        columns = LOG_COLUMNS if table == 'logs' else MESSAGE_COLUMNS
+        if payloads:
+            columns = ('*',)
+        with self._connect() as conn:
+            clauses, args = self._where(filters, params)
+            if before:
+                try:
+                    args.append(int(before))
+                except ValueError:
+                    raise ValueError(f"Invalid cursor: {before!r}")
+                clauses.append('id < ?')
+            where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT {', '.join(columns)} FROM {table}{where} ORDER BY id DESC LIMIT ?",
+                [*args, limit + 1]
+            )
+            rows = cursor.fetchall()
+            items = [self._log_payloads(cursor, row) if payloads else dict(row) for row in rows[:limit]]
+        return {'items': items, 'next': str(rows[limit - 1]['id']) if len(rows) > limit else None}
+
+    @staticmethod
+    def _log_payloads(cursor: sqlite3.Cursor, row: sqlite3.Row) -> Dict[str, Any]:
+        """A logs row with its tags parsed and its request and response decoded"""
+        item = {column: row[column] for column in LOG_COLUMNS}
+        try:
+            item['tags'] = json.loads(row['tags']) if row['tags'] else None
+        except ValueError:
+            item['tags'] = row['tags']
+        try:
+            item['request'], item['response'] = log_store.decode(cursor, row)
+        except Exception as e:
+            logging.error(f"[LogExplorer] Failed to decode log {row['id']}: {e}")
+            item['request'] = item['response'] = None
+        return item
+
+    def logs(self, params: Mapping[str, str]) -> Dict[str, Any]:
+        """A page of logged API calls: {'items': [...], 'next': cursor or None}"""
+        return self._page('logs', params, self._limit(params), params.get('before'))
+
+    def messages(self, params: Mapping[str, str]) -> Dict[str, Any]:
+        """A page of stored messages; q searches their content"""
+        return self._page('messages', params, self._limit(params), params.get('before'))
+
+    def log(self, log_id: int) -> Optional[Dict[str, Any]]:
+        """One logged API call with its request and response"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM logs WHERE id = ?", (log_id,))
+            row = cursor.fetchone()
+            return self._log_payloads(cursor, row) if row else None
+
+    def export(self, table: str, params: Mapping[str, str], fmt: str = 'jsonl',
+               payloads: bool = False) -> AsyncIterator[bytes]:
+        """Every matching row as CSV or JSON Lines, produced one page at a time.
+
+        Filters are checked here, so a bad request fails before any output.
+        payloads adds tags, request and response to exported logs.
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {fmt!r}")
+        self._where(LOG_FILTERS if table == 'logs' else MESSAGE_FILTERS, params)
+        return self._export_rows(table, dict(params), fmt, payloads and table == 'logs')
+
+    async def _export_rows(self, table: str, params: Dict[str, str], fmt: str, payloads: bool) -> AsyncIterator[bytes]:
+        columns = LOG_COLUMNS if table == 'logs' else MESSAGE_COLUMNS
+        if payloads:
+            columns = columns + PAYLOAD_COLUMNS
+        if fmt == 'csv':
+            yield self._csv([columns])
+        before = params.get('before')
+        while True:
+            page = await asyncio.to_thread(self._page, table, params, EXPORT_BATCH, before, payloads)
+            if fmt == 'csv':
+                yield self._csv([
+                    [item[column] if column not in PAYLOAD_COLUMNS else json.dumps(item[column], ensure_ascii=False)
+                     for column in columns]
+                    for item in page['items']
+                ])
+            else:
+                yield ''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in page['items']).encode('utf-8')
+            before = page['next']
+            if before is None:
+                return
+
+    @staticmethod
+    def _csv(rows: List) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue().encode('utf-8')
+
+# Used by the dashboard's explorer routes, from worker threads
+log_explorer = LogExplorer()
@@ -0,0 +1,225 @@
+import json
+import zlib
+import sqlite3
+import hashlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import zstandard
+    _zstd_compressor = zstandard.ZstdCompressor(level=10)
+    _zstd_decompressor = zstandard.ZstdDecompressor()
+    DEFAULT_CODEC = 'zstd'
+except ImportError:
+    zstandard = None
+    DEFAULT_CODEC = 'zlib'
+
+# Columns added to logs by the compact format; older databases get them through ensure_log_schema
+LOG_COLUMNS = {
+    'codec': 'TEXT',
+    'request_blob': 'BLOB',
+    'response_blob': 'BLOB'
+}
+
+# Per-request measurements written by API.report, queryable without decoding payloads
+METRIC_COLUMNS = {
+    'model': 'TEXT',
+    'stream': 'INTEGER',
+    'first_token_ms': 'INTEGER',
+    'duration_ms': 'INTEGER',
+    'chunk_count': 'INTEGER',
+    'gap_mean_ms': 'REAL',
+    'gap_max_ms': 'INTEGER',
+    'prompt_tokens': 'INTEGER',
+    'completion_tokens': 'INTEGER',
+    'cached_tokens': 'INTEGER',
+    'completion_hash': 'TEXT',
+    'trace_id': 'TEXT'
+}
+
+def compress(data: bytes, codec: str = DEFAULT_CODEC) -> bytes:
+    if codec == 'zstd':
+        return _zstd_compressor.compress(data)
+    return zlib.compress(data, 6)
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("Log entry is zstd-compressed but the zstandard package is not installed")
+        return _zstd_decompressor.decompress(data)
+    return zlib.decompress(data)
+
+def _canonical(value: Any) -> bytes:
+    """Stable JSON encoding, so equal messages hash the same"""
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def _strip_images(content: Any) -> Any:
+    """Replace inline base64 images with a reference to their hash"""
+    if not isinstance(content, list):
+        return content
+    stripped = []
+    for item in content:
+        if isinstance(item, dict) and item.get('type') == 'image_url':
+            url = item.get('image_url')
+            if isinstance(url, dict):
+                url = url.get('url')
+            if isinstance(url, str) and url.startswith('data:'):
+                data = url.encode('utf-8')
+                item = {
+                    'type': 'image_url',
+                    'image_url': f"sha256:{hashlib.sha256(data).hexdigest()}",
+                    'image_bytes': len(data)
+                }
+        stripped.append(item)
+    return stripped
+
+def ensure_log_schema(conn: sqlite3.Connection):
+    """Add the compact storage and metric columns to a database created before them"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS log_blobs (
+            hash TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            data BLOB NOT NULL
+        )
+    """)
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(logs)")}
+    for column, column_type in {**LOG_COLUMNS, **METRIC_COLUMNS}.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE logs ADD COLUMN {column} {column_type}")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_logs_model ON logs(model, requested_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_logs_trace_id ON logs(trace_id)")
+    conn.commit()
+
+class LogStore:
+    """Compact encoding of logged requests and responses.
+
+    Each message is stored once in log_blobs, keyed by the SHA-256 of its
+    canonical JSON, so a system prompt or context message repeated across
+    calls costs one row. Requests keep only the message hashes, inline
+    base64 images are reduced to a hash and size, and every payload is
+    compressed with zstd when available, otherwise zlib.
+    """
+
+    def __init__(self, codec: str = DEFAULT_CODEC, known_hashes: int = 4096):
+        self.codec = codec
+        self.known_hashes = known_hashes
+        self._known: OrderedDict = OrderedDict()  # Hashes already in log_blobs, most recent last
+
+    def _remember(self, digest: str):
+        self._known[digest] = None
+        self._known.move_to_end(digest)
+        if len(self._known) > self.known_hashes:
+            self._known.popitem(last=False)
+
+    def _store_message(self, cursor: sqlite3.Cursor, message: Dict) -> str:
+        if isinstance(message, dict) and 'content' in message:
+            message = {**message, 'content': _strip_images(message['content'])}
+        data = _canonical(message)
+        digest = hashlib.sha256(data).hexdigest()
+        if digest in self._known:
+            self._known.move_to_end(digest)
+        else:
+            cursor.execute(
+                "INSERT OR IGNORE INTO log_blobs (hash, codec, size, data) VALUES (?, ?, ?, ?)",
+                (digest, self.codec, len(data), compress(data, self.codec))
+            )
+            self._remember(digest)
+        return digest
+
+    def encode(self, cursor: sqlite3.Cursor, req_payload: Dict, resp_payload: Dict) -> Tuple[bytes, bytes]:
+        """Compressed request and response for the logs row; stores new messages with cursor"""
+        messages = req_payload.get('messages') or []
+        request = {**req_payload, 'messages': [self._store_message(cursor, message) for message in messages]}
+        return compress(_canonical(request), self.codec), compress(_canonical(resp_payload), self.codec)
+
+    def forget(self):
+        """Drop the hash cache, e.g. after the transaction that stored them rolled back"""
+        self._known.clear()
+
+    @staticmethod
+    def _load_messages(cursor: sqlite3.Cursor, hashes: List[str]) -> List[Optional[Dict]]:
+        blobs = {}
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            cursor.execute(
+                f"SELECT hash, codec, data FROM log_blobs WHERE hash IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            for digest, codec, data in cursor.fetchall():
+                blobs[digest] = json.loads(decompress(data, codec))
+        return [blobs.get(digest) for digest in hashes]
+
+    def decode(self, cursor: sqlite3.Cursor, row) -> Tuple[Dict, Dict]:
+        """Request and response of a logs row in either the compact or the original format"""
+        if row['request_blob'] is None:
+            return json.loads(row['request']), json.loads(row['response'])
+        codec = row['codec']
+        request = json.loads(decompress(row['request_blob'], codec))
+        request['messages'] = self._load_messages(cursor, request.get('messages') or [])
+        response = json.loads(decompress(row['response_blob'], codec))
+        return request, response
+
+    def migrate(self, conn: sqlite3.Connection, batch_size: int = 200) -> Dict[str, int]:
+        """Rewrite logs rows still in the original JSON format; returns size totals"""
+        ensure_log_schema(conn)
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        stats = {'rows': 0, 'original_bytes': 0, 'compact_bytes': 0, 'new_blob_bytes': 0}
+        last_id = 0
+        while True:
+            cursor.execute(
+                "SELECT id, request, response FROM logs WHERE request_blob IS NULL AND id > ? ORDER BY id LIMIT ?",
+                (last_id, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            blob_bytes_before = conn.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM log_blobs").fetchone()[0]
+            for row in rows:
+                last_id = row['id']
+                try:
+                    req_payload = json.loads(row['request'])
+                    resp_payload = json.loads(row['response'])
+                except (TypeError, ValueError):
+                    continue
+                if not isinstance(req_payload, dict):
+                    continue
+                request_blob, response_blob = self.encode(cursor, req_payload, resp_payload)
+                cursor.execute(
+                    "UPDATE logs SET request = '', response = '', codec = ?, request_blob = ?, response_blob = ? WHERE id = ?",
+                    (self.codec, request_blob, response_blob, row['id'])
+                )
+                stats['rows'] += 1
+                stats['original_bytes'] += len(row['request'].encode('utf-8')) + len(row['response'].encode('utf-8'))
+                stats['compact_bytes'] += len(request_blob) + len(response_blob)
+            conn.commit()
+            stats['new_blob_bytes'] += conn.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM log_blobs").fetchone()[0] - blob_bytes_before
+        return stats
+
+def storage_report(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Row counts and payload bytes of the logs table in each format"""
+    legacy_rows, legacy_bytes = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(request AS BLOB)) + LENGTH(CAST(response AS BLOB))), 0) "
+        "FROM logs WHERE request_blob IS NULL"
+    ).fetchone()
+    compact_rows, compact_bytes = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(LENGTH(request_blob) + LENGTH(response_blob)), 0) "
+        "FROM logs WHERE request_blob IS NOT NULL"
+    ).fetchone()
+    blob_rows, blob_bytes, blob_raw_bytes = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0), COALESCE(SUM(size), 0) FROM log_blobs"
+    ).fetchone()
+    return {
+        'legacy_rows': legacy_rows,
+        'legacy_bytes': legacy_bytes,
+        'compact_rows': compact_rows,
+        'compact_bytes': compact_bytes,
+        'message_blobs': blob_rows,
+        'message_blob_bytes': blob_bytes,
+        'message_blob_raw_bytes': blob_raw_bytes
+    }
+
+# Shared by API.report so the hash cache spans every logged call
+log_store = LogStore()
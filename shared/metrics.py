@@ -0,0 +1,288 @@
+import os
+import time
+import bisect
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds, roughly doubling from 5 ms to 2 minutes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with O(log buckets) recording.
+
+    Memory does not grow with the number of observations; percentiles are
+    estimated as the upper bound of the bucket they fall in.
+    """
+
+    def __init__(self, name: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.buckets = tuple(buckets)
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction: float) -> float:
+        """Bucket upper bound at or below which `fraction` of observations fall"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'avg': self.total / self.count if self.count else 0.0,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'max': self.max
+        }
+
+    def merge(self, other: 'LatencyHistogram'):
+        """Add another histogram with the same buckets into this one"""
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+class Gauge:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value: float):
+        self.value = value
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class MetricsRegistry:
+    """Histograms, counters and gauges keyed by metric name and labels.
+
+    Recording is a dict lookup and a bucket increment, cheap enough for
+    every message and stream. The registry renders in the Prometheus text
+    format, which the dashboard serves at /metrics from the same process.
+    """
+
+    def __init__(self):
+        self._histograms: Dict[str, Dict[LabelKey, LatencyHistogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, Counter]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, Gauge]] = {}
+        self._help: Dict[str, str] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+
+    @staticmethod
+    def _key(labels: Dict[str, object]) -> LabelKey:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def describe(self, name: str, help_text: str, buckets: Optional[Sequence[float]] = None):
+        self._help[name] = help_text
+        if buckets is not None:
+            self._buckets[name] = buckets
+
+    def histogram(self, name: str, **labels) -> LatencyHistogram:
+        series = self._histograms.setdefault(name, {})
+        key = self._key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = LatencyHistogram(name, self._buckets.get(name, DEFAULT_BUCKETS))
+        return histogram
+
+    def counter(self, name: str, **labels) -> Counter:
+        series = self._counters.setdefault(name, {})
+        key = self._key(labels)
+        counter = series.get(key)
+        if counter is None:
+            counter = series[key] = Counter()
+        return counter
+
+    def gauge(self, name: str, **labels) -> Gauge:
+        series = self._gauges.setdefault(name, {})
+        key = self._key(labels)
+        gauge = series.get(key)
+        if gauge is None:
+            gauge = series[key] = Gauge()
+        return gauge
+
+    def observe(self, name: str, seconds: float, **labels):
+        self.histogram(name, **labels).observe(seconds)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        self.counter(name, **labels).inc(amount)
+
+    def set(self, name: str, value: float, **labels):
+        self.gauge(name, **labels).set(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """Observe the time spent in the with block, including awaits"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def merged(self, name: str, by: str) -> Dict[str, LatencyHistogram]:
+        """Histograms of name combined across every label except by"""
+        merged: Dict[str, LatencyHistogram] = {}
+        for key, histogram in self._histograms.get(name, {}).items():
+            group = dict(key).get(by, '')
+            if group not in merged:
+                merged[group] = LatencyHistogram(name, histogram.buckets)
+            merged[group].merge(histogram)
+        return merged
+
+    def counters(self, name: str) -> Dict[LabelKey, float]:
+        return {key: counter.value for key, counter in self._counters.get(name, {}).items()}
+
+    @staticmethod
+    def _labels(key: LabelKey, extra: str = '') -> str:
+        parts = [f'{name}="{_escape(value)}"' for name, value in key]
+        if extra:
+            parts.append(extra)
+        return '{' + ','.join(parts) + '}' if parts else ''
+
+    def render_prometheus(self) -> str:
+        lines = []
+        for name, series in sorted(self._counters.items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for key, counter in series.items():
+                lines.append(f"{name}{self._labels(key)} {counter.value}")
+        for name, series in sorted(self._gauges.items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, gauge in series.items():
+                lines.append(f"{name}{self._labels(key)} {gauge.value}")
+        for name, series in sorted(self._histograms.items()):
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = 'le="%s"' % bound
+                    lines.append(f"{name}_bucket{self._labels(key, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{name}_bucket{self._labels(key, le)} {histogram.count}")
+                lines.append(f"{name}_sum{self._labels(key)} {histogram.total}")
+                lines.append(f"{name}_count{self._labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, text: Optional[str] = None):
+        """Write the Prometheus text (or text rendered earlier) to path, replacing it atomically"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text if text is not None else self.render_prometheus())
+        os.replace(tmp_path, path)
+
+class RequestTiming:
+    """Timings of one completion request, restarted by each attempt.
+
+    For streams, chunk() is called as each content chunk arrives, giving the
+    time to first token and the gaps between chunks.
+    """
+
+    __slots__ = ('requested_at', 'received_at', '_started', '_first', '_last', '_finished',
+                 'chunks', '_gap_total', '_gap_max')
+
+    def __init__(self):
+        self.start()
+
+    def start(self):
+        self.requested_at = int(time.time() * 1000)
+        self.received_at = None
+        self._started = time.perf_counter()
+        self._first = self._last = self._finished = None
+        self.chunks = 0
+        self._gap_total = 0.0
+        self._gap_max = 0.0
+
+    def chunk(self):
+        now = time.perf_counter()
+        if self._first is None:
+            self._first = now
+        else:
+            gap = now - self._last
+            self._gap_total += gap
+            if gap > self._gap_max:
+                self._gap_max = gap
+        self._last = now
+        self.chunks += 1
+
+    def finish(self):
+        self._finished = time.perf_counter()
+        self.received_at = int(time.time() * 1000)
+
+    @property
+    def first_token(self) -> Optional[float]:
+        """Seconds from sending the request to the first chunk"""
+        return self._first - self._started if self._first is not None else None
+
+    @property
+    def duration(self) -> float:
+        """Seconds from sending the request to finish(), or until now"""
+        finished = self._finished if self._finished is not None else time.perf_counter()
+        return finished - self._started
+
+    def columns(self) -> Dict[str, Optional[float]]:
+        """Timing columns of the logs table, in milliseconds"""
+        first_token = self.first_token
+        return {
+            'first_token_ms': round(first_token * 1000) if first_token is not None else None,
+            'duration_ms': round(self.duration * 1000),
+            'chunk_count': self.chunks,
+            'gap_mean_ms': self._gap_total * 1000 / (self.chunks - 1) if self.chunks > 1 else None,
+            'gap_max_ms': round(self._gap_max * 1000) if self.chunks > 1 else None
+        }
+
+# Metric names shared by the cogs, the API client and the !perf command
+STAGE_SECONDS = 'splintertree_stage_seconds'
+FIRST_TOKEN_SECONDS = 'splintertree_upstream_first_token_seconds'
+COMPLETION_SECONDS = 'splintertree_upstream_completion_seconds'
+CLASSIFY_SECONDS = 'splintertree_classify_seconds'
+COMPLETIONS_TOTAL = 'splintertree_completions_total'
+TOKENS_TOTAL = 'splintertree_tokens_total'
+MESSAGES_TOTAL = 'splintertree_messages_total'
+
+# Written periodically when bot.py runs without the dashboard, for file-based scrapers
+METRICS_FILE = os.getenv('METRICS_FILE', 'metrics.prom')
+
+# Process-wide registry; the dashboard serves it at /metrics, and a standalone bot writes it to METRICS_FILE
+metrics = MetricsRegistry()
+metrics.describe(STAGE_SECONDS, "Time spent in each stage of handling a message")
+metrics.describe(FIRST_TOKEN_SECONDS, "Time from sending a completion request to its first streamed chunk")
+metrics.describe(COMPLETION_SECONDS, "Time from sending a completion request to its last chunk or response")
+metrics.describe(CLASSIFY_SECONDS, "Latency of the routing classification call")
+metrics.describe(COMPLETIONS_TOTAL, "Completion requests by model and outcome")
+metrics.describe(TOKENS_TOTAL, "Prompt, cached and completion tokens by model")
+metrics.describe(MESSAGES_TOTAL, "Messages handled by cog and outcome")
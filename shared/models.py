@@ -0,0 +1,160 @@
+import os
+import re
+import json
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+MODELS_FILE = 'models.json'
+TEMPERATURES_FILE = 'temperatures.json'
+
+class ModelSnapshot:
+    """One immutable version of the model configuration and everything derived from it.
+
+    Requests take a snapshot once and use it throughout, so a reload never
+    changes the models seen by a request that is already in flight.
+    """
+
+    def __init__(self, config: dict, temperatures: dict, version: int = 0):
+        self.version = version
+        self.models: Dict[str, dict] = {}
+        for model_id, entry in config['models'].items():
+            model_config = dict(entry)
+            model_config['temperature'] = temperatures.get(entry.get('temperature_key'), entry.get('temperature', 0.7))
+            model_config.setdefault('keywords', [])
+            model_config.setdefault('supports_vision', False)
+            model_config.setdefault('prompt_key', model_id)
+            self.models[model_id] = model_config
+
+        self.default = self.models[config.get('default_model', next(iter(self.models)))]
+        self.vision = self.models.get(config.get('vision_model')) or self.default
+        self.router = self.models.get(config.get('router_model')) or self.default
+        self._by_name = {model_config['name'].lower(): model_config for model_config in self.models.values()}
+
+        # Trigger words of earlier models win, as with checking each model in order
+        self._trigger_owner: Dict[str, int] = {}
+        self._ordered = list(self.models.values())
+        for index, model_config in enumerate(self._ordered):
+            for word in model_config['trigger_words']:
+                self._trigger_owner.setdefault(word.lower(), index)
+        words = sorted(self._trigger_owner, key=len, reverse=True)
+        self._trigger_pattern = re.compile('|'.join(re.escape(word) for word in words)) if words else None
+
+        trigger_words = '|'.join(re.escape(word) for word in self._trigger_owner)
+        self.bypass_keywords = [
+            r'\b(use|switch to|try|with)\s+(' + trigger_words + r')\b',
+            r'\b(' + trigger_words + r')\s+(please|now|instead)\b',
+            r'^(' + trigger_words + r')[,:]\s',
+            r'\b(' + trigger_words + r')\b'
+        ]
+
+        # Model list for the routing prompt, e.g. "1. Sonar - Current events, ..."
+        routing = [self.models[model_id] for model_id in config.get('routing_order', self.models) if model_id in self.models]
+        self.routing_labels = [model_config['name'] for model_config in routing]
+        self.routing_list = "\n".join(
+            f"{i}. {model_config['name']} - {model_config.get('route_description', ', '.join(model_config['keywords']))}"
+            for i, model_config in enumerate(routing, 1)
+        )
+
+        # Model details as shown by the help commands
+        self.vision_models: List[dict] = []
+        self.text_models: List[dict] = []
+        for model_config in self.models.values():
+            model_info = {
+                'name': model_config['name'],
+                'nickname': model_config.get('nickname', model_config['name']),
+                'trigger_words': model_config['trigger_words'],
+                'supports_vision': model_config['supports_vision'],
+                'model': model_config['model'],
+                'provider': model_config.get('provider', 'openrouter'),
+                'description': ', '.join(model_config['keywords'])
+            }
+            (self.vision_models if model_info['supports_vision'] else self.text_models).append(model_info)
+
+        self._derived: Dict[str, Any] = {}
+
+    def match_trigger(self, content: str) -> Optional[dict]:
+        """The first model, in config order, with a trigger word anywhere in content"""
+        if self._trigger_pattern is None:
+            return None
+        best = None
+        for match in self._trigger_pattern.finditer(content.lower()):
+            index = self._trigger_owner[match.group(0)]
+            if best is None or index < best:
+                best = index
+                if best == 0:
+                    break
+        return self._ordered[best] if best is not None else None
+
+    def by_name(self, name: str) -> Optional[dict]:
+        return self._by_name.get(name.strip().lower())
+
+    def derived(self, key: str, build: Callable[['ModelSnapshot'], Any]) -> Any:
+        """Value computed once per snapshot, such as formatted help text"""
+        if key not in self._derived:
+            self._derived[key] = build(self)
+        return self._derived[key]
+
+class ModelRegistry:
+    """Model configuration loaded from models.json and temperatures.json.
+
+    A reload builds a complete new ModelSnapshot and then swaps it in with a
+    single assignment; a broken file keeps the previous snapshot. Files are
+    checked for changes at most every check_interval seconds.
+    """
+
+    def __init__(self, models_file: str = MODELS_FILE, temperatures_file: str = TEMPERATURES_FILE,
+                 check_interval: float = 5.0):
+        self.models_file = models_file
+        self.temperatures_file = temperatures_file
+        self.check_interval = check_interval
+        self._snapshot: Optional[ModelSnapshot] = None
+        self._mtimes = None
+        self._next_check = 0.0
+
+    def _file_mtimes(self):
+        mtimes = []
+        for path in (self.models_file, self.temperatures_file):
+            try:
+                mtimes.append(os.stat(path).st_mtime)
+            except OSError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def reload(self) -> ModelSnapshot:
+        """Load both files now; raises if the model config is invalid"""
+        mtimes = self._file_mtimes()
+        with open(self.models_file, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        temperatures = {}
+        try:
+            with open(self.temperatures_file, 'r') as f:
+                temperatures = json.load(f)
+        except Exception as e:
+            logging.error(f"[Models] Failed to load {self.temperatures_file}: {e}")
+
+        version = self._snapshot.version + 1 if self._snapshot else 1
+        snapshot = ModelSnapshot(config, temperatures, version)
+        self._snapshot = snapshot
+        self._mtimes = mtimes
+        logging.info(f"[Models] Loaded {len(snapshot.models)} models (version {version})")
+        return snapshot
+
+    @property
+    def snapshot(self) -> ModelSnapshot:
+        """Current configuration, reloaded first if either file changed"""
+        now = time.monotonic()
+        if self._snapshot is None or now >= self._next_check:
+            self._next_check = now + self.check_interval
+            if self._snapshot is None or self._file_mtimes() != self._mtimes:
+                try:
+                    self.reload()
+                except Exception as e:
+                    if self._snapshot is None:
+                        raise
+                    self._mtimes = self._file_mtimes()
+                    logging.error(f"[Models] Failed to reload {self.models_file}, keeping version {self._snapshot.version}: {e}")
+        return self._snapshot
+
+# Shared by UnifiedCog and HelpCog so both see the same version
+model_registry = ModelRegistry()
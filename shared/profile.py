@@ -0,0 +1,74 @@
+import time
+import asyncio
+import logging
+from typing import Callable, Dict
+import discord
+
+class ProfileUpdater:
+    """Debounced per-guild nickname updates that never block a reply.
+
+    Requests only record the persona a guild should show. A background task
+    per guild waits out the debounce window, so a burst of replies becomes
+    one edit, skips the edit if the persona is already shown, and keeps at
+    least min_interval between edits, longer after a 429.
+    """
+
+    def __init__(self, debounce: float = 2.0, min_interval: float = 10.0):
+        self.debounce = debounce
+        self.min_interval = min_interval
+        self._wanted: Dict[int, tuple] = {}  # {guild_id: (persona, make_nick)}
+        self._shown: Dict[int, str] = {}
+        self._next_edit: Dict[int, float] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def request(self, guild: discord.Guild, persona: str, make_nick: Callable[[str], str]):
+        """Ask for guild's nickname to show persona; returns immediately"""
+        if self._shown.get(guild.id) == persona and guild.id not in self._wanted:
+            return
+        self._wanted[guild.id] = (persona, make_nick)
+        task = self._tasks.get(guild.id)
+        if task is None or task.done():
+            self._tasks[guild.id] = asyncio.create_task(self._run(guild))
+
+    async def _run(self, guild: discord.Guild):
+        try:
+            while guild.id in self._wanted:
+                delay = max(self.debounce, self._next_edit.get(guild.id, 0) - time.monotonic())
+                await asyncio.sleep(delay)
+                persona, make_nick = self._wanted.pop(guild.id)
+                if self._shown.get(guild.id) == persona:
+                    continue
+                await self._apply(guild, persona, make_nick)
+        finally:
+            self._tasks.pop(guild.id, None)
+
+    async def _apply(self, guild: discord.Guild, persona: str, make_nick: Callable[[str], str]):
+        # Ensure nickname doesn't exceed Discord's 32-character limit
+        nick = make_nick(persona)[:32]
+        try:
+            await guild.me.edit(nick=nick)
+            self._shown[guild.id] = persona
+            self._next_edit[guild.id] = time.monotonic() + self.min_interval
+            logging.debug(f"[ProfileUpdater] Updated profile in {guild.name} to {nick}")
+        except discord.HTTPException as e:
+            if e.status != 429:
+                logging.error(f"[ProfileUpdater] Failed to update profile in {guild.name}: {str(e)}")
+                return
+            retry_after = float(getattr(e, 'retry_after', 0) or 0)
+            logging.warning(f"[ProfileUpdater] Nickname edit rate limited in {guild.name}, retrying in {retry_after:.1f}s")
+            self._next_edit[guild.id] = time.monotonic() + max(self.min_interval, retry_after)
+            # Retry unless a newer persona was requested meanwhile
+            self._wanted.setdefault(guild.id, (persona, make_nick))
+        except Exception as e:
+            logging.error(f"[ProfileUpdater] Failed to update profile in {guild.name}: {str(e)}")
+
+    async def close(self):
+        """Cancel pending updates"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._wanted.clear()
+
+# Shared across cogs so personas in one guild coalesce into a single nickname edit
+profile_updater = ProfileUpdater()
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import logging
+from datetime import datetime
+from string import Formatter
+from typing import Dict, List, Optional, Tuple, Union
+from zoneinfo import ZoneInfo
+
+CONSOLIDATED_PROMPTS_FILE = 'prompts/consolidated_prompts.json'
+DYNAMIC_PROMPTS_FILE = 'dynamic_prompts.json'
+
+# Looked up once instead of on every message
+PACIFIC = ZoneInfo('America/Los_Angeles')
+
+# Fields that change between turns or speakers, with the text that stands in for them in a cacheable prompt
+VOLATILE_FIELDS = {
+    'TIME': 'the current time given with the latest message',
+    'USERNAME': 'the username given with the latest message',
+    'DISCORD_USER_ID': 'the Discord user ID given with the latest message'
+}
+
+class CompiledPrompt:
+    """A prompt template parsed once into literal text and fields.
+
+    Rendering only looks up the fields and joins them with the literal
+    segments, which are shared by every request. Templates that use
+    attribute or index lookups fall back to str.format.
+    """
+
+    __slots__ = ('source', '_segments', '_fallback')
+
+    def __init__(self, source: str):
+        self.source = source
+        self._fallback = False
+        segments: List[Union[str, Tuple[str, str, Optional[str]]]] = []
+        try:
+            for literal, field, spec, conversion in Formatter().parse(source):
+                if literal:
+                    if segments and isinstance(segments[-1], str):
+                        segments[-1] += literal
+                    else:
+                        segments.append(literal)
+                if field is None:
+                    continue
+                if not field or not field.isidentifier() or '{' in (spec or ''):
+                    self._fallback = True
+                segments.append((field, spec or '', conversion))
+        except ValueError:
+            # Malformed braces; str.format raises the same error at render time
+            self._fallback = True
+        self._segments = segments
+
+    def render(self, **values) -> str:
+        """Same result as source.format(**values)"""
+        if self._fallback:
+            return self.source.format(**values)
+        parts = []
+        for segment in self._segments:
+            if isinstance(segment, str):
+                parts.append(segment)
+                continue
+            field, spec, conversion = segment
+            value = values[field]
+            if conversion == 'r':
+                value = repr(value)
+            elif conversion == 'a':
+                value = ascii(value)
+            elif conversion == 's':
+                value = str(value)
+            parts.append(format(value, spec))
+        return ''.join(parts)
+
+    def render_cacheable(self, **values) -> Tuple[str, str]:
+        """Render with volatile fields moved out of the prompt.
+
+        Returns the prompt, which stays byte-identical between turns so
+        providers can cache it, and a note with the volatile values to send
+        after the cached prefix (empty if the template uses none).
+        """
+        used = [] if self._fallback else [
+            segment[0] for segment in self._segments
+            if not isinstance(segment, str) and segment[0] in VOLATILE_FIELDS
+        ]
+        if not used:
+            return self.render(**values), ''
+        stable = dict(values)
+        stable.update({field: VOLATILE_FIELDS[field] for field in used})
+        note = ', '.join(f"{field.lower().replace('_', ' ')}: {values[field]}" for field in dict.fromkeys(used))
+        return self.render(**stable), f"[Current {note}]"
+
+class PromptRegistry:
+    """Compiled system prompts and per-channel overrides, cached in memory.
+
+    Both JSON files are parsed once and reloaded only when their
+    modification time changes, checked at most every check_interval seconds.
+    """
+
+    def __init__(self, prompts_file: str = CONSOLIDATED_PROMPTS_FILE, overrides_file: str = DYNAMIC_PROMPTS_FILE,
+                 check_interval: float = 2.0):
+        self.prompts_file = prompts_file
+        self.overrides_file = overrides_file
+        self.check_interval = check_interval
+        self._templates: Dict[str, CompiledPrompt] = {}
+        self._overrides: Dict[Tuple[str, str], CompiledPrompt] = {}  # {(channel_id, agent): prompt}
+        self._compiled: Dict[str, CompiledPrompt] = {}  # Defaults passed in by callers
+        self._mtimes: Dict[str, Optional[float]] = {}
+        self._next_check = 0.0
+
+    @staticmethod
+    def _mtime(path: str) -> Optional[float]:
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    @staticmethod
+    def _read(path: str) -> dict:
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+
+        mtime = self._mtime(self.prompts_file)
+        if self.prompts_file not in self._mtimes or mtime != self._mtimes[self.prompts_file]:
+            try:
+                prompts = self._read(self.prompts_file).get('system_prompts', {})
+                self._templates = {key.lower(): CompiledPrompt(text) for key, text in prompts.items()}
+                logging.info(f"[Prompts] Loaded {len(self._templates)} system prompts")
+            except Exception as e:
+                logging.error(f"[Prompts] Failed to load {self.prompts_file}: {e}")
+            self._mtimes[self.prompts_file] = mtime
+
+        mtime = self._mtime(self.overrides_file)
+        if self.overrides_file not in self._mtimes or mtime != self._mtimes[self.overrides_file]:
+            try:
+                self._overrides = self._flatten(self._read(self.overrides_file))
+            except Exception as e:
+                logging.error(f"[Prompts] Failed to load {self.overrides_file}: {e}")
+            self._mtimes[self.overrides_file] = mtime
+
+    @staticmethod
+    def _flatten(dynamic_prompts: dict) -> Dict[Tuple[str, str], CompiledPrompt]:
+        """Map {guild: {channel: {agent: prompt}}} and {channel: {agent: prompt}} to (channel, agent) keys"""
+        overrides = {}
+        for outer_id, entries in dynamic_prompts.items():
+            for key, value in entries.items():
+                if isinstance(value, dict):
+                    for agent, prompt in value.items():
+                        overrides[(key, agent.lower())] = CompiledPrompt(prompt)
+                else:
+                    overrides[(outer_id, key.lower())] = CompiledPrompt(value)
+        return overrides
+
+    def compile(self, source: str) -> CompiledPrompt:
+        """Compiled form of a template that is not in the prompt files"""
+        compiled = self._compiled.get(source)
+        if compiled is None:
+            compiled = self._compiled[source] = CompiledPrompt(source)
+        return compiled
+
+    def get(self, key: str, *aliases: str, channel_id=None, default: str = None) -> Optional[CompiledPrompt]:
+        """Channel override for key or any alias, else the system prompt for key"""
+        self._refresh()
+        if channel_id is not None:
+            channel_id = str(channel_id)
+            for name in (key,) + aliases:
+                override = self._overrides.get((channel_id, name.lower()))
+                if override is not None:
+                    return override
+        template = self._templates.get(key.lower())
+        if template is not None:
+            return template
+        return self.compile(default) if default is not None else None
+
+    def _update_overrides(self, guild_id: Optional[str], channel_id: str, agent: str, prompt: Optional[str]) -> bool:
+        """Write one override (or remove it when prompt is None) and update the cache"""
+        dynamic_prompts = self._read(self.overrides_file)
+        scope = dynamic_prompts.setdefault(guild_id, {}) if guild_id else dynamic_prompts
+        channel = scope.setdefault(channel_id, {})
+        changed = True
+        if prompt is None:
+            changed = channel.pop(agent, None) is not None
+            if not channel:
+                del scope[channel_id]
+            if guild_id and not scope:
+                del dynamic_prompts[guild_id]
+        else:
+            channel[agent] = prompt
+
+        with open(self.overrides_file, 'w') as f:
+            json.dump(dynamic_prompts, f, indent=4)
+        self._overrides = self._flatten(dynamic_prompts)
+        self._mtimes[self.overrides_file] = self._mtime(self.overrides_file)
+        return changed
+
+    def set_override(self, guild_id: Optional[str], channel_id: str, agent: str, prompt: str):
+        self._update_overrides(guild_id, channel_id, agent, prompt)
+
+    def reset_override(self, guild_id: Optional[str], channel_id: str, agent: str) -> bool:
+        """Remove an override; returns False if there was none"""
+        return self._update_overrides(guild_id, channel_id, agent, None)
+
+def prompt_time() -> str:
+    """Current Pacific time as shown in system prompts"""
+    return datetime.now(PACIFIC).strftime("%I:%M %p")
+
+# Shared by every cog so the prompt files are parsed once per change
+prompt_registry = PromptRegistry()
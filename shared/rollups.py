@@ -0,0 +1,353 @@
+import json
+import math
+import time
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+DB_PATH = 'databases/interaction_logs.db'
+
+MINUTE, HOUR, DAY = 60, 3600, 86400
+
+# How long each resolution is kept. Minute and hour buckets are both built from
+# raw rows, so expired minutes are simply dropped; expired hours are merged into days.
+RETENTION = {MINUTE: 2 * DAY, HOUR: 90 * DAY, DAY: None}
+
+SOURCES = ('logs', 'messages')
+DIMENSIONS = ('model', 'guild_id', 'persona')
+METRICS = ('count', 'errors', 'error_rate', 'prompt_tokens', 'completion_tokens', 'tokens',
+           'latency_p50', 'latency_p95', 'latency_p99', 'first_token_p50', 'first_token_p95', 'first_token_p99')
+
+class LatencySketch:
+    """Mergeable latency sketch with bounded relative error.
+
+    Values (milliseconds) fall into logarithmic bins whose width is a fixed
+    fraction of their value, so any quantile is estimated within
+    relative_accuracy, however many values were added. Sketches merge by
+    adding bin counts, which is what lets minute buckets combine into hours,
+    hours into days, and guilds into a model's series.
+    """
+
+    __slots__ = ('gamma', 'bins', 'count')
+
+    def __init__(self, relative_accuracy: float = 0.02):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.bins: Dict[int, int] = {}
+        self.count = 0
+
+    def add(self, value: float):
+        index = math.ceil(math.log(value, self.gamma)) if value > 1 else 0
+        self.bins[index] = self.bins.get(index, 0) + 1
+        self.count += 1
+
+    def merge(self, other: 'LatencySketch'):
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.count += other.count
+
+    def quantile(self, fraction: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = fraction * (self.count - 1)
+        seen = 0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1) if index else 1.0
+        return None
+
+    def dumps(self) -> Optional[str]:
+        return json.dumps(sorted(self.bins.items()), separators=(',', ':')) if self.count else None
+
+    @classmethod
+    def loads(cls, data: Optional[str]) -> 'LatencySketch':
+        sketch = cls()
+        for index, count in json.loads(data) if data else ():
+            sketch.bins[index] = count
+            sketch.count += count
+        return sketch
+
+class Bucket:
+    """Aggregates of one rollups row"""
+
+    __slots__ = ('count', 'errors', 'prompt_tokens', 'completion_tokens', 'latency', 'first_token')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency = LatencySketch()
+        self.first_token = LatencySketch()
+
+    def merge(self, other: 'Bucket'):
+        self.count += other.count
+        self.errors += other.errors
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.latency.merge(other.latency)
+        self.first_token.merge(other.first_token)
+
+    @classmethod
+    def from_row(cls, row) -> 'Bucket':
+        bucket = cls()
+        bucket.count = row['count']
+        bucket.errors = row['errors']
+        bucket.prompt_tokens = row['prompt_tokens']
+        bucket.completion_tokens = row['completion_tokens']
+        bucket.latency = LatencySketch.loads(row['latency'])
+        bucket.first_token = LatencySketch.loads(row['first_token'])
+        return bucket
+
+    def value(self, metric: str) -> Optional[float]:
+        if metric in ('count', 'errors', 'prompt_tokens', 'completion_tokens'):
+            return getattr(self, metric)
+        if metric == 'tokens':
+            return self.prompt_tokens + self.completion_tokens
+        if metric == 'error_rate':
+            return self.errors / self.count if self.count else None
+        sketch, _, percentile = metric.rpartition('_p')
+        return getattr(self, sketch).quantile(int(percentile) / 100)
+
+# (resolution, bucket start, source, model, guild_id, persona)
+RollupKey = Tuple[int, int, str, str, str, str]
+
+def _epoch(value: str) -> float:
+    """Epoch seconds or an ISO datetime, as epoch seconds"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+class Rollups:
+    """Per-minute, per-hour and per-day aggregates of the logs and messages tables.
+
+    update() folds rows added since its last run into minute and hour
+    buckets per model, guild and persona: request count, errors, tokens,
+    and latency sketches. series() reads only these buckets, so a chart
+    costs the same however much history the raw tables hold.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, batch_size: int = 5000, compact_interval: float = 3600):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.compact_interval = compact_interval
+        self._last_compaction = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def update(self) -> int:
+        """Roll up new rows and compact expired buckets; returns the number of rows rolled up"""
+        with self._connect() as conn:
+            rolled = self._roll_up(conn, 'logs', self._log_rows) + self._roll_up(conn, 'messages', self._message_rows)
+            if time.time() - self._last_compaction >= self.compact_interval:
+                self.compact(conn)
+                self._last_compaction = time.time()
+        return rolled
+
+    def _roll_up(self, conn: sqlite3.Connection, source: str, read_rows) -> int:
+        row = conn.execute("SELECT last_id FROM rollup_state WHERE source = ?", (source,)).fetchone()
+        last_id = row['last_id'] if row else 0
+        total = 0
+        while True:
+            rows = conn.execute(read_rows, (last_id, self.batch_size)).fetchall()
+            if not rows:
+                return total
+            buckets: Dict[RollupKey, Bucket] = {}
+            for row in rows:
+                self._add_row(buckets, source, row)
+            last_id = rows[-1]['id']
+            # The watermark moves in the same transaction as the buckets it accounts for
+            self._merge(conn, buckets.items())
+            conn.execute("INSERT OR REPLACE INTO rollup_state (source, last_id) VALUES (?, ?)", (source, last_id))
+            conn.commit()
+            total += len(rows)
+
+    _log_rows = """
+        SELECT id, requested_at, received_at, model, guild_id, status_code, duration_ms, first_token_ms,
+               prompt_tokens, completion_tokens
+        FROM logs WHERE id > ? ORDER BY id LIMIT ?
+    """
+    _message_rows = "SELECT id, timestamp, guild_id, persona_name FROM messages WHERE id > ? ORDER BY id LIMIT ?"
+
+    @staticmethod
+    def _add_row(buckets: Dict[RollupKey, Bucket], source: str, row):
+        if source == 'logs':
+            at = row['requested_at'] / 1000
+            dimensions = (row['model'] or '', row['guild_id'] or '', '')
+        else:
+            try:
+                at = datetime.fromisoformat(row['timestamp']).timestamp()
+            except (TypeError, ValueError):
+                return
+            dimensions = ('', row['guild_id'] or '', row['persona_name'] or '')
+        for resolution in (MINUTE, HOUR):
+            key = (resolution, int(at // resolution * resolution), source) + dimensions
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = Bucket()
+            bucket.count += 1
+            if source != 'logs':
+                continue
+            if row['status_code'] >= 400:
+                bucket.errors += 1
+            bucket.prompt_tokens += row['prompt_tokens'] or 0
+            bucket.completion_tokens += row['completion_tokens'] or 0
+            duration = row['duration_ms'] if row['duration_ms'] is not None else row['received_at'] - row['requested_at']
+            if duration >= 0:
+                bucket.latency.add(duration)
+            if row['first_token_ms'] is not None:
+                bucket.first_token.add(row['first_token_ms'])
+
+    @staticmethod
+    def _merge(conn: sqlite3.Connection, buckets: Iterable[Tuple[RollupKey, Bucket]]):
+        """Add buckets into the rollups rows with the same keys"""
+        for key, bucket in buckets:
+            existing = conn.execute(
+                "SELECT * FROM rollups WHERE resolution = ? AND bucket = ? AND source = ? "
+                "AND model = ? AND guild_id = ? AND persona = ?", key
+            ).fetchone()
+            if existing:
+                merged = Bucket.from_row(existing)
+                merged.merge(bucket)
+                bucket = merged
+            conn.execute(
+                "INSERT OR REPLACE INTO rollups (resolution, bucket, source, model, guild_id, persona, count, errors, "
+                "prompt_tokens, completion_tokens, latency, first_token) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (*key, bucket.count, bucket.errors, bucket.prompt_tokens, bucket.completion_tokens,
+                 bucket.latency.dumps(), bucket.first_token.dumps())
+            )
+
+    def compact(self, conn: sqlite3.Connection, now: Optional[float] = None):
+        """Drop minute buckets past retention and merge hour buckets past retention into days"""
+        now = now if now is not None else time.time()
+        conn.execute("DELETE FROM rollups WHERE resolution = ? AND bucket < ?", (MINUTE, now - RETENTION[MINUTE]))
+
+        cutoff = int((now - RETENTION[HOUR]) // DAY * DAY)  # Whole days only, so a day is never merged twice
+        days: Dict[RollupKey, Bucket] = {}
+        for row in conn.execute("SELECT * FROM rollups WHERE resolution = ? AND bucket < ?", (HOUR, cutoff)):
+            key = (DAY, row['bucket'] // DAY * DAY, row['source'], row['model'], row['guild_id'], row['persona'])
+            if key in days:
+                days[key].merge(Bucket.from_row(row))
+            else:
+                days[key] = Bucket.from_row(row)
+        self._merge(conn, days.items())
+        conn.execute("DELETE FROM rollups WHERE resolution = ? AND bucket < ?", (HOUR, cutoff))
+        conn.commit()
+        if days:
+            logging.info(f"[Rollups] Compacted hourly buckets before {datetime.fromtimestamp(cutoff):%Y-%m-%d} into {len(days)} daily buckets")
+
+    @staticmethod
+    def pick_resolution(since: float, until: float, now: Optional[float] = None) -> int:
+        """Finest resolution still retained at since that gives at most ~500 points"""
+        now = now if now is not None else time.time()
+        for resolution in (MINUTE, HOUR):
+            if now - since <= RETENTION[resolution] and (until - since) / resolution <= 500:
+                return resolution
+        return DAY
+
+    def series(self, metric: str = 'count', by: str = 'model', source: Optional[str] = None,
+               since: Optional[str] = None, until: Optional[str] = None,
+               resolution: Optional[str] = None, top: int = 10) -> Dict[str, Any]:
+        """Chart-ready series of metric per value of by.
+
+        Returns {'resolution', 'buckets': [bucket start, ...], 'series':
+        [{'name', 'values'}, ...]} with one value per bucket, the top groups
+        by count first and the rest summed into 'other'. Bucket counts and
+        tokens are 0 where nothing happened; rates and latencies are None.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric: {metric!r}")
+        if by not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension: {by!r}")
+        source = source or ('messages' if by == 'persona' else 'logs')
+        if source not in SOURCES:
+            raise ValueError(f"Unknown source: {source!r}")
+        try:
+            end = _epoch(until) if until else time.time()
+            start = _epoch(since) if since else end - DAY
+        except ValueError as e:
+            raise ValueError(f"Invalid time range: {e}")
+        if resolution:
+            resolution = int(resolution)
+            if resolution not in RETENTION:
+                raise ValueError(f"Resolution must be one of {', '.join(map(str, RETENTION))}")
+        else:
+            resolution = self.pick_resolution(start, end)
+        first = int(start // resolution * resolution)
+
+        sketch_column = metric.rpartition('_p')[0] if '_p' in metric else None
+        columns = ['bucket', by, 'count', 'errors', 'prompt_tokens', 'completion_tokens']
+        if sketch_column:
+            columns.append(sketch_column)
+        # Recent days are still hourly buckets; hours and days never overlap, so daily series read both
+        stored = (HOUR, DAY) if resolution == DAY else (resolution,)
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(columns)} FROM rollups "
+                f"WHERE resolution IN ({', '.join('?' * len(stored))}) AND source = ? AND bucket >= ? AND bucket < ?",
+                (*stored, source, first, end)
+            ).fetchall()
+
+        groups: Dict[str, Dict[int, Bucket]] = {}
+        totals: Dict[str, int] = {}
+        for row in rows:
+            bucket = Bucket()
+            bucket.count = row['count']
+            bucket.errors = row['errors']
+            bucket.prompt_tokens = row['prompt_tokens']
+            bucket.completion_tokens = row['completion_tokens']
+            if sketch_column:
+                setattr(bucket, sketch_column, LatencySketch.loads(row[sketch_column]))
+            name = row[by] or 'unknown'
+            at = row['bucket'] // resolution * resolution
+            series = groups.setdefault(name, {})
+            if at in series:
+                series[at].merge(bucket)
+            else:
+                series[at] = bucket
+            totals[name] = totals.get(name, 0) + bucket.count
+
+        ranked = sorted(totals, key=totals.get, reverse=True)
+        if len(ranked) > top:
+            other: Dict[int, Bucket] = {}
+            for name in ranked[top:]:
+                for start_at, bucket in groups.pop(name).items():
+                    other.setdefault(start_at, Bucket()).merge(bucket)
+            groups['other'] = other
+            ranked = ranked[:top] + ['other']
+
+        buckets = list(range(first, int(end) + 1, resolution))
+        empty = 0 if metric in ('count', 'errors', 'prompt_tokens', 'completion_tokens', 'tokens') else None
+        return {
+            'metric': metric,
+            'by': by,
+            'source': source,
+            'resolution': resolution,
+            'buckets': buckets,
+            'series': [
+                {
+                    'name': name,
+                    'values': [groups[name][at].value(metric) if at in groups[name] else empty for at in buckets]
+                }
+                for name in ranked
+            ]
+        }
+
+    def most_active_persona(self) -> Optional[str]:
+        """Persona with the most messages, from the hourly and daily buckets (which never overlap)"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT persona, SUM(count) AS total FROM rollups "
+                "WHERE source = 'messages' AND persona != '' AND resolution IN (?, ?) "
+                "GROUP BY persona ORDER BY total DESC LIMIT 1",
+                (HOUR, DAY)
+            ).fetchone()
+        return row['persona'] if row else None
+
+# Updated by the bot's update_rollups task and read by the dashboard's /api/series
+rollups = Rollups()
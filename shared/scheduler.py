@@ -0,0 +1,162 @@
+import time
+import asyncio
+import contextvars
+import logging
+from collections import deque
+from typing import Callable, Awaitable, Dict, Any, Optional, List
+from shared.metrics import metrics
+
+QUEUE_DEPTH = 'splintertree_queue_depth'
+QUEUE_IN_FLIGHT = 'splintertree_queue_in_flight'
+QUEUE_WAIT_SECONDS = 'splintertree_queue_wait_seconds'
+metrics.describe(QUEUE_DEPTH, "Messages waiting in channel queues, by guild")
+metrics.describe(QUEUE_IN_FLIGHT, "Messages being handled, by guild")
+metrics.describe(QUEUE_WAIT_SECONDS, "Time messages spent queued before handling started, by guild")
+
+class _Job:
+    __slots__ = ('message', 'handler', 'contents', 'enqueued_at', 'key', 'context')
+
+    def __init__(self, message, handler, key):
+        self.message = message
+        self.handler = handler
+        self.contents = [message.content]
+        self.enqueued_at = time.monotonic()
+        self.key = key
+        self.context = contextvars.copy_context()  # Carries the submitter's trace ID to the worker
+
+class _GuildStats:
+    __slots__ = ('queued', 'in_flight', 'processed', 'coalesced', 'shed', 'wait_total', 'wait_max')
+
+    def __init__(self):
+        self.queued = 0
+        self.in_flight = 0
+        self.processed = 0
+        self.coalesced = 0
+        self.shed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+class MessageScheduler:
+    """Per-channel FIFO queues for LLM message handling.
+
+    Each channel is drained by its own worker so replies keep conversational
+    order. Generations are capped globally and per guild, rapid consecutive
+    messages from the same author are merged into one request, and the
+    oldest pending message is shed when a channel queue gets too deep.
+    """
+
+    def __init__(self, max_concurrent: int = 8, max_per_guild: int = 3, max_queue_depth: int = 10,
+                 coalesce_window: float = 3.0, job_timeout: float = 300):
+        self.max_concurrent = max_concurrent
+        self.max_per_guild = max_per_guild
+        self.max_queue_depth = max_queue_depth
+        self.coalesce_window = coalesce_window
+        self.job_timeout = job_timeout
+        self._global_limit = asyncio.Semaphore(max_concurrent)
+        self._guild_limits: Dict[str, asyncio.Semaphore] = {}
+        self._queues: Dict[str, deque] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._guild_stats: Dict[str, _GuildStats] = {}
+
+    @staticmethod
+    def _guild_key(message) -> str:
+        return str(message.guild.id) if getattr(message, 'guild', None) else 'dm'
+
+    def _stats_for(self, guild_key: str) -> _GuildStats:
+        stats = self._guild_stats.get(guild_key)
+        if stats is None:
+            stats = self._guild_stats[guild_key] = _GuildStats()
+        return stats
+
+    @staticmethod
+    def _publish(guild_key: str, stats: _GuildStats):
+        """Mirror a guild's queue depth and in-flight count into the metrics registry"""
+        metrics.set(QUEUE_DEPTH, stats.queued, guild=guild_key)
+        metrics.set(QUEUE_IN_FLIGHT, stats.in_flight, guild=guild_key)
+
+    def submit(self, message, handler: Callable[..., Awaitable[Any]], key: str = None):
+        """Queue a message for handler(message, full_content=...) in its channel's order"""
+        channel_key = str(message.channel.id)
+        guild_key = self._guild_key(message)
+        stats = self._stats_for(guild_key)
+        queue = self._queues.setdefault(channel_key, deque())
+
+        # Merge into the newest pending job when the same author is still typing
+        if queue:
+            tail = queue[-1]
+            if (tail.key == key and tail.message.author.id == message.author.id
+                    and time.monotonic() - tail.enqueued_at <= self.coalesce_window):
+                tail.contents.append(message.content)
+                tail.message = message
+                stats.coalesced += 1
+                return
+
+        if len(queue) >= self.max_queue_depth:
+            dropped = queue.popleft()
+            stats.queued -= 1
+            stats.shed += 1
+            logging.warning(f"[Scheduler] Channel {channel_key} queue full, shedding message {dropped.message.id}")
+
+        queue.append(_Job(message, handler, key))
+        stats.queued += 1
+        self._publish(guild_key, stats)
+
+        worker = self._workers.get(channel_key)
+        if worker is None or worker.done():
+            self._workers[channel_key] = asyncio.create_task(self._drain(channel_key, guild_key))
+
+    async def _drain(self, channel_key: str, guild_key: str):
+        queue = self._queues[channel_key]
+        stats = self._stats_for(guild_key)
+        guild_limit = self._guild_limits.setdefault(guild_key, asyncio.Semaphore(self.max_per_guild))
+        try:
+            while queue:
+                job = queue.popleft()
+                # Still counted as queued while it waits for a generation slot
+                async with guild_limit, self._global_limit:
+                    stats.queued -= 1
+                    wait = time.monotonic() - job.enqueued_at
+                    stats.wait_total += wait
+                    stats.wait_max = max(stats.wait_max, wait)
+                    metrics.observe(QUEUE_WAIT_SECONDS, wait, guild=guild_key)
+                    stats.in_flight += 1
+                    self._publish(guild_key, stats)
+                    try:
+                        full_content = "\n".join(c for c in job.contents if c) if len(job.contents) > 1 else None
+                        handling = asyncio.create_task(job.handler(job.message, full_content=full_content), context=job.context)
+                        await asyncio.wait_for(handling, self.job_timeout)
+                    except asyncio.TimeoutError:
+                        logging.error(f"[Scheduler] Message {job.message.id} in channel {channel_key} timed out after {self.job_timeout}s")
+                    except Exception as e:
+                        logging.error(f"[Scheduler] Error handling message {job.message.id} in channel {channel_key}: {e}")
+                    finally:
+                        stats.in_flight -= 1
+                        stats.processed += 1
+                        self._publish(guild_key, stats)
+        finally:
+            if not queue:
+                self._queues.pop(channel_key, None)
+            if self._workers.get(channel_key) is asyncio.current_task():
+                del self._workers[channel_key]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Queue depth and wait time per guild"""
+        report = {}
+        for guild_key, stats in self._guild_stats.items():
+            report[guild_key] = {
+                'queued': stats.queued,
+                'in_flight': stats.in_flight,
+                'processed': stats.processed,
+                'coalesced': stats.coalesced,
+                'shed': stats.shed,
+                'avg_wait': (stats.wait_total / stats.processed) if stats.processed else 0.0,
+                'max_wait': stats.wait_max
+            }
+        return report
+
+    async def close(self):
+        """Cancel channel workers"""
+        for worker in list(self._workers.values()):
+            worker.cancel()
+        self._workers.clear()
+        self._queues.clear()
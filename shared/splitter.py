@@ -0,0 +1,180 @@
+import re
+from collections import deque
+from typing import List, Optional
+
+DISCORD_MESSAGE_LIMIT = 2000
+FENCE = '```'
+FENCE_CLOSE = '\n```'
+LANGUAGE = re.compile(r'[\w+\-.#]{1,20}$')
+
+class MessageSplitter:
+    """Incrementally splits streamed text into Discord-sized pages.
+
+    Text is fed as it arrives and finished pages are returned as soon as the
+    tail overflows. Each feed only scans the new text for code fences and
+    pending text is joined lazily, so the cost is O(new text) per call.
+    Pages break at the last newline (or space) that fits, every page starts
+    with the prefix, and a code block that spans pages is closed at the end
+    of one page and reopened with its language at the start of the next.
+    """
+
+    def __init__(self, prefix: str = '', limit: int = DISCORD_MESSAGE_LIMIT):
+        self.prefix = prefix
+        self.limit = limit
+        self._buf = ''         # Joined pending text, starting at absolute offset _base
+        self._base = 0
+        self._parts: List[str] = []  # Fed text not yet joined into _buf
+        self._start = 0        # Absolute offset where the current page's text begins
+        self._end = 0          # Absolute offset of the end of fed text
+        self._open_info: Optional[str] = None  # Language of a fence open at _start
+        self._fences = deque()  # Absolute offsets of fence lines at or after _start
+        self._ticks = 0        # Backticks at the end of the last feed that may start a fence
+        self._strip = False    # Skip leading whitespace of the next text
+
+    def _scan(self, text: str, offset: int):
+        """Record the offsets of code fences, including ones split across feeds"""
+        pos = 0
+        if self._ticks:
+            need = FENCE[self._ticks:]
+            if text.startswith(need):
+                self._fences.append(offset - self._ticks)
+                pos = len(need)
+                self._ticks = 0
+            elif text.strip('`'):
+                self._ticks = 0
+            else:
+                self._ticks += len(text)
+                return
+        while True:
+            found = text.find(FENCE, pos)
+            if found == -1:
+                break
+            self._fences.append(offset + found)
+            pos = found + len(FENCE)
+        tail = text[max(pos, len(text) - 2):]
+        self._ticks = len(tail) - len(tail.rstrip('`'))
+
+    def _text(self) -> str:
+        """Join pending parts, dropping finished text once it is most of the buffer"""
+        consumed = self._start - self._base
+        if self._parts or consumed > 4096 and consumed * 2 > len(self._buf):
+            self._buf = self._buf[consumed:] + ''.join(self._parts)
+            self._base = self._start
+            self._parts = []
+        return self._buf
+
+    def _header(self) -> str:
+        return f"{FENCE}{self._open_info}\n" if self._open_info is not None else ''
+
+    def _open_at(self, position: int) -> Optional[str]:
+        """Language of the fence open just before position, or None if closed"""
+        info = self._open_info
+        buf = self._buf
+        for fence in self._fences:
+            if fence >= position:
+                break
+            if info is None:
+                line_end = buf.find('\n', fence - self._base)
+                info = buf[fence - self._base + 3:line_end] if line_end != -1 else ''
+                if not LANGUAGE.match(info):
+                    info = ''
+            else:
+                info = None
+        return info
+
+    def _overflows(self) -> bool:
+        size = len(self.prefix) + len(self._header()) + self._end - self._start
+        if self._open_info is not None or self._fences:
+            size += len(FENCE_CLOSE)
+        return size > self.limit
+
+    def _skip_whitespace(self):
+        """Move the page start past whitespace, remembering to keep skipping if it runs out"""
+        buf = self._text()
+        position = self._start - self._base
+        while position < len(buf) and buf[position].isspace():
+            position += 1
+        self._start = position + self._base
+        self._strip = self._start == self._end
+
+    def _split(self) -> str:
+        """Finalize one page from the front of the pending text"""
+        buf = self._text()
+        base = self._base
+        header = self._header()
+        reserve = len(FENCE_CLOSE) if self._open_info is not None or self._fences else 0
+        budget = max(1, self.limit - len(self.prefix) - len(header) - reserve)
+        window_end = self._start + budget
+
+        start = self._start - base
+        end = window_end - base
+        split = buf.rfind('\n', start + 1, end + 1)
+        if split - start <= budget // 2:
+            space = buf.rfind(' ', start + 1, end + 1)
+            if space != -1:
+                split = max(split, space)
+        hard = split == -1
+        if hard:
+            split = end
+
+        # Trailing backticks may become a fence once the next feed arrives
+        unsettled = self._end - self._ticks - base
+        if split > unsettled > start:
+            split, hard = unsettled, True
+
+        # Never break between a fence and the end of its line, or its language would be lost
+        for fence in self._fences:
+            fence -= base
+            if fence >= split:
+                break
+            line_end = buf.find('\n', fence)
+            if (line_end == -1 or line_end > split) and fence > start:
+                split, hard = fence, True
+                break
+
+        info = self._open_at(split + base)
+        page = self.prefix + header + buf[start:split]
+        if info is not None:
+            page += FENCE_CLOSE
+        self._start = split + base + (0 if hard else 1)
+        while self._fences and self._fences[0] < self._start:
+            self._fences.popleft()
+        self._open_info = info
+        if info is None:
+            self._skip_whitespace()
+        return page
+
+    def feed(self, text: str) -> List[str]:
+        """Add streamed text and return any pages that are now finished"""
+        if not text:
+            return []
+        self._scan(text, self._end)
+        self._parts.append(text)
+        self._end += len(text)
+        if self._strip:
+            self._skip_whitespace()
+
+        pages = []
+        while self._end > self._start and self._overflows():
+            pages.append(self._split())
+        return pages
+
+    @property
+    def page(self) -> str:
+        """The unfinished tail page, with any open code fence closed"""
+        buf = self._text()
+        page = self.prefix + self._header() + buf[self._start - self._base:]
+        if self._open_at(self._end) is not None:
+            page += FENCE_CLOSE
+        return page
+
+    def finish(self) -> str:
+        """The final page; the splitter should not be fed afterwards"""
+        return self.page
+
+def split_message(text: str, prefix: str = '', limit: int = DISCORD_MESSAGE_LIMIT) -> List[str]:
+    """Split a complete message into Discord-sized pages"""
+    splitter = MessageSplitter(prefix, limit)
+    pages = splitter.feed(text)
+    pages.append(splitter.finish())
+    return pages
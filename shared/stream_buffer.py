@@ -0,0 +1,140 @@
+import time
+import logging
+import uuid
+from collections import OrderedDict
+from typing import Optional, Dict, Callable, Awaitable, List, Any
+
+class _Stream:
+    __slots__ = ('stream_id', 'channel_id', 'guild_id', 'user_id', 'persona_name',
+                 'message_id', 'parts', 'size', 'started_at', 'last_update')
+
+    def __init__(self, stream_id, channel_id, guild_id, user_id, persona_name, message_id):
+        self.stream_id = stream_id
+        self.channel_id = channel_id
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.persona_name = persona_name
+        self.message_id = message_id
+        self.parts: List[str] = []
+        self.size = 0
+        self.started_at = time.monotonic()
+        self.last_update = self.started_at
+
+class StreamAssemblyBuffer:
+    """Assembles streamed assistant replies and persists them on commit.
+
+    Streams are opened with begin(), fed with append() and persisted with
+    commit(). Streams that stop receiving chunks are flushed by
+    flush_abandoned(), and each channel is capped at max_chars_per_channel
+    of buffered text; the oldest stream is flushed early when it overflows.
+    """
+
+    def __init__(self, persist: Callable[..., Awaitable[Any]], idle_timeout: float = 60,
+                 max_chars_per_channel: int = 200_000):
+        self.persist = persist  # async (message_id, channel_id, guild_id, user_id, content, is_assistant, persona_name, emotion)
+        self.idle_timeout = idle_timeout
+        self.max_chars_per_channel = max_chars_per_channel
+        self._streams: Dict[str, _Stream] = {}
+        self._channels: Dict[str, "OrderedDict[str, _Stream]"] = {}
+
+    def begin(self, channel_id, guild_id, user_id, persona_name=None, message_id=None) -> str:
+        """Open a new stream and return its id"""
+        # Unique across restarts, since it is stored as discord_message_id when no real id arrives
+        stream_id = f"stream-{uuid.uuid4().hex}"
+        stream = _Stream(stream_id, str(channel_id), guild_id, user_id, persona_name, message_id)
+        self._streams[stream_id] = stream
+        self._channels.setdefault(stream.channel_id, OrderedDict())[stream_id] = stream
+        return stream_id
+
+    async def append(self, stream_id: str, text: str, message_id=None):
+        """Append a chunk to an open stream"""
+        stream = self._streams.get(stream_id)
+        if stream is None:
+            return
+        if message_id is not None:
+            stream.message_id = message_id
+        if text:
+            stream.parts.append(text)
+            stream.size += len(text)
+        stream.last_update = time.monotonic()
+        await self._enforce_channel_bound(stream.channel_id)
+
+    async def commit(self, stream_id: str, message_id=None, emotion=None) -> Optional[str]:
+        """Close a stream and persist the assembled content"""
+        stream = self._pop(stream_id)
+        if stream is None:
+            logging.warning(f"[StreamBuffer] Commit for unknown or already flushed stream {stream_id}")
+            return None
+        if message_id is not None:
+            stream.message_id = message_id
+        return await self._persist(stream, emotion)
+
+    def discard(self, stream_id: str):
+        """Drop a stream without persisting it"""
+        self._pop(stream_id)
+
+    async def flush_abandoned(self, now: float = None) -> int:
+        """Persist streams that have been idle longer than idle_timeout"""
+        now = now if now is not None else time.monotonic()
+        stale = [s.stream_id for s in self._streams.values() if now - s.last_update >= self.idle_timeout]
+        for stream_id in stale:
+            stream = self._pop(stream_id)
+            if stream:
+                logging.info(f"[StreamBuffer] Flushing abandoned stream {stream_id} in channel {stream.channel_id}")
+                await self._persist(stream, None)
+        return len(stale)
+
+    async def flush_all(self) -> int:
+        """Persist every open stream, e.g. on unload"""
+        return await self.flush_abandoned(now=float('inf'))
+
+    def _pop(self, stream_id: str) -> Optional[_Stream]:
+        stream = self._streams.pop(stream_id, None)
+        if stream is None:
+            return None
+        channel_streams = self._channels.get(stream.channel_id)
+        if channel_streams is not None:
+            channel_streams.pop(stream_id, None)
+            if not channel_streams:
+                del self._channels[stream.channel_id]
+        return stream
+
+    async def _enforce_channel_bound(self, channel_id: str):
+        channel_streams = self._channels.get(channel_id)
+        while channel_streams and sum(s.size for s in channel_streams.values()) > self.max_chars_per_channel:
+            oldest_id = next(iter(channel_streams))
+            stream = self._pop(oldest_id)
+            logging.warning(f"[StreamBuffer] Channel {channel_id} over {self.max_chars_per_channel} buffered chars, flushing {oldest_id} early")
+            await self._persist(stream, None)
+            channel_streams = self._channels.get(channel_id)
+
+    async def _persist(self, stream: _Stream, emotion) -> Optional[str]:
+        content = ''.join(stream.parts)
+        if not content or content.isspace():
+            return None
+        message_id = stream.message_id if stream.message_id is not None else stream.stream_id
+        try:
+            await self.persist(
+                message_id,
+                stream.channel_id,
+                stream.guild_id,
+                stream.user_id,
+                content,
+                True,  # is_assistant
+                stream.persona_name,
+                emotion
+            )
+        except Exception as e:
+            logging.error(f"[StreamBuffer] Failed to persist stream {stream.stream_id}: {e}")
+        return content
+
+    def __len__(self):
+        return len(self._streams)
+
+    def stats(self) -> Dict[str, int]:
+        """Open streams and buffered characters"""
+        return {
+            'open_streams': len(self._streams),
+            'channels': len(self._channels),
+            'buffered_chars': sum(s.size for s in self._streams.values())
+        }
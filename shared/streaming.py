@@ -0,0 +1,134 @@
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional
+import discord
+from shared.splitter import DISCORD_MESSAGE_LIMIT, MessageSplitter
+
+class EditPacer:
+    """Adaptive per-channel interval between streaming message edits.
+
+    The interval backs off when Discord answers with a 429 or when an edit
+    takes long enough that discord.py must have waited on the channel's rate
+    limit bucket, and decays back toward the minimum while edits are fast.
+    """
+
+    def __init__(self, min_interval: float = 0.5, max_interval: float = 5.0, slow_edit: float = 1.0):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.slow_edit = slow_edit
+        self._intervals: Dict[int, float] = {}
+
+    def interval(self, channel_id) -> float:
+        return self._intervals.get(channel_id, self.min_interval)
+
+    def record_edit(self, channel_id, duration: float):
+        """Adjust the interval after a completed edit"""
+        current = self.interval(channel_id)
+        if duration >= self.slow_edit:
+            current = min(self.max_interval, current * 1.5)
+        else:
+            current = max(self.min_interval, current * 0.9)
+        if current <= self.min_interval:
+            self._intervals.pop(channel_id, None)
+        else:
+            self._intervals[channel_id] = current
+
+    def record_rate_limit(self, channel_id, retry_after: float = 0):
+        """Back off after a 429 on this channel"""
+        current = self.interval(channel_id)
+        self._intervals[channel_id] = min(self.max_interval, max(current * 2, retry_after))
+
+# Shared across cogs so every persona in a channel sees the same backoff
+edit_pacer = EditPacer()
+
+class StreamRenderer:
+    """Renders a streamed reply into one or more Discord messages.
+
+    Pages come from an incremental MessageSplitter, so the cost per chunk
+    does not grow with the length of the reply. Edits are paced per channel
+    by an EditPacer and skipped when nothing changed.
+    """
+
+    def __init__(self, channel, prefix: str, pacer: EditPacer = None, message: discord.Message = None,
+                 limit: int = DISCORD_MESSAGE_LIMIT):
+        self.channel = channel
+        self.prefix = prefix
+        self.pacer = pacer or edit_pacer
+        self.limit = limit
+        self.messages: List[discord.Message] = [message] if message else []
+        self._parts: List[str] = []
+        self._splitter = MessageSplitter(prefix, limit)
+        self._finished_pages: List[str] = []  # Pages that overflowed but are not delivered yet
+        self._current: Optional[discord.Message] = message  # Message showing the tail page
+        self._last_content: Optional[str] = None
+        self._last_flush = time.monotonic()
+
+    @property
+    def text(self) -> str:
+        """Full response text without prefixes"""
+        return ''.join(self._parts)
+
+    @property
+    def last_message(self) -> Optional[discord.Message]:
+        return self.messages[-1] if self.messages else None
+
+    async def feed(self, chunk: str):
+        """Add a chunk and update Discord if the channel's interval has elapsed"""
+        if not chunk:
+            return
+        self._parts.append(chunk)
+        self._finished_pages.extend(self._splitter.feed(chunk))
+
+        if time.monotonic() - self._last_flush >= self.pacer.interval(self.channel.id):
+            await self.flush()
+
+    async def flush(self):
+        """Deliver finished pages and the current tail page"""
+        while self._finished_pages:
+            await self._show(self._finished_pages.pop(0), required=True)
+            self._current = None
+            self._last_content = None
+        await self._show(self._splitter.page)
+        self._last_flush = time.monotonic()
+
+    async def finish(self, view: discord.ui.View = None) -> List[discord.Message]:
+        """Deliver everything and attach the view to the final message"""
+        while self._finished_pages:
+            await self._show(self._finished_pages.pop(0), required=True)
+            self._current = None
+            self._last_content = None
+        page = self._splitter.finish()
+        if self._current is None:
+            self._current = await self.channel.send(content=page, view=view)
+            self.messages.append(self._current)
+        else:
+            await self._current.edit(content=page, view=view)
+        self._last_content = page
+        return self.messages
+
+    async def _show(self, content: str, required: bool = False):
+        """Send or edit the current message; finished pages are retried after a 429"""
+        if self._current is None:
+            self._current = await self.channel.send(content)
+            self.messages.append(self._current)
+            self._last_content = content
+            return
+        if content == self._last_content:
+            return
+        for attempt in range(3):
+            start = time.monotonic()
+            try:
+                await self._current.edit(content=content)
+                self._last_content = content
+                self.pacer.record_edit(self.channel.id, time.monotonic() - start)
+                return
+            except discord.HTTPException as e:
+                if e.status != 429:
+                    raise
+                retry_after = float(getattr(e, 'retry_after', 0) or 0)
+                logging.warning(f"[StreamRenderer] Edit rate limited in channel {self.channel.id}, backing off")
+                self.pacer.record_rate_limit(self.channel.id, retry_after)
+                if not required:
+                    return
+                await asyncio.sleep(self.pacer.interval(self.channel.id))
@@ -0,0 +1,225 @@
+import os
+import json
+import asyncio
+import time
+import uuid
+import random
+import logging
+import cProfile
+import functools
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from shared.metrics import metrics, STAGE_SECONDS
+
+PROFILE_DIR = 'profiles'
+
+# Set when a Discord message arrives; tasks and scheduled jobs started for it inherit the ID
+_trace_id: ContextVar[Optional[str]] = ContextVar('trace_id', default=None)
+_trace: ContextVar[Optional['Trace']] = ContextVar('trace', default=None)
+
+class Span:
+    __slots__ = ('name', 'start', 'duration', 'attrs')
+
+    def __init__(self, name: str, start: float, duration: float, attrs: Dict[str, Any]):
+        self.name = name
+        self.start = start
+        self.duration = duration
+        self.attrs = attrs
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'name': self.name, 'start_ms': round(self.start * 1000, 1),
+                'duration_ms': round(self.duration * 1000, 1), **self.attrs}
+
+class Trace:
+    """Spans recorded while one handler processed one message"""
+
+    def __init__(self, trace_id: str, name: str, attrs: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.spans: List[Span] = []
+        self.profile: Optional[cProfile.Profile] = None
+
+    def add_span(self, name: str, duration: float, end: Optional[float] = None, **attrs):
+        """Record a span that ended at end (default now) and lasted duration seconds"""
+        end = time.perf_counter() if end is None else end
+        self.spans.append(Span(name, end - duration - self._started, duration, attrs))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration * 1000, 1) if self.duration is not None else None,
+            'profiled': self.profile is not None,
+            **self.attrs,
+            'spans': [span.to_dict() for span in self.spans]
+        }
+
+class Tracer:
+    """Per-message trace IDs, request spans and sampled profiles.
+
+    A trace ID is assigned when a message arrives and carried by
+    contextvars through the cogs, the scheduler and the API client, which
+    sends it to Helicone and writes it to the logs table. Each handler
+    records its spans in a Trace. With sample_rate N, one in N requests is
+    also profiled with cProfile; only one profile runs at a time, and it
+    covers everything the event loop ran meanwhile. Profiles and their
+    spans are written to profile_dir for download from the dashboard.
+    """
+
+    def __init__(self, sample_rate: int = 0, slow_threshold: float = 20.0, profile_dir: str = PROFILE_DIR,
+                 keep_traces: int = 200, keep_profiles: int = 50):
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.profile_dir = profile_dir
+        self.keep_profiles = keep_profiles
+        self.recent: deque = deque(maxlen=keep_traces)
+        self._profiling = False
+
+    @staticmethod
+    def new_trace_id() -> str:
+        return uuid.uuid4().hex[:16]
+
+    def begin(self, trace_id: Optional[str] = None) -> str:
+        """Assign a trace ID to the current context (a newly arrived message)"""
+        trace_id = trace_id or self.new_trace_id()
+        _trace_id.set(trace_id)
+        return trace_id
+
+    @staticmethod
+    def current_id() -> Optional[str]:
+        trace = _trace.get()
+        return trace.trace_id if trace else _trace_id.get()
+
+    @staticmethod
+    def current() -> Optional[Trace]:
+        return _trace.get()
+
+    def _should_profile(self) -> bool:
+        return self.sample_rate > 0 and not self._profiling and random.random() < 1 / self.sample_rate
+
+    @contextmanager
+    def request(self, name: str, **attrs) -> Iterator[Trace]:
+        """Trace one handler's work on the current message"""
+        trace = Trace(self.current_id() or self.new_trace_id(), name, attrs)
+        token = _trace.set(trace)
+        if self._should_profile():
+            self._profiling = True
+            trace.profile = cProfile.Profile()
+            try:
+                trace.profile.enable()
+            except ValueError:
+                # Another profiler is active in this process
+                trace.profile = None
+                self._profiling = False
+        try:
+            yield trace
+        finally:
+            trace.duration = time.perf_counter() - trace._started
+            if trace.profile is not None:
+                trace.profile.disable()
+                self._profiling = False
+            _trace.reset(token)
+            self._finish(trace)
+
+    def _finish(self, trace: Trace):
+        self.recent.append(trace)
+        if trace.duration >= self.slow_threshold:
+            breakdown = ', '.join(f"{span.name} {span.duration:.2f}s" for span in trace.spans)
+            logging.warning(f"[Trace {trace.trace_id}] {trace.name} took {trace.duration:.2f}s: {breakdown}")
+        if trace.profile is not None:
+            # The spans are copied here; writing and pruning the files happens off the event loop
+            save = functools.partial(self._save_profile, trace.profile, trace.to_dict())
+            try:
+                saving = asyncio.get_running_loop().run_in_executor(None, save)
+            except RuntimeError:
+                self._log_save(trace.trace_id, save)
+                return
+            saving.add_done_callback(lambda future: self._log_save(trace.trace_id, future.result))
+
+    @staticmethod
+    def _log_save(trace_id: str, result):
+        try:
+            result()
+        except Exception as e:
+            logging.error(f"[Trace {trace_id}] Failed to save profile: {e}")
+
+    def _save_profile(self, profile: cProfile.Profile, trace: Dict[str, Any]):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        base = os.path.join(self.profile_dir, f"{int(trace['started_at'])}-{trace['trace_id']}")
+        profile.dump_stats(f"{base}.prof")
+        with open(f"{base}.json", 'w', encoding='utf-8') as f:
+            json.dump(trace, f, indent=2)
+        logging.info(f"[Trace {trace['trace_id']}] Saved profile of {trace['name']} ({trace['duration_ms'] / 1000:.2f}s) to {base}.prof")
+
+        profiles = sorted(name for name in os.listdir(self.profile_dir) if name.endswith('.prof'))
+        for name in profiles[:-self.keep_profiles]:
+            for extension in ('.prof', '.json'):
+                try:
+                    os.remove(os.path.join(self.profile_dir, name[:-len('.prof')] + extension))
+                except OSError:
+                    pass
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[None]:
+        """Record the with block as a span of the current trace, if any"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            trace = _trace.get()
+            if trace is not None:
+                trace.add_span(name, time.perf_counter() - start, **attrs)
+
+    def add_span(self, name: str, duration: float, **attrs):
+        trace = _trace.get()
+        if trace is not None:
+            trace.add_span(name, duration, **attrs)
+
+    def find(self, trace_id: str) -> List[Trace]:
+        return [trace for trace in self.recent if trace.trace_id == trace_id]
+
+def traced(handler):
+    """Run an async handler(self, message, ...) as one traced request"""
+    @functools.wraps(handler)
+    async def wrapper(self, message, *args, **kwargs):
+        channel = getattr(message, 'channel', None)
+        with tracer.request(f"{getattr(self, 'name', type(self).__name__)}.{handler.__name__}",
+                            message_id=str(getattr(message, 'id', '')),
+                            channel_id=str(channel.id) if channel else None):
+            return await handler(self, message, *args, **kwargs)
+    return wrapper
+
+def spanned(name: str):
+    """Record each call of an async function as a span of the current trace"""
+    def decorate(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# Message handling stages feed both the metrics registry and the current trace
+
+def observe_stage(stage: str, seconds: float, model: str):
+    metrics.observe(STAGE_SECONDS, seconds, stage=stage, model=model)
+    tracer.add_span(stage, seconds, model=model)
+
+@contextmanager
+def stage_timer(stage: str, model: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start, model)
+
+# PROFILE_SAMPLE_RATE=N profiles one in N requests; 0 (the default) turns sampling off
+tracer = Tracer(sample_rate=int(os.getenv('PROFILE_SAMPLE_RATE', 0)),
+                slow_threshold=float(os.getenv('SLOW_TRACE_SECONDS', 20)))
@@ -0,0 +1,97 @@
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional, Tuple, Dict, Any
+
+class UserCache:
+    """TTL cache of Discord display names fed from gateway data"""
+
+    def __init__(self, ttl: float = 3600, negative_ttl: float = 300, max_size: int = 50000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # {user_id: (display_name or None, expires_at)}
+        self.hits = 0
+        self.misses = 0
+        self.rest_fetches = 0
+
+    @staticmethod
+    def _display_name(user) -> Optional[str]:
+        """Global display name for a user or member (matches fetch_user().display_name)"""
+        return getattr(user, 'global_name', None) or getattr(user, 'name', None)
+
+    def _store(self, user_id: str, display_name: Optional[str], ttl: float):
+        self._entries[user_id] = (display_name, time.monotonic() + ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def remember(self, user):
+        """Record a user or member object seen on the gateway"""
+        if user is None:
+            return
+        display_name = self._display_name(user)
+        if display_name:
+            self._store(str(user.id), display_name, self.ttl)
+
+    def remember_many(self, users):
+        """Record a batch of users, e.g. a guild member chunk"""
+        for user in users:
+            self.remember(user)
+
+    def forget(self, user_id):
+        """Drop a cached entry"""
+        self._entries.pop(str(user_id), None)
+
+    def get(self, user_id) -> Tuple[bool, Optional[str]]:
+        """Return (found, display_name); a found entry with no name is a negative hit"""
+        entry = self._entries.get(str(user_id))
+        if entry is None:
+            return False, None
+        display_name, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[str(user_id)]
+            return False, None
+        return True, display_name
+
+    async def resolve(self, bot, user_id) -> Optional[str]:
+        """Resolve a display name from the cache, the gateway cache, then REST as a last resort"""
+        user_id = str(user_id)
+        found, display_name = self.get(user_id)
+        if found:
+            self.hits += 1
+            return display_name
+
+        self.misses += 1
+
+        # The client's own gateway cache never costs a request
+        user = bot.get_user(int(user_id)) if bot else None
+        if user is None and bot:
+            try:
+                self.rest_fetches += 1
+                user = await bot.fetch_user(int(user_id))
+            except Exception as e:
+                logging.debug(f"[UserCache] Failed to fetch user {user_id}: {e}")
+                user = None
+
+        if user is None:
+            self._store(user_id, None, self.negative_ttl)
+            return None
+
+        display_name = self._display_name(user)
+        self._store(user_id, display_name, self.ttl if display_name else self.negative_ttl)
+        return display_name
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache size and hit ratio"""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'rest_fetches': self.rest_fetches,
+            'hit_ratio': (self.hits / lookups) if lookups else 0.0
+        }
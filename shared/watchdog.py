@@ -0,0 +1,145 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from shared.metrics import metrics
+
+LOOP_LAG_SECONDS = 'splintertree_loop_lag_seconds'
+LOOP_STALLS_TOTAL = 'splintertree_loop_stalls_total'
+
+# Lag buckets from 1 ms, finer than request latencies
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+metrics.describe(LOOP_LAG_SECONDS, "How late the event loop ran the watchdog's heartbeat", LAG_BUCKETS)
+metrics.describe(LOOP_STALLS_TOTAL, "Heartbeats delayed past the watchdog threshold")
+
+StackKey = Tuple[Tuple[str, int, str], ...]
+
+class StallSite:
+    """Aggregated stalls caught at one stack"""
+
+    __slots__ = ('stack', 'count', 'total', 'max')
+
+    def __init__(self, stack: str):
+        self.stack = stack
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+class LoopWatchdog:
+    """Measures event loop lag and finds the code that blocks the loop.
+
+    A heartbeat task sleeps for interval and records how late it wakes up.
+    A monitor thread watches the heartbeat; once it is threshold seconds
+    overdue, the thread captures the stack of the event loop thread, which
+    is whatever synchronous code is holding the loop. When the loop
+    recovers, the stall is logged with its duration and the number of
+    times that stack has blocked before.
+    """
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.05, max_sites: int = 50, stack_depth: int = 12):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_sites = max_sites
+        self.stack_depth = stack_depth
+        self.sites: Dict[StackKey, StallSite] = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = 0.0
+        self._beat = 0
+        self._captured_beat = -1
+        self._captured: Optional[Tuple[StackKey, str]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Start watching the running loop; call from inside it"""
+        if self.enabled:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._monitor, name='loop-watchdog', daemon=True)
+        self._thread.start()
+        logging.info(f"[Watchdog] Watching event loop lag (threshold {self.threshold * 1000:.0f} ms)")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stop.set()
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        logging.info("[Watchdog] Stopped")
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(now - expected, 0.0)
+            metrics.observe(LOOP_LAG_SECONDS, lag)
+            with self._lock:
+                self._last_beat = now
+                captured = self._captured if self._captured_beat == self._beat else None
+                self._beat += 1
+                self._captured = None
+            if lag >= self.threshold:
+                self._record_stall(lag, captured)
+
+    def _monitor(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                overdue = time.perf_counter() - self._last_beat
+                if overdue < self.threshold or self._captured_beat == self._beat:
+                    continue
+                self._captured_beat = self._beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            frames = traceback.extract_stack(frame)[-self.stack_depth:]
+            del frame
+            key = tuple((entry.filename, entry.lineno, entry.name) for entry in frames)
+            with self._lock:
+                self._captured = (key, ''.join(traceback.format_list(frames)))
+
+    def _record_stall(self, lag: float, captured: Optional[Tuple[StackKey, str]]):
+        metrics.inc(LOOP_STALLS_TOTAL)
+        if captured is None:
+            # Blocked for less than a monitor tick or the thread was starved too
+            logging.warning(f"[Watchdog] Event loop blocked for {lag:.2f}s (stack not captured)")
+            return
+        key, stack = captured
+        site = self.sites.get(key)
+        if site is None:
+            if len(self.sites) >= self.max_sites:
+                self.sites.pop(next(iter(self.sites)))
+            site = self.sites[key] = StallSite(stack)
+        site.add(lag)
+        logging.warning(
+            f"[Watchdog] Event loop blocked for {lag:.2f}s "
+            f"(this stack: {site.count} stalls, {site.total:.2f}s total, max {site.max:.2f}s):\n{stack}"
+        )
+
+    def top_sites(self, limit: int = 5) -> List[StallSite]:
+        """Stall sites with the most blocked time"""
+        return sorted(self.sites.values(), key=lambda site: site.total, reverse=True)[:limit]
+
+# Started with the bot unless WATCHDOG=0; !watchdog turns it on and off at runtime
+loop_watchdog = LoopWatchdog(threshold=float(os.getenv('LOOP_LAG_THRESHOLD', 0.25)))
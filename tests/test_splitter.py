@@ -0,0 +1,144 @@
+"""
+Property tests for shared/splitter.py on randomly generated replies.
+Run from the repository root: python -m pytest tests
+"""
+import os
+import sys
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared.splitter import FENCE, FENCE_CLOSE, LANGUAGE, MessageSplitter, split_message
+
+SEEDS = range(200)
+WORDS = ["the", "model", "streams", "tokens", "into", "discord", "a" * 90, "\n", "\n\n", "  ", "- item", "`x`", "``"]
+LANGUAGES = ["python", "js", "c++", "", "not a language", "x" * 30]
+
+def make_reply(rnd):
+    """Prose with fenced code blocks, long unbroken words and, sometimes, an unclosed block at the end"""
+    parts = []
+    for _ in range(rnd.randint(0, 120)):
+        roll = rnd.random()
+        if roll < 0.06:
+            lines = "".join(f"    value_{i} = compute({i})\n" for i in range(rnd.randint(0, 25)))
+            parts.append(f"{FENCE}{rnd.choice(LANGUAGES)}\n{lines}{FENCE}\n")
+        elif roll < 0.08:
+            parts.append(rnd.choice(["x" * rnd.randint(50, 400), " " * rnd.randint(50, 400)]))
+        else:
+            word = rnd.choice(WORDS)
+            parts.append(word if word.isspace() else word + " ")
+    if rnd.random() < 0.1:
+        parts.append(f"{FENCE}{rnd.choice(LANGUAGES)}\nunterminated = True\n")
+    return "".join(parts)
+
+def make_splitter_args(rnd):
+    prefix = rnd.choice(["", "[Model] ", "**Persona**: "])
+    return prefix, rnd.randint(60, 400)
+
+def fence_offsets(text):
+    """Offsets of code fences, found the way the splitter finds them"""
+    offsets = []
+    position = text.find(FENCE)
+    while position != -1:
+        offsets.append(position)
+        position = text.find(FENCE, position + len(FENCE))
+    return offsets
+
+def open_language(text, fences, position):
+    """Language of the code block open at position of text, or None outside a block"""
+    language = None
+    for fence in fences:
+        if fence >= position:
+            break
+        if language is None:
+            line_end = text.find("\n", fence)
+            language = text[fence + len(FENCE):line_end] if line_end != -1 else ""
+            if not LANGUAGE.match(language):
+                language = ""
+        else:
+            language = None
+    return language
+
+def next_positions(text, fences, end):
+    """Where the next page may resume after a page ending at end: a soft break drops one
+    newline or space, and outside code blocks the whitespace after it too"""
+    if open_language(text, fences, end) is not None:
+        return [end, end + 1] if text[end:end + 1] in ("\n", " ") else [end]
+    resume = end
+    while resume < len(text) and text[resume].isspace():
+        resume += 1
+    return [end] if resume == end else [end, resume]
+
+def reconstructs(text, pages, prefix, position=0):
+    """Whether pages are text with the prefix added, code blocks closed and reopened
+    across page breaks, and only whitespace dropped at the breaks"""
+    if not pages:
+        return position == len(text)
+    fences = fence_offsets(text)
+    page = pages[0]
+    if not page.startswith(prefix):
+        return False
+    body = page[len(prefix):]
+    language = open_language(text, fences, position)
+    if language is not None:
+        header = f"{FENCE}{language}\n"
+        if not body.startswith(header):
+            return False
+        body = body[len(header):]
+    candidates = [(body, False)]
+    if body.endswith(FENCE_CLOSE):
+        candidates.append((body[:-len(FENCE_CLOSE)], True))
+    for candidate, closed_by_splitter in candidates:
+        end = position + len(candidate)
+        if not text.startswith(candidate, position):
+            continue
+        if (open_language(text, fences, end) is not None) != closed_by_splitter:
+            continue
+        if any(reconstructs(text, pages[1:], prefix, resume) for resume in next_positions(text, fences, end)):
+            return True
+    return False
+
+def stream(text, prefix, limit, rnd):
+    """Pages of text fed to a MessageSplitter in token-sized chunks"""
+    splitter = MessageSplitter(prefix, limit)
+    pages = []
+    position = 0
+    while position < len(text):
+        size = rnd.randint(1, 12)
+        pages.extend(splitter.feed(text[position:position + size]))
+        position += size
+    pages.append(splitter.finish())
+    return pages
+
+def check_pages(text, pages, prefix, limit):
+    for page in pages:
+        assert len(page) <= limit, page
+        assert len(fence_offsets(page)) % 2 == 0, page
+    assert reconstructs(text, pages, prefix)
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_split_message(seed):
+    rnd = random.Random(seed)
+    text = make_reply(rnd)
+    prefix, limit = make_splitter_args(rnd)
+    check_pages(text, split_message(text, prefix, limit), prefix, limit)
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_streamed_chunks(seed):
+    rnd = random.Random(seed)
+    text = make_reply(rnd)
+    prefix, limit = make_splitter_args(rnd)
+    check_pages(text, stream(text, prefix, limit, rnd), prefix, limit)
+
+def test_code_block_reopened_with_language():
+    text = f"{FENCE}python\n" + "".join(f"line_{i} = {i}\n" for i in range(40)) + FENCE
+    pages = split_message(text, limit=100)
+    assert len(pages) > 1
+    for page in pages[1:]:
+        assert page.startswith(f"{FENCE}python\n")
+    check_pages(text, pages, "", 100)
+
+def test_short_message_is_one_page():
+    assert split_message("hello", "[Bot] ") == ["[Bot] hello"]
@@ -1,22 +1,38 @@
 """
 Web dashboard for SplinterTree bot with configuration validation.
+
+The dashboard is an ASGI app served by Hypercorn in the same process and
+event loop as the Discord bot, which it starts when serving begins:
+
+    python web.py                 # validates configuration first
+    hypercorn web:app --bind 0.0.0.0:5000
 """
-from flask import Flask, render_template_string, request, redirect, url_for, jsonify, session, send_from_directory
+from quart import Quart, Response, render_template, render_template_string, request, redirect, url_for, jsonify, session, send_from_directory
+from hypercorn.asyncio import serve
+from hypercorn.config import Config as HypercornConfig
 import os
 import sqlite3
 import json
+import gzip
+import time
 import logging
 from datetime import datetime
 import pytz
 from functools import wraps
 from contextlib import contextmanager
 import secrets
+import uuid
 from pathlib import Path
 import asyncio
-import discord
+import signal
 import sys
 import requests
-from bot import SplinterTreeBot, setup_cogs
+import config
+from bot import bot
+from shared.metrics import metrics
+from shared.tracing import PROFILE_DIR, tracer
+from shared.log_explorer import log_explorer, EXPORT_FORMATS
+from shared.rollups import rollups
 
 def validate_config():
     """Validate configuration before starting"""
@@ -101,7 +117,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
+# Templates load from static/ and are compiled once; the loader recompiles a template when its mtime changes
+app = Quart(__name__, template_folder='static')
+app.config['TEMPLATES_AUTO_RELOAD'] = True
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 300  # Static files are then revalidated with ETag/Last-Modified
 app.secret_key = os.environ.get('SECRET_KEY', secrets.token_hex(32))
 app.config['SESSION_COOKIE_SECURE'] = True
 app.config['SESSION_COOKIE_HTTPONLY'] = True
@@ -110,25 +129,20 @@ app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 # Authentication credentials
 ADMIN_USERNAME = os.environ.get('ADMIN_USERNAME', 'admin')
 ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD', 'change_me_in_production')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Bearer token for /metrics scrapers; unset limits it to logged-in sessions
+
+# Dashboards poll /api/stats; the SQLite queries behind it run at most once per STATS_TTL seconds
+STATS_TTL = float(os.environ.get('DASHBOARD_STATS_TTL', 5))
+
+# Responses gzipped for clients that accept it; event streams are never buffered for compression
+COMPRESSIBLE_TYPES = {'text/html', 'text/css', 'text/plain', 'application/javascript', 'application/json', 'image/svg+xml'}
+MIN_COMPRESS_BYTES = 500
 
 # Paths
 DB_PATH = 'databases/interaction_logs.db'
 CONFIG_PATH = 'bot_config.json'
 STATUS_PATH = 'bot_status.txt'
 
-# Initialize bot
-intents = discord.Intents.default()
-intents.messages = True
-intents.message_content = True
-intents.typing = True
-intents.dm_messages = True
-intents.guilds = True
-intents.members = True
-
-bot = SplinterTreeBot(command_prefix='!', help_command=None, intents=intents)
-loop = asyncio.new_event_loop()
-asyncio.set_event_loop(loop)
-
 # Status configuration
 STATUS_CONFIG = {
     'manual_status': None,
@@ -193,17 +207,8 @@ def get_db_stats():
             cursor.execute("SELECT COUNT(*) FROM messages WHERE timestamp >= ?", (today,))
             messages_today = cursor.fetchone()[0]
             
-            # Get most active model
-            cursor.execute(""" 
-                SELECT persona_name, COUNT(*) as count 
-                FROM messages 
-                WHERE is_assistant = 1 AND persona_name IS NOT NULL 
-                GROUP BY persona_name 
-                ORDER BY count DESC 
-                LIMIT 1 
-            """)
-            result = cursor.fetchone()
-            most_active_model = result[0] if result else "N/A"
+            # Get most active model from the rollups rather than grouping every message
+            most_active_model = rollups.most_active_persona() or "N/A"
             
             # Get recent activity
             cursor.execute(""" 
@@ -250,98 +255,189 @@ def get_db_stats():
             'current_time': datetime.now(pytz.UTC).strftime('%Y-%m-%d %H:%M:%S UTC')
         }
 
+_stats_cache = {'stats': None, 'expires': 0.0}
+_stats_lock = asyncio.Lock()
+
+async def cached_db_stats():
+    """get_db_stats from a worker thread, reused for STATS_TTL seconds; concurrent misses share one query"""
+    async with _stats_lock:
+        if _stats_cache['stats'] is None or time.monotonic() >= _stats_cache['expires']:
+            _stats_cache['stats'] = await asyncio.to_thread(get_db_stats)
+            _stats_cache['expires'] = time.monotonic() + STATS_TTL
+        return _stats_cache['stats']
+
 def login_required(f):
     """Decorator for routes that require authentication"""
     @wraps(f)
-    def decorated_function(*args, **kwargs):
+    async def decorated_function(*args, **kwargs):
         if 'logged_in' not in session:
             return redirect(url_for('login'))
-        return f(*args, **kwargs)
+        return await f(*args, **kwargs)
     return decorated_function
 
+async def run_on_bot_loop(coro):
+    """Await coro on the bot's event loop.
+
+    When the dashboard is served from the bot's loop (python web.py or
+    hypercorn web:app) this is a plain await. If the app is mounted on a
+    server running another loop, the coroutine is submitted to the bot's
+    loop thread-safely and awaited without blocking the server's loop.
+    """
+    bot_loop = bot.loop
+    if bot_loop is asyncio.get_running_loop():
+        return await coro
+    if not isinstance(bot_loop, asyncio.AbstractEventLoop) or not bot_loop.is_running():
+        coro.close()
+        raise RuntimeError("Bot is not running")
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, bot_loop))
+
+async def stream_on_bot_loop(agen):
+    """Iterate an async generator on the bot's event loop, one item per round trip"""
+    try:
+        while True:
+            try:
+                item = await run_on_bot_loop(agen.__anext__())
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        await run_on_bot_loop(agen.aclose())
+
+class DashboardUser:
+    """Author of dashboard chat messages"""
+    id = 0
+    bot = False
+    display_name = ADMIN_USERNAME
+
+class DashboardChannel:
+    """Channel of dashboard chat messages; replies go back over HTTP instead"""
+    id = 'dashboard'
+    name = 'dashboard'
+
+    async def typing(self):
+        pass
+
+class DashboardMessage:
+    """The parts of a discord.Message that UnifiedCog reads, for a message sent from the dashboard"""
+
+    def __init__(self, content):
+        self.id = f"dashboard-{uuid.uuid4().hex}"
+        self.content = content
+        self.attachments = []
+        self.embeds = []
+        self.author = DashboardUser()
+        self.guild = None
+        self.channel = DashboardChannel()
+
+async def chat_reply(unified_cog, message):
+    """Route a dashboard message and generate the reply.
+
+    Yields ('route', {'model', 'trace_id'}) and then ('text', chunk) per
+    streamed chunk. Closing the generator closes the upstream stream.
+    """
+    trace_id = tracer.begin()
+    model_config = await unified_cog.determine_route(message)
+    yield 'route', {'model': model_config['name'], 'trace_id': trace_id}
+    chunks = unified_cog.generate_response(message, model_config)
+    try:
+        async for chunk in chunks:
+            yield 'text', chunk
+    finally:
+        await chunks.aclose()
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode('utf-8')
+
+async def sse_events(replies):
+    """chat_reply items as server-sent events.
+
+    The server pulls each event only once the previous one has been written
+    to the client, so a slow reader slows the upstream stream rather than
+    filling a buffer. If the client disconnects, Quart cancels the response
+    and closing replies cancels the upstream request.
+    """
+    yield b": connected\n\n"  # Send the headers while the message is routed
+    try:
+        async for kind, value in replies:
+            yield sse_event(kind, value if kind == 'route' else {'text': value})
+        yield sse_event('done', {})
+    except Exception as e:
+        logger.error(f"Error streaming chat response: {str(e)}")
+        yield sse_event('error', {'error': str(e)})
+    finally:
+        await replies.aclose()
+
 @app.route('/favicon.ico')
-def favicon():
+async def favicon():
     """Serve favicon"""
-    return send_from_directory('static', 'favicon.png', mimetype='image/png')
+    return await send_from_directory('static', 'favicon.png', mimetype='image/png')
 
 @app.route('/login', methods=['GET', 'POST'])
-def login():
+async def login():
     """Handle login"""
     if request.method == 'POST':
-        username = request.form.get('username')
-        password = request.form.get('password')
+        form = await request.form
+        username = form.get('username')
+        password = form.get('password')
         
         if username == ADMIN_USERNAME and password == ADMIN_PASSWORD:
             session['logged_in'] = True
             session.permanent = True
             return redirect(url_for('dashboard'))
         
-        return render_template_string(LOGIN_TEMPLATE, error="Invalid credentials")
+        return await render_template_string(LOGIN_TEMPLATE, error="Invalid credentials")
     
-    return render_template_string(LOGIN_TEMPLATE)
+    return await render_template_string(LOGIN_TEMPLATE)
 
 @app.route('/logout')
-def logout():
+async def logout():
     """Handle logout"""
     session.pop('logged_in', None)
     return redirect(url_for('login'))
 
 @app.route('/')
 @login_required
-def dashboard():
+async def dashboard():
     """Render the dashboard"""
     try:
-        stats = get_db_stats()
-        return render_template_string(open('static/dashboard.html').read(), 
-                                    stats=stats,
-                                    recent_activity=stats['recent_activity'],
-                                    current_time=stats['current_time'],
-                                    show_uptime=STATUS_CONFIG['show_uptime'],
-                                    manual_status=STATUS_CONFIG['manual_status'])
+        # Stats are fetched by the page from /api/stats, so rendering never waits on SQLite
+        return await render_template('dashboard.html',
+                                     show_uptime=STATUS_CONFIG['show_uptime'],
+                                     manual_status=STATUS_CONFIG['manual_status'])
     except Exception as e:
         logger.error(f"Error rendering dashboard: {e}")
         return "Internal Server Error", 500
 
 @app.route('/api/chat', methods=['POST'])
 @login_required
-def chat():
-    """Handle chat messages"""
+async def chat():
+    """Handle chat messages; streams the reply as server-sent events if asked to"""
     try:
-        message = request.json.get('message')
+        data = await request.get_json()
+        message = data.get('message') if data else None
         if not message:
             return jsonify({'error': 'No message provided'}), 400
 
-        # Get unified cog
+        # Get unified cog; cogs load once the bot has connected
         unified_cog = bot.get_cog('UnifiedCog')
         if not unified_cog:
-            return jsonify({'error': 'UnifiedCog not available'}), 500
-
-        # Run async code in the event loop
-        async def process_message():
-            # Create a mock message object
-            class MockMessage:
-                def __init__(self, content):
-                    self.content = content
-                    self.attachments = []
-                    self.embeds = []
-                    self.author = None
-                    self.guild = None
-                    self.channel = None
-
-            mock_msg = MockMessage(message)
-            
-            # Determine model and generate response
-            model_config = await unified_cog.determine_route(mock_msg)
-            response = ""
-            async for chunk in unified_cog.generate_response(mock_msg, model_config):
-                response += chunk
-
-            return {
-                'response': response,
-                'model': model_config['name']
-            }
-
-        result = loop.run_until_complete(process_message())
+            return jsonify({'error': 'UnifiedCog not available'}), 503
+
+        # Requests are coroutines on the bot's loop, so concurrent chats don't block each other
+        replies = stream_on_bot_loop(chat_reply(unified_cog, DashboardMessage(message)))
+
+        if data.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+            response = Response(sse_events(replies), mimetype='text/event-stream',
+                                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+            response.timeout = None  # Long completions outlast Quart's default response timeout
+            return response
+
+        result = {'response': ''}
+        async for kind, value in replies:
+            if kind == 'route':
+                result.update(value)
+            else:
+                result['response'] += value
         return jsonify(result)
 
     except Exception as e:
@@ -350,20 +446,128 @@ def chat():
 
 @app.route('/api/stats')
 @login_required
-def api_stats():
+async def api_stats():
     """API endpoint for stats"""
     try:
-        return jsonify(get_db_stats())
+        response = jsonify(await cached_db_stats())
+        response.headers['Cache-Control'] = f"private, max-age={int(STATS_TTL)}"
+        return response
     except Exception as e:
         logger.error(f"Error getting API stats: {e}")
         return jsonify({'error': 'Internal Server Error'}), 500
 
+@app.route('/api/logs')
+@login_required
+async def api_logs():
+    """Logged API calls, newest first; filter by guild_id, user_id, model, status_code, trace_id,
+    since and until, and page with before=<next>"""
+    try:
+        return jsonify(await asyncio.to_thread(log_explorer.logs, request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/logs/<int:log_id>')
+@login_required
+async def api_log(log_id):
+    """One logged API call with its decoded request and response"""
+    log = await asyncio.to_thread(log_explorer.log, log_id)
+    if log is None:
+        return jsonify({'error': 'Log not found'}), 404
+    return jsonify(log)
+
+@app.route('/api/messages')
+@login_required
+async def api_messages():
+    """Stored messages, newest first; filter by guild_id, channel_id, user_id, persona, is_assistant,
+    since and until, search with q, and page with before=<next>"""
+    try:
+        return jsonify(await asyncio.to_thread(log_explorer.messages, request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/api/<any(logs, messages):table>/export')
+@login_required
+async def api_export(table):
+    """Every row matching the explorer filters as CSV or JSON Lines (format=csv|jsonl).
+    payloads=1 adds each log's tags, request and response."""
+    fmt = request.args.get('format', 'jsonl')
+    try:
+        rows = log_explorer.export(table, request.args, fmt, payloads=request.args.get('payloads') == '1')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    response = Response(rows, mimetype=EXPORT_FORMATS[fmt],
+                        headers={'Content-Disposition': f'attachment; filename="{table}.{fmt}"'})
+    response.timeout = None  # Large exports outlast Quart's default response timeout
+    return response
+
+@app.route('/api/series')
+@login_required
+async def api_series():
+    """Chart-ready time series from the rollups: metric (count, errors, error_rate, tokens,
+    latency_p50/p95/p99, first_token_p50/p95/p99...) per model, guild_id or persona"""
+    args = request.args
+    try:
+        top = int(args.get('top', 10))
+        return jsonify(await asyncio.to_thread(
+            rollups.series, args.get('metric', 'count'), args.get('by', 'model'), args.get('source'),
+            args.get('since'), args.get('until'), args.get('resolution'), top
+        ))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@app.route('/metrics')
+async def prometheus_metrics():
+    """Bot latency and throughput metrics in the Prometheus text format"""
+    if METRICS_TOKEN:
+        authorized = secrets.compare_digest(
+            request.headers.get('Authorization', '').encode(), f"Bearer {METRICS_TOKEN}".encode()
+        )
+    else:
+        authorized = 'logged_in' in session
+    if not authorized:
+        return "Unauthorized", 401
+    # The registry lives in this process, so scrapes see current values
+    return metrics.render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/api/profiles')
+@login_required
+async def list_profiles():
+    """Sampled request profiles saved by the bot, newest first"""
+    profiles = await asyncio.to_thread(read_profiles)
+    for trace in profiles:
+        trace['download'] = url_for('download_profile', filename=trace.pop('file'))
+    return jsonify(profiles)
+
+def read_profiles():
+    """Span summaries of the saved profiles, with the name of each .prof file"""
+    profiles = []
+    try:
+        names = sorted((name for name in os.listdir(PROFILE_DIR) if name.endswith('.json')), reverse=True)
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        try:
+            with open(os.path.join(PROFILE_DIR, name), 'r', encoding='utf-8') as f:
+                trace = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading profile {name}: {e}")
+            continue
+        trace['file'] = name[:-len('.json')] + '.prof'
+        profiles.append(trace)
+    return profiles
+
+@app.route('/profiles/<path:filename>')
+@login_required
+async def download_profile(filename):
+    """Download a cProfile dump (open with pstats or snakeviz)"""
+    return await send_from_directory(PROFILE_DIR, filename, as_attachment=True)
+
 @app.route('/set_status', methods=['POST'])
 @login_required
-def set_status():
+async def set_status():
     """Set the bot's status"""
     try:
-        status = request.form.get('status')
+        status = (await request.form).get('status')
         if not status:
             logger.error("No status provided")
             return "No status provided", 400
@@ -384,10 +588,10 @@ def set_status():
 
 @app.route('/api/toggle_uptime', methods=['POST'])
 @login_required
-def toggle_uptime():
+async def toggle_uptime():
     """Toggle uptime status display"""
     try:
-        data = request.get_json()
+        data = await request.get_json()
         STATUS_CONFIG['show_uptime'] = data.get('enabled', True)
         save_status_config()
         return jsonify({'success': True})
@@ -397,7 +601,7 @@ def toggle_uptime():
 
 @app.route('/api/clear_status', methods=['POST'])
 @login_required
-def clear_status():
+async def clear_status():
     """Clear manual status and return to uptime display"""
     try:
         STATUS_CONFIG['manual_status'] = None
@@ -412,14 +616,68 @@ def clear_status():
         logger.error(f"Error clearing status: {e}")
         return jsonify({'error': str(e)}), 500
 
-async def init_bot():
-    """Initialize the bot and load cogs"""
-    try:
-        await setup_cogs(bot)
-        logger.info("Bot initialized and cogs loaded")
-    except Exception as e:
-        logger.error(f"Failed to initialize bot: {e}")
-        raise
+@app.after_request
+async def compress_response(response):
+    """Gzip text responses for clients that accept it"""
+    if (response.status_code != 200 or response.mimetype not in COMPRESSIBLE_TYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.headers.get('Accept-Encoding', ''):
+        return response
+    body = await response.get_data()
+    if len(body) < MIN_COMPRESS_BYTES:
+        return response
+    response.set_data(gzip.compress(body, 6))
+    response.headers['Content-Encoding'] = 'gzip'
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # The encoded bytes differ from the file the strong ETag describes
+        response.set_etag(etag, weak=True)
+    return response
+
+@app.before_serving
+async def compile_templates():
+    """Compile the dashboard template before the first page load"""
+    app.jinja_env.get_template('dashboard.html')
+
+@app.before_serving
+async def start_bot():
+    """Start the Discord bot on the loop serving the dashboard"""
+    load_status_config()
+    app.bot_task = asyncio.create_task(bot.start(config.DISCORD_TOKEN))
+    app.bot_task.add_done_callback(on_bot_exit)
+
+def on_bot_exit(task):
+    """Shut the server down if the bot stops while it is still serving, so the process exits with it"""
+    if app.stop_serving.is_set():
+        return
+    if not task.cancelled() and task.exception():
+        logger.error(f"Bot stopped: {task.exception()}")
+    else:
+        logger.error("Bot stopped unexpectedly")
+    app.bot_failed = True
+    app.stop_serving.set()
+
+@app.after_serving
+async def stop_bot():
+    """Disconnect the bot when the server shuts down"""
+    if not bot.is_closed():
+        await bot.close()
+    await asyncio.gather(app.bot_task, return_exceptions=True)
+
+async def serve_dashboard(hypercorn_config):
+    """Serve until SIGINT or SIGTERM, or until the bot stops"""
+    app.stop_serving = asyncio.Event()
+    app.bot_failed = False
+    # Hypercorn only installs its own signal handlers when it is given no shutdown trigger
+    loop = asyncio.get_running_loop()
+    for signal_name in ('SIGINT', 'SIGTERM'):
+        try:
+            loop.add_signal_handler(getattr(signal, signal_name), app.stop_serving.set)
+        except NotImplementedError:
+            signal.signal(getattr(signal, signal_name), lambda *_: loop.call_soon_threadsafe(app.stop_serving.set))
+    await serve(app, hypercorn_config, shutdown_trigger=app.stop_serving.wait)
 
 def main():
     """Main entry point with validation"""
@@ -427,18 +685,17 @@ def main():
         # Validate configuration before starting
         validate_config()
         
-        # Load status configuration
-        load_status_config()
-        
-        # Initialize bot and load cogs
-        loop.run_until_complete(init_bot())
-        
-        # Start the Flask app
-        port = int(os.environ.get('PORT', 5000))
-        app.run(host='0.0.0.0', port=port)
+        # Serve the dashboard; the bot starts in the same event loop
+        hypercorn_config = HypercornConfig()
+        hypercorn_config.bind = [f"0.0.0.0:{int(os.environ.get('PORT', 5000))}"]
+        asyncio.run(serve_dashboard(hypercorn_config))
     except Exception as e:
         logger.error(f"Failed to start server: {e}")
         sys.exit(1)
 
+    if app.bot_failed:
+        # Exit non-zero so the platform restarts the process, and the bot with it
+        sys.exit(1)
+
 if __name__ == '__main__':
     main()